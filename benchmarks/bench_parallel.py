@@ -0,0 +1,100 @@
+""" Compare in process narrow phase against `ParallelNarrowPhase` for a
+    growing number of candidate pairs to find the point, where spreading
+    the tests over processes starts to pay off. Pool is started before
+    timing, as a game would keep it for the whole session. Pass the
+    crossover point as `min_pairs` - by default `ParallelNarrowPhase` tests
+    all pairs in process.
+
+    Run as:
+        python benchmarks/bench_parallel.py [processes]
+"""
+import multiprocessing
+import random
+import sys
+import time
+
+from planar import Vec2
+from gengine.collision import Circle, Polygon, ParallelNarrowPhase, \
+    intersects
+
+WORLD_SIZE = 1000
+PAIR_COUNTS = [1000, 5000, 10000, 20000, 50000, 100000]
+REPEAT = 3
+
+
+def make_shape(rnd):
+    x = rnd.uniform(0, WORLD_SIZE)
+    y = rnd.uniform(0, WORLD_SIZE)
+    if rnd.random() < 0.5:
+        return Circle(Vec2(x, y), rnd.uniform(1, 5))
+    size = rnd.uniform(1, 5)
+    return Polygon([
+        Vec2(x - size, y - size), Vec2(x - size, y + size),
+        Vec2(x + size, y), Vec2(x, y - size * 2)])
+
+
+def make_pairs(count, seed=1):
+    rnd = random.Random(seed)
+    pairs = []
+    for _ in range(count):
+        shape = make_shape(rnd)
+        # Candidates of a broad phase are close to each other
+        pairs.append((shape, _near(make_shape(rnd), shape, rnd)))
+    return pairs
+
+
+def _near(shape, to, rnd):
+    center = to.bounding_box.center
+    offset = center - shape.bounding_box.center + Vec2(
+        rnd.uniform(-6, 6), rnd.uniform(-6, 6))
+    if isinstance(shape, Circle):
+        return Circle(shape.center + offset, shape.radius)
+    return Polygon([point + offset for point in shape])
+
+
+def best_time(func, *args):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(*args)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def in_process(pairs):
+    return [intersects(shape, other) for shape, other in pairs]
+
+
+def main():
+    if len(sys.argv) > 1:
+        processes = int(sys.argv[1])
+    else:
+        processes = multiprocessing.cpu_count()
+    if processes < 2:
+        # A single process always tests pairs in process, nothing to compare
+        print("Needs at least 2 processes, got {}".format(processes))
+        return
+    with ParallelNarrowPhase(processes, min_pairs=0) as executor:
+        # Start the pool
+        executor.intersects(make_pairs(100))
+        crossover = None
+        for count in PAIR_COUNTS:
+            pairs = make_pairs(count)
+            assert executor.intersects(pairs) == in_process(pairs)
+            serial = best_time(in_process, pairs)
+            parallel = best_time(executor.intersects, pairs)
+            if crossover is None and parallel < serial:
+                crossover = count
+            print("{:>7} pairs: in process={:<8.3f} parallel={:<8.3f} "
+                  "speedup={:.2f}".format(
+                      count, serial, parallel, serial / parallel))
+    if crossover is None:
+        print("Parallel is not faster up to {} pairs".format(PAIR_COUNTS[-1]))
+    else:
+        print("Parallel is faster from {} pairs".format(crossover))
+
+
+if __name__ == "__main__":
+    main()
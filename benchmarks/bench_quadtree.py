@@ -0,0 +1,148 @@
+""" Compare memory and query speed of QuadTree node backends and of range
+    queries through the occupancy grid against the recursive node walk.
+    `entries` shows how many times objects are stored in nodes - loose mode
+    keeps each once and inserts faster, but has to visit overlapping loose
+    bounds of siblings and answers fewer queries per second than `objects`.
+
+    Both node walks skip subtrees outside of the query, so the difference
+    between `objects` and `flat` comes from the array layout alone - flat
+    nodes take less than half the memory and answer about twice as many
+    queries per second.
+
+    The occupancy sweep compares nodes alone against nodes with the
+    occupancy grid at growing max levels, including removals, that do big
+    integer work over the grid. Up to level 8 the grid answers two to three
+    times as many queries, at the cost of about 1.4 times the memory and
+    slower removals. At level 9 it takes 1.5 times the memory and answers
+    fewer than half the queries of the nodes alone, so `QuadTree` rejects
+    `occupancy` above `MAX_OCCUPANCY_LEVEL`.
+
+    Run as:
+        python benchmarks/bench_quadtree.py
+"""
+import random
+import time
+import tracemalloc
+
+from planar import Vec2
+from gengine.collision import QuadTree, Circle, BoundingBox, quadtree
+
+WORLD_SIZE = 1000
+MAX_LEVEL = 7
+OBJECT_COUNT = 5000
+QUERY_COUNT = 5000
+SWEEP_LEVELS = range(5, 10)
+SWEEP_QUERY_COUNT = 1000
+
+
+def make_shapes(count, seed=1):
+    rnd = random.Random(seed)
+    half = WORLD_SIZE / 2
+    return [
+        Circle(Vec2(rnd.uniform(-half, half), rnd.uniform(-half, half)),
+               rnd.choice([1, 2, 5, 20]))
+        for _ in range(count)]
+
+
+def make_queries(count, seed=2):
+    rnd = random.Random(seed)
+    half = WORLD_SIZE / 2
+    return [
+        BoundingBox.from_center(
+            Vec2(rnd.uniform(-half, half), rnd.uniform(-half, half)), 40, 40)
+        for _ in range(count)]
+
+
+def count_nodes(tree):
+    root = tree._root
+    if hasattr(root, "node_count"):
+        return root.node_count
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.nodes)
+    return count
+
+
+def count_entries(tree):
+    return sum(1 for _ in tree._root.get_all_objects())
+
+
+def bench(name, shapes, queries, **options):
+    tracemalloc.start()
+    start = time.perf_counter()
+    tree = QuadTree(
+        center=Vec2(0, 0), size=WORLD_SIZE, max_level=MAX_LEVEL, **options)
+    for i, shape in enumerate(shapes):
+        tree.insert(shape, i)
+    insert_time = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    found = 0
+    for query in queries:
+        found += len(tree.query(query))
+    query_time = time.perf_counter() - start
+
+    nodes = count_nodes(tree)
+    print("{:>9}: nodes={:<7} entries={:<7} bytes={:<9} bytes/node={:<8.1f} "
+          "inserts/s={:<10.0f} queries/s={:<10.0f} found={}".format(
+              name, nodes, count_entries(tree), memory, memory / nodes,
+              len(shapes) / insert_time, len(queries) / query_time, found))
+
+
+def bench_removals(name, level, shapes, queries, **options):
+    tracemalloc.start()
+    tree = QuadTree(
+        center=Vec2(0, 0), size=WORLD_SIZE, max_level=level, **options)
+    for i, shape in enumerate(shapes):
+        tree.insert(shape, i)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for query in queries:
+        tree.query(query)
+    query_time = time.perf_counter() - start
+
+    removed = range(0, len(shapes), 5)
+    start = time.perf_counter()
+    for i in removed:
+        tree.remove(i)
+    remove_time = time.perf_counter() - start
+
+    print("{:>9}: level={:<2} bytes={:<10} queries/s={:<10.0f} "
+          "removals/s={:.0f}".format(
+              name, level, memory, len(queries) / query_time,
+              len(removed) / remove_time))
+
+
+def sweep_occupancy(shapes, queries):
+    # Measure one level above the supported ones, to show where the grid
+    # stops paying off
+    limit = quadtree.MAX_OCCUPANCY_LEVEL
+    quadtree.MAX_OCCUPANCY_LEVEL = max(SWEEP_LEVELS)
+    try:
+        for level in SWEEP_LEVELS:
+            bench_removals("objects", level, shapes, queries)
+            bench_removals(
+                "occupancy", level, shapes, queries, occupancy=True)
+    finally:
+        quadtree.MAX_OCCUPANCY_LEVEL = limit
+
+
+def main():
+    shapes = make_shapes(OBJECT_COUNT)
+    queries = make_queries(QUERY_COUNT)
+    bench("objects", shapes, queries)
+    bench("flat", shapes, queries, flat=True)
+    bench("occupancy", shapes, queries, occupancy=True)
+    bench("loose", shapes, queries, looseness=2)
+    sweep_occupancy(shapes, queries[:SWEEP_QUERY_COUNT])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+""" Compare memory taken by planar based shapes against compact slotted
+    ones, both alone and with a QuadTree on top of them. Shapes get their
+    bounding box computed, as any index needs it.
+
+    Run as:
+        python benchmarks/bench_shapes.py
+"""
+import random
+import tracemalloc
+
+from planar import Vec2
+from gengine.collision import (
+    QuadTree, Circle, BoundingBox, CompactCircle, CompactBox)
+
+WORLD_SIZE = 1000
+MAX_LEVEL = 7
+ENTITY_COUNT = 100000
+
+
+def make_points(count, seed=1):
+    rnd = random.Random(seed)
+    half = WORLD_SIZE / 2
+    return [
+        (rnd.uniform(-half, half), rnd.uniform(-half, half))
+        for _ in range(count)]
+
+
+def make_circles(points):
+    shapes = [Circle(Vec2(x, y), 2) for x, y in points]
+    for shape in shapes:
+        shape.bounding_box
+    return shapes
+
+
+def make_compact_circles(points):
+    return [CompactCircle((x, y), 2) for x, y in points]
+
+
+def make_boxes(points):
+    return [
+        BoundingBox.from_center(Vec2(x, y), 4, 4) for x, y in points]
+
+
+def make_compact_boxes(points):
+    return [CompactBox.from_center((x, y), 4, 4) for x, y in points]
+
+
+def bench(name, factory, points):
+    tracemalloc.start()
+    shapes = factory(points)
+    shapes_memory, _ = tracemalloc.get_traced_memory()
+    tree = QuadTree(center=Vec2(0, 0), size=WORLD_SIZE, max_level=MAX_LEVEL)
+    for i, shape in enumerate(shapes):
+        tree.insert(shape, i)
+    total_memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("{:>15}: shape bytes/entity={:<8.1f} "
+          "with QuadTree bytes/entity={:<8.1f}".format(
+              name, shapes_memory / len(shapes),
+              total_memory / len(shapes)))
+
+
+def main():
+    points = make_points(ENTITY_COUNT)
+    bench("Circle", make_circles, points)
+    bench("CompactCircle", make_compact_circles, points)
+    bench("BoundingBox", make_boxes, points)
+    bench("CompactBox", make_compact_boxes, points)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,38 @@
-from .shapes import Circle, BoundingBox, Polygon, Shape
+from .shapes import Circle, BoundingBox, Polygon, Shape, CompactCircle, \
+    CompactBox, TransformedPolygon
+from .moving_shapes import MovingCircle
 from .intersection import intersects
+from .batch import intersects_many, intersects_pairs
 from .containment import contains
-from .quadtree import QuadTree
+from .gjk import closest_points, penetration
+from .toi import time_of_impact
+from .parallel import ParallelNarrowPhase
+from .quadtree import QuadTree, MASK_ALL
+from .spatial_hash import SpatialHashGrid
+from .broadphase import SweepAndPrune
+from .aabb_tree import AABBTree
 
 
 __all__ = [
     "Shape",
     "Circle",
+    "MovingCircle",
     "BoundingBox",
+    "CompactCircle",
+    "CompactBox",
     "intersects",
+    "intersects_many",
+    "intersects_pairs",
     "contains",
+    "closest_points",
+    "penetration",
+    "time_of_impact",
+    "ParallelNarrowPhase",
     "QuadTree",
-    "Polygon"
+    "MASK_ALL",
+    "SpatialHashGrid",
+    "SweepAndPrune",
+    "AABBTree",
+    "Polygon",
+    "TransformedPolygon",
     ]
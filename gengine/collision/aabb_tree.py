@@ -0,0 +1,264 @@
+from .intersection import intersects
+
+
+class _TreeNode:
+
+    __slots__ = [
+        "min_x", "min_y", "max_x", "max_y",
+        "parent", "left", "right", "height", "item"]
+
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.left = None
+        self.right = None
+        self.height = 0
+        self.item = None
+
+    @property
+    def is_leaf(self):
+        return self.left is None
+
+    def set_box(self, bbox):
+        self.min_x, self.min_y = bbox.min_point
+        self.max_x, self.max_y = bbox.max_point
+
+    def set_union(self, node, other):
+        self.min_x = min(node.min_x, other.min_x)
+        self.min_y = min(node.min_y, other.min_y)
+        self.max_x = max(node.max_x, other.max_x)
+        self.max_y = max(node.max_y, other.max_y)
+
+    def perimeter(self):
+        return 2 * ((self.max_x - self.min_x) + (self.max_y - self.min_y))
+
+    def union_perimeter(self, other):
+        return 2 * (
+            (max(self.max_x, other.max_x) - min(self.min_x, other.min_x)) +
+            (max(self.max_y, other.max_y) - min(self.min_y, other.min_y)))
+
+    def contains_box(self, bbox):
+        min_x, min_y = bbox.min_point
+        max_x, max_y = bbox.max_point
+        return (self.min_x <= min_x and self.max_x >= max_x and
+                self.min_y <= min_y and self.max_y >= max_y)
+
+    def overlaps(self, min_x, min_y, max_x, max_y):
+        return not (
+            self.min_x > max_x or self.max_x < min_x or
+            self.min_y > max_y or self.max_y < min_y)
+
+    def __repr__(self):
+        return "_TreeNode<({}, {}) - ({}, {}), height={}>".format(
+            self.min_x, self.min_y, self.max_x, self.max_y, self.height)
+
+
+class AABBTree:
+    """ Dynamic bounding volume hierarchy with no world bounds.
+
+        Each object is stored in a leaf with it's bbox inflated by `margin`
+        on every side, so moves, that keep the bbox inside of the inflated
+        one, do not touch the tree at all. Leaves are placed by perimeter
+        cost heuristic and the tree is kept balanced with rotations on the
+        way back to the root, same as Box2D's dynamic tree.
+    """
+
+    def __init__(self, *, margin=0):
+        self._margin = margin
+        self._root = None
+        self._leaves = {}
+
+    @property
+    def height(self):
+        if self._root is None:
+            return 0
+        return self._root.height
+
+    def _fat_box(self, shape):
+        bbox = shape.bounding_box
+        if self._margin:
+            bbox = bbox.inflate(self._margin * 2)
+        return bbox
+
+    # Tree structure
+
+    def _insert_leaf(self, leaf):
+        if self._root is None:
+            self._root = leaf
+            leaf.parent = None
+            return
+
+        # Find the best sibling for the new leaf
+        node = self._root
+        while not node.is_leaf:
+            combined = node.union_perimeter(leaf)
+            # Cost of creating a new parent for this node and the new leaf
+            cost = 2 * combined
+            # Minimum cost of pushing the leaf further down the tree
+            inheritance = 2 * (combined - node.perimeter())
+            costs = []
+            for child in (node.left, node.right):
+                child_cost = child.union_perimeter(leaf) + inheritance
+                if not child.is_leaf:
+                    child_cost -= child.perimeter()
+                costs.append(child_cost)
+            left_cost, right_cost = costs
+            if cost < left_cost and cost < right_cost:
+                break
+            node = node.left if left_cost < right_cost else node.right
+        sibling = node
+
+        # Create a new parent
+        old_parent = sibling.parent
+        new_parent = _TreeNode(old_parent)
+        new_parent.set_union(leaf, sibling)
+        new_parent.height = sibling.height + 1
+        new_parent.left = sibling
+        new_parent.right = leaf
+        sibling.parent = new_parent
+        leaf.parent = new_parent
+        if old_parent is None:
+            self._root = new_parent
+        elif old_parent.left is sibling:
+            old_parent.left = new_parent
+        else:
+            old_parent.right = new_parent
+
+        self._refit(leaf.parent)
+
+    def _remove_leaf(self, leaf):
+        if leaf is self._root:
+            self._root = None
+            return
+        parent = leaf.parent
+        grand_parent = parent.parent
+        sibling = parent.right if parent.left is leaf else parent.left
+        leaf.parent = None
+        if grand_parent is None:
+            self._root = sibling
+            sibling.parent = None
+            return
+        if grand_parent.left is parent:
+            grand_parent.left = sibling
+        else:
+            grand_parent.right = sibling
+        sibling.parent = grand_parent
+        self._refit(grand_parent)
+
+    def _refit(self, node):
+        """ Fix heights and boxes from `node` up to the root, rebalancing
+            on the way.
+        """
+        while node is not None:
+            node = self._balance(node)
+            left, right = node.left, node.right
+            node.height = 1 + max(left.height, right.height)
+            node.set_union(left, right)
+            node = node.parent
+
+    def _replace_child(self, node, new_node):
+        parent = new_node.parent
+        if parent is None:
+            self._root = new_node
+        elif parent.left is node:
+            parent.left = new_node
+        else:
+            parent.right = new_node
+
+    def _balance(self, a):
+        """ Rotate `a` if it's children heights differ by more than 1.
+            Returns the node, that took `a`'s place.
+        """
+        if a.is_leaf or a.height < 2:
+            return a
+        b, c = a.left, a.right
+        balance = c.height - b.height
+
+        # Rotate C up
+        if balance > 1:
+            f, g = c.left, c.right
+            c.left = a
+            c.parent = a.parent
+            a.parent = c
+            self._replace_child(a, c)
+            if f.height < g.height:
+                f, g = g, f
+            # `f` is the higher one, it stays with C
+            c.right = f
+            a.right = g
+            g.parent = a
+            a.set_union(b, g)
+            c.set_union(a, f)
+            a.height = 1 + max(b.height, g.height)
+            c.height = 1 + max(a.height, f.height)
+            return c
+
+        # Rotate B up
+        if balance < -1:
+            d, e = b.left, b.right
+            b.left = a
+            b.parent = a.parent
+            a.parent = b
+            self._replace_child(a, b)
+            if d.height < e.height:
+                d, e = e, d
+            b.right = d
+            a.left = e
+            e.parent = a
+            a.set_union(c, e)
+            b.set_union(a, d)
+            a.height = 1 + max(c.height, e.height)
+            b.height = 1 + max(a.height, d.height)
+            return b
+
+        return a
+
+    # Index interface
+
+    def insert(self, shape, obj):
+        if obj in self._leaves:
+            self.remove(obj)
+        leaf = _TreeNode()
+        leaf.set_box(self._fat_box(shape))
+        leaf.item = (shape, obj)
+        self._leaves[obj] = leaf
+        self._insert_leaf(leaf)
+
+    def query_iter(self, query_shape):
+        bbox = query_shape.bounding_box
+        min_x, min_y = bbox.min_point
+        max_x, max_y = bbox.max_point
+        if self._root is None:
+            return
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node.overlaps(min_x, min_y, max_x, max_y):
+                continue
+            if node.is_leaf:
+                shape, obj = node.item
+                if intersects(query_shape, shape):
+                    yield obj
+            else:
+                stack.append(node.right)
+                stack.append(node.left)
+
+    def query(self, query_shape):
+        return list(self.query_iter(query_shape))
+
+    def remove(self, obj):
+        leaf = self._leaves.pop(obj, None)
+        if leaf is not None:
+            self._remove_leaf(leaf)
+
+    def update(self, shape, obj):
+        leaf = self._leaves.get(obj)
+        if leaf is None:
+            self.insert(shape, obj)
+            return
+        leaf.item = (shape, obj)
+        # Still inside of inflated bbox, nothing to do with the tree
+        if leaf.contains_box(shape.bounding_box):
+            return
+        self._remove_leaf(leaf)
+        leaf.set_box(self._fat_box(shape))
+        self._insert_leaf(leaf)
@@ -0,0 +1,160 @@
+""" Batched versions of intersection tests. Shapes are packed into NumPy
+    arrays by type and each group is tested with a single vectorized kernel,
+    that follows the same `border` rules as scalar tests in `intersection`.
+    Pairs of shapes without a kernel fall back to `intersects`.
+
+    NumPy is an optional dependency, `np` is None if it's not installed.
+"""
+from .shapes import Circle, BoundingBox, with_compact
+from .intersection import intersects, inverse
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def pack_circles(circles):
+    """ `(x, y, radius)` arrays of circles
+    """
+    data = np.array(
+        [(c.center.x, c.center.y, c.radius) for c in circles], dtype=float)
+    return tuple(data.T)
+
+
+def pack_bboxes(bboxes):
+    """ `(min_x, min_y, max_x, max_y)` arrays of bboxes
+    """
+    data = np.array(
+        [tuple(b.min_point) + tuple(b.max_point) for b in bboxes],
+        dtype=float)
+    return tuple(data.T)
+
+
+def circle_to_circle_many(circles, others, border=False):
+    x, y, r = circles
+    other_x, other_y, other_r = others
+    dx = x - other_x
+    dy = y - other_y
+    d = np.sqrt(dx * dx + dy * dy)
+    r_sum = r + other_r
+    if border:
+        return d <= r_sum
+    return d < r_sum
+
+
+def circle_to_bbox_many(circles, bboxes, border=False):
+    c_x, c_y, r = circles
+    min_x, min_y, max_x, max_y = bboxes
+    # Same as `BoundingBox.contains_point` - lower and left borders are not
+    # included
+    inside = (min_x < c_x) & (c_x <= max_x) & (min_y < c_y) & (c_y <= max_y)
+
+    # Inflated the same way as `bbox.inflate(r * 2)` - around the center of
+    # the box, so results on the borders match the scalar test
+    center_x = (min_x + max_x) / 2
+    center_y = (min_y + max_y) / 2
+    half_w = (max_x - min_x + r * 2) / 2
+    half_h = (max_y - min_y + r * 2) / 2
+    inf_min_x = center_x - half_w
+    inf_min_y = center_y - half_h
+    inf_max_x = center_x + half_w
+    inf_max_y = center_y + half_h
+    near = ((inf_min_x < c_x) & (c_x <= inf_max_x) &
+            (inf_min_y < c_y) & (c_y <= inf_max_y))
+    if border:
+        near |= (
+            ((c_x == inf_min_x) & (inf_min_y < c_y) & (c_y < inf_max_y)) |
+            ((c_y == inf_min_y) & (inf_min_x < c_x) & (c_x < inf_max_x)))
+
+    # Circle can only miss the bbox near it's corners
+    at_corner = (((c_y < min_y) | (c_y > max_y)) &
+                 ((c_x < min_x) | (c_x > max_x)))
+    dx = c_x - np.where(c_x > max_x, max_x, min_x)
+    dy = c_y - np.where(c_y < min_y, min_y, max_y)
+    d = np.sqrt(dx * dx + dy * dy)
+    if border:
+        corner_hit = d <= r
+    else:
+        corner_hit = d < r
+    return inside | (near & (~at_corner | corner_hit))
+
+
+def bbox_to_bbox_many(bboxes, others, border=False):
+    min_x, min_y, max_x, max_y = bboxes
+    other_min_x, other_min_y, other_max_x, other_max_y = others
+    if border:
+        return ~((min_y > other_max_y) | (max_y < other_min_y) |
+                 (min_x > other_max_x) | (max_x < other_min_x))
+    return ~((min_y >= other_max_y) | (max_y <= other_min_y) |
+             (min_x >= other_max_x) | (max_x <= other_min_x))
+
+
+_packers = with_compact({
+    Circle: pack_circles,
+    BoundingBox: pack_bboxes,
+})
+
+_registry = with_compact({
+    (Circle, Circle): circle_to_circle_many,
+    (Circle, BoundingBox): circle_to_bbox_many,
+    (BoundingBox, Circle): inverse(circle_to_bbox_many),
+    (BoundingBox, BoundingBox): bbox_to_bbox_many,
+})
+
+
+def _check_numpy():
+    if np is None:
+        raise RuntimeError("NumPy is required for batched intersection tests")
+
+
+def _group(keys):
+    groups = {}
+    for i, key in enumerate(keys):
+        indexes = groups.get(key)
+        if indexes is None:
+            indexes = groups[key] = []
+        indexes.append(i)
+    return groups
+
+
+def intersects_many(shape, others, border=False):
+    """ Boolean array, that is True where `intersects(shape, other)` is
+    """
+    _check_numpy()
+    result = np.zeros(len(others), dtype=bool)
+    shape_type = type(shape)
+    groups = _group(type(other) for other in others)
+    for other_type, indexes in groups.items():
+        handler = _registry.get((shape_type, other_type))
+        if handler is None:
+            result[indexes] = [
+                intersects(shape, others[i], border=border) for i in indexes]
+            continue
+        packed = _packers[shape_type]([shape])
+        packed_others = _packers[other_type]([others[i] for i in indexes])
+        result[indexes] = handler(packed, packed_others, border=border)
+    return result
+
+
+def intersects_pairs(shapes, others, border=False):
+    """ Boolean array, that is True where `intersects(shapes[i], others[i])`
+        is
+    """
+    _check_numpy()
+    if len(shapes) != len(others):
+        raise ValueError("`shapes` and `others` should be of the same length")
+    result = np.zeros(len(shapes), dtype=bool)
+    groups = _group(
+        (type(shape), type(other)) for shape, other in zip(shapes, others))
+    for (shape_type, other_type), indexes in groups.items():
+        handler = _registry.get((shape_type, other_type))
+        if handler is None:
+            result[indexes] = [
+                intersects(shapes[i], others[i], border=border)
+                for i in indexes]
+            continue
+        packed = _packers[shape_type]([shapes[i] for i in indexes])
+        packed_others = _packers[other_type]([others[i] for i in indexes])
+        result[indexes] = handler(packed, packed_others, border=border)
+    return result
@@ -0,0 +1,217 @@
+import math
+
+
+def overlap_origin(bbox, other):
+    """ Minimum corner of the overlap of 2 bboxes as `(x, y)` or None if
+        bboxes do not overlap (touching borders is not an overlap).
+
+        Used to report an overlapping pair only once, by the node that
+        contains this point, if both objects are held by several nodes.
+    """
+    min_x, min_y = bbox.min_point
+    max_x, max_y = bbox.max_point
+    other_min_x, other_min_y = other.min_point
+    other_max_x, other_max_y = other.max_point
+    x = max(min_x, other_min_x)
+    y = max(min_y, other_min_y)
+    if x >= min(max_x, other_max_x) or y >= min(max_y, other_max_y):
+        return None
+    return x, y
+
+
+def owned_area(box, root):
+    """ Area `(min_x, min_y, max_x, max_y)` of points owned by a node with
+        `box` bounds in a tree with `root` bounds for half-open
+        `min <= x < max` tests. Nodes on the borders of the root also own
+        everything past them, so objects and overlaps sticking out of the
+        root, or lying on it's max border, always have an owner.
+    """
+    min_x, min_y, max_x, max_y = box
+    root_min_x, root_min_y, root_max_x, root_max_y = root
+    if min_x <= root_min_x:
+        min_x = -math.inf
+    if min_y <= root_min_y:
+        min_y = -math.inf
+    if max_x >= root_max_x:
+        max_x = math.inf
+    if max_y >= root_max_y:
+        max_y = math.inf
+    return min_x, min_y, max_x, max_y
+
+
+class _Endpoint:
+
+    __slots__ = ["value", "is_min", "obj", "index"]
+
+    def __init__(self, value, is_min, obj, index):
+        self.value = value
+        self.is_min = is_min
+        self.obj = obj
+        self.index = index
+
+    def key(self):
+        # On equal values max goes first, so touching boxes do not overlap
+        return (self.value, self.is_min)
+
+    def __repr__(self):
+        return "_Endpoint({!r}, is_min={})".format(self.value, self.is_min)
+
+
+def _box(bbox):
+    min_x, min_y = bbox.min_point
+    max_x, max_y = bbox.max_point
+    return (min_x, min_y, max_x, max_y)
+
+
+def _boxes_overlap(box, other):
+    min_x, min_y, max_x, max_y = box
+    other_min_x, other_min_y, other_max_x, other_max_y = other
+    return (min_x < other_max_x and other_min_x < max_x and
+            min_y < other_max_y and other_min_y < max_y)
+
+
+def _pair(obj, other):
+    if id(obj) < id(other):
+        return (obj, other)
+    return (other, obj)
+
+
+class SweepAndPrune:
+    """ Incremental sort and sweep broad phase. Keeps bbox endpoints of all
+        objects sorted on both axes and restores the order with insertion
+        sort on every update. As objects move a little between ticks, only
+        a few swaps are needed.
+
+        Overlapping pairs are kept between updates. Pairs, that started or
+        stopped overlapping since last `flush` are reported by it.
+    """
+
+    def __init__(self):
+        self._axes = ([], [])
+        self._boxes = {}
+        self._endpoints = {}
+        self._partners = {}
+        self._pairs = set([])
+        self._began = set([])
+        self._ended = set([])
+
+    @property
+    def pairs(self):
+        """ All currently overlapping pairs
+        """
+        return frozenset(self._pairs)
+
+    def _add_pair(self, pair):
+        if pair in self._pairs:
+            return
+        self._pairs.add(pair)
+        obj, other = pair
+        self._partners[obj].add(other)
+        self._partners[other].add(obj)
+        if pair in self._ended:
+            self._ended.remove(pair)
+        else:
+            self._began.add(pair)
+
+    def _remove_pair(self, pair):
+        if pair not in self._pairs:
+            return
+        self._pairs.remove(pair)
+        obj, other = pair
+        self._partners[obj].discard(other)
+        self._partners[other].discard(obj)
+        if pair in self._began:
+            self._began.remove(pair)
+        else:
+            self._ended.add(pair)
+
+    def _swap(self, endpoints, endpoint, other):
+        """ Swap 2 adjacent endpoints. If a min endpoint passed a max one,
+            overlap of those 2 objects could have changed.
+        """
+        i, j = endpoint.index, other.index
+        endpoints[i], endpoints[j] = other, endpoint
+        endpoint.index, other.index = j, i
+        if endpoint.is_min == other.is_min or endpoint.obj is other.obj:
+            return
+        obj, other_obj = endpoint.obj, other.obj
+        pair = _pair(obj, other_obj)
+        if _boxes_overlap(self._boxes[obj], self._boxes[other_obj]):
+            self._add_pair(pair)
+        else:
+            self._remove_pair(pair)
+
+    def _sort(self, endpoints, endpoint):
+        key = endpoint.key()
+        while endpoint.index > 0:
+            prev = endpoints[endpoint.index - 1]
+            if prev.key() <= key:
+                break
+            self._swap(endpoints, endpoint, prev)
+        last = len(endpoints) - 1
+        while endpoint.index < last:
+            nxt = endpoints[endpoint.index + 1]
+            if nxt.key() >= key:
+                break
+            self._swap(endpoints, endpoint, nxt)
+
+    def insert(self, shape, obj):
+        if obj in self._boxes:
+            self.update(shape, obj)
+            return
+        box = self._boxes[obj] = _box(shape.bounding_box)
+        self._partners[obj] = set([])
+        pairs = []
+        for axis, endpoints in enumerate(self._axes):
+            # Start at the end of list, as if object was far away
+            low = _Endpoint(box[axis], True, obj, len(endpoints))
+            endpoints.append(low)
+            high = _Endpoint(box[axis + 2], False, obj, len(endpoints))
+            endpoints.append(high)
+            self._sort(endpoints, low)
+            self._sort(endpoints, high)
+            pairs.append((low, high))
+        self._endpoints[obj] = pairs
+
+    def update(self, shape, obj):
+        if obj not in self._boxes:
+            self.insert(shape, obj)
+            return
+        old_box = self._boxes[obj]
+        box = self._boxes[obj] = _box(shape.bounding_box)
+        for axis, (low, high) in enumerate(self._endpoints[obj]):
+            endpoints = self._axes[axis]
+            low.value = box[axis]
+            high.value = box[axis + 2]
+            # Move the leading endpoint first, so they don't block each
+            # other
+            if box[axis] < old_box[axis]:
+                self._sort(endpoints, low)
+                self._sort(endpoints, high)
+            else:
+                self._sort(endpoints, high)
+                self._sort(endpoints, low)
+
+    def remove(self, obj):
+        if obj not in self._boxes:
+            return
+        for axis, (low, high) in enumerate(self._endpoints.pop(obj)):
+            endpoints = self._axes[axis]
+            first, last = sorted((low.index, high.index))
+            del endpoints[last]
+            del endpoints[first]
+            for i in range(first, len(endpoints)):
+                endpoints[i].index = i
+        for other in list(self._partners[obj]):
+            self._remove_pair(_pair(obj, other))
+        del self._partners[obj]
+        del self._boxes[obj]
+
+    def flush(self):
+        """ Return `(began, ended)` sets of pairs, that started and stopped
+            overlapping since the last call.
+        """
+        began, ended = self._began, self._ended
+        self._began = set([])
+        self._ended = set([])
+        return began, ended
@@ -1,6 +1,7 @@
 from planar import Vec2
 
-from .shapes import Circle, BoundingBox, Polygon
+from .shapes import Circle, BoundingBox, Polygon, with_compact, \
+    with_transformed
 
 
 def bbox_contains_circle(bbox, circle):
@@ -71,7 +72,7 @@ def polygon_contains_polygon(polygon, other):
     return True
 
 
-_registry = {
+_registry = with_transformed(with_compact({
     (Circle, BoundingBox): circle_contains_bbox,
     (BoundingBox, Circle): bbox_contains_circle,
     (Circle, Circle): circle_contains_circle,
@@ -79,7 +80,7 @@ _registry = {
     (Polygon, BoundingBox): polygon_contains_bbox,
     (BoundingBox, Polygon): bbox_contains_polygon,
     (Polygon, Polygon): polygon_contains_polygon,
-}
+}))
 
 
 def contains(container, contained):
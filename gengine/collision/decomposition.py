@@ -0,0 +1,106 @@
+""" Convex decomposition of simple polygons. Polygon is triangulated by ear
+    clipping and triangles are merged back along diagonals, while pieces
+    stay convex (Hertel-Mehlhorn). Gives at most 4 times more pieces, than
+    optimal, which is fine for the small shapes of game objects.
+
+    Functions work with vertex indexes, so callers can build pieces from
+    their own points.
+"""
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def _area2(vertices):
+    total = 0
+    for i in range(len(vertices)):
+        x1, y1 = vertices[i - 1]
+        x2, y2 = vertices[i]
+        total += x1 * y2 - x2 * y1
+    return total
+
+
+def _in_triangle(p, a, b, c):
+    return _cross(a, b, p) >= 0 and _cross(b, c, p) >= 0 and \
+        _cross(c, a, p) >= 0
+
+
+def triangulate(vertices):
+    """ Triangles of a simple polygon as tuples of vertex indexes in counter
+        clockwise order.
+    """
+    indexes = list(range(len(vertices)))
+    if _area2(vertices) < 0:
+        indexes.reverse()
+    triangles = []
+    while len(indexes) > 3:
+        count = len(indexes)
+        for i in range(count):
+            prev, cur, nxt = \
+                indexes[i - 1], indexes[i], indexes[(i + 1) % count]
+            a, b, c = vertices[prev], vertices[cur], vertices[nxt]
+            if _cross(a, b, c) <= 0:
+                # Reflex or collinear vertex
+                continue
+            if any(_in_triangle(vertices[j], a, b, c)
+                   for j in indexes if j not in (prev, cur, nxt)):
+                continue
+            triangles.append((prev, cur, nxt))
+            del indexes[i]
+            break
+        else:
+            # No ears left, only collinear vertices can be dropped
+            for i in range(count):
+                prev, cur, nxt = \
+                    indexes[i - 1], indexes[i], indexes[(i + 1) % count]
+                if _cross(vertices[prev], vertices[cur], vertices[nxt]) == 0:
+                    del indexes[i]
+                    break
+            else:
+                raise ValueError("Polygon should be simple")
+    if len(indexes) == 3 and _cross(*[vertices[i] for i in indexes]) > 0:
+        triangles.append(tuple(indexes))
+    return triangles
+
+
+def _merge(vertices, piece, other, a, b):
+    """ Union of `piece` with edge `a -> b` and `other` with edge `b -> a`
+        or None if it's not convex.
+    """
+    i = piece.index(b)
+    path = piece[i:] + piece[:i]
+    i = other.index(a)
+    other_path = other[i:] + other[:i]
+    # Only vertices at the ends of removed diagonal can become reflex
+    if _cross(vertices[path[-2]], vertices[a], vertices[other_path[1]]) < 0:
+        return None
+    if _cross(vertices[other_path[-2]], vertices[b], vertices[path[1]]) < 0:
+        return None
+    return path + other_path[1:-1]
+
+
+def convex_decomposition(vertices):
+    """ Convex pieces of a simple polygon as lists of vertex indexes in
+        counter clockwise order.
+    """
+    pieces = [list(triangle) for triangle in triangulate(vertices)]
+    owners = {}
+    for k, piece in enumerate(pieces):
+        for i in range(len(piece)):
+            owners[piece[i - 1], piece[i]] = k
+    diagonals = sorted(
+        (a, b) for a, b in owners if a < b and (b, a) in owners)
+    for a, b in diagonals:
+        k = owners[a, b]
+        m = owners[b, a]
+        merged = _merge(vertices, pieces[k], pieces[m], a, b)
+        if merged is None:
+            continue
+        pieces[k] = merged
+        pieces[m] = None
+        del owners[a, b]
+        del owners[b, a]
+        for i in range(len(merged)):
+            owners[merged[i - 1], merged[i]] = k
+    return [piece for piece in pieces if piece is not None]
@@ -0,0 +1,60 @@
+import math
+
+from .shapes import Circle, BoundingBox, Polygon, LineSegment, \
+    with_compact, with_transformed
+from .moving_shapes import MovingCircle
+
+
+def box_distance(min_x, min_y, max_x, max_y, x, y):
+    """ Distance from point `(x, y)` to a box given by raw coordinates.
+        0 if point is inside of the box.
+    """
+    dx = max(min_x - x, 0, x - max_x)
+    dy = max(min_y - y, 0, y - max_y)
+    return math.hypot(dx, dy)
+
+
+def bbox_distance(bbox, point):
+    min_x, min_y = bbox.min_point
+    max_x, max_y = bbox.max_point
+    x, y = point
+    return box_distance(min_x, min_y, max_x, max_y, x, y)
+
+
+def circle_distance(circle, point):
+    d = circle.center.distance_to(point) - circle.radius
+    return max(d, 0)
+
+
+def polygon_distance(polygon, point):
+    if polygon.contains_point(point):
+        return 0
+    return min(edge.distance_to(point) for edge in polygon.iter_edges())
+
+
+def segment_distance(segment, point):
+    return segment.distance_to(point)
+
+
+def moving_circle_distance(mcircle, point):
+    d = mcircle.seg.distance_to(point) - mcircle.radius
+    return max(d, 0)
+
+
+_registry = with_transformed(with_compact({
+    Circle: circle_distance,
+    BoundingBox: bbox_distance,
+    Polygon: polygon_distance,
+    LineSegment: segment_distance,
+    MovingCircle: moving_circle_distance,
+}))
+
+
+def distance(shape, point):
+    """ Distance from `point` to the closest point of `shape`. 0 if point is
+        inside of the shape.
+    """
+    handler = _registry.get(type(shape))
+    if handler is not None:
+        return handler(shape, point)
+    raise NotImplementedError
@@ -0,0 +1,643 @@
+import itertools as it
+from array import array
+from heapq import heappush, heappop
+
+from .morton import MORTON_TO_CHILD, morton_digit, common_level, grid_range
+from .distance import distance, box_distance
+from .raycast import ray_distance, box_ray_distance
+from .broadphase import overlap_origin, owned_area
+
+
+# Child blocks are always allocated as 4 consecutive nodes in the same order
+# as `_QuadNode.nodes`
+NW, NE, SE, SW = range(4)
+NO_NODE = -1
+# Objects and queries without a layer mask are in all layers. Node masks are
+# kept in unsigned 64 bit arrays, so that's the limit for layers.
+MASK_ALL = (1 << 64) - 1
+
+
+class FlatQuadNodes:
+    """ Array backed storage for QuadTree nodes. Has the same interface as
+        root `_QuadNode`, but instead of an object per node all bounds, child
+        links and object slots are kept in flat preallocated arrays and nodes
+        are addressed by integer index. Root node always has index 0.
+
+        Objects of a node are stored in a doubly linked list of slots, so
+        insert and unlink are O(1). Each node also keeps the OR of layer
+        masks of objects in it's subtree to skip subtrees in masked queries
+        and the number of objects in it's subtree (see `_QuadNode._owns`).
+    """
+
+    def __init__(self, bbox, max_level, *, capacity=64, masks=None):
+        self._max_level = max_level
+        min_x, min_y = bbox.min_point
+        max_x, max_y = bbox.max_point
+        self._root_bounds = (min_x, min_y, max_x, max_y)
+        # Layer mask of each object, objects without one are in all layers
+        self._masks = masks
+
+        # Node arrays
+        self._capacity = 0
+        self._min_x = array('d')
+        self._min_y = array('d')
+        self._max_x = array('d')
+        self._max_y = array('d')
+        self._child = array('l')
+        self._parent = array('l')
+        self._level = array('H')
+        self._head = array('l')
+        self._mask = array('Q')
+        self._count = array('l')
+        self._grow_nodes(max(capacity, 1))
+
+        # Object slot arrays
+        self._slot_capacity = 0
+        self._slot_next = array('l')
+        self._slot_prev = array('l')
+        self._slot_node = array('l')
+        self._slot_items = []
+        self._grow_slots(max(capacity, 1))
+
+        self._reset()
+
+    def _reset(self):
+        self._node_count = 1
+        self._free_blocks = []
+        self._slot_count = 0
+        self._free_slots = []
+        min_x, min_y, max_x, max_y = self._root_bounds
+        self._init_node(0, NO_NODE, 0, min_x, min_y, max_x, max_y)
+        for i in range(len(self._slot_items)):
+            self._slot_items[i] = None
+
+    # Storage management
+
+    def _grow_nodes(self, capacity):
+        extra = capacity - self._capacity
+        if extra <= 0:
+            return
+        zeros = array('d', [0.0]) * extra
+        for arr in (self._min_x, self._min_y, self._max_x, self._max_y):
+            arr.extend(zeros)
+        links = array('l', [NO_NODE]) * extra
+        for arr in (self._child, self._parent, self._head):
+            arr.extend(links)
+        self._level.extend(array('H', [0]) * extra)
+        self._mask.extend(array('Q', [0]) * extra)
+        self._count.extend(array('l', [0]) * extra)
+        self._capacity = capacity
+
+    def _grow_slots(self, capacity):
+        extra = capacity - self._slot_capacity
+        if extra <= 0:
+            return
+        links = array('l', [NO_NODE]) * extra
+        for arr in (self._slot_next, self._slot_prev, self._slot_node):
+            arr.extend(links)
+        self._slot_items.extend([None] * extra)
+        self._slot_capacity = capacity
+
+    def _init_node(self, i, parent, level, min_x, min_y, max_x, max_y):
+        self._min_x[i] = min_x
+        self._min_y[i] = min_y
+        self._max_x[i] = max_x
+        self._max_y[i] = max_y
+        self._child[i] = NO_NODE
+        self._parent[i] = parent
+        self._level[i] = level
+        self._head[i] = NO_NODE
+        self._mask[i] = 0
+        self._count[i] = 0
+
+    def _alloc_block(self):
+        if self._free_blocks:
+            return self._free_blocks.pop()
+        first = self._node_count
+        if first + 4 > self._capacity:
+            self._grow_nodes(self._capacity * 2 + 4)
+        self._node_count += 4
+        return first
+
+    def _alloc_slot(self):
+        if self._free_slots:
+            return self._free_slots.pop()
+        slot = self._slot_count
+        if slot >= self._slot_capacity:
+            self._grow_slots(self._slot_capacity * 2)
+        self._slot_count += 1
+        return slot
+
+    @property
+    def node_count(self):
+        """ Number of nodes currently in use
+        """
+        return self._node_count - len(self._free_blocks) * 4
+
+    @property
+    def holds_once(self):
+        # Objects are pushed to all max level nodes they intersect
+        return False
+
+    # Node operations
+
+    def split(self, i):
+        if self._child[i] != NO_NODE:
+            raise RuntimeError("Already splitted")
+        level = self._level[i]
+        if level == self._max_level:
+            raise RuntimeError("Already splitted to max level")
+
+        min_x = self._min_x[i]
+        min_y = self._min_y[i]
+        max_x = self._max_x[i]
+        max_y = self._max_y[i]
+        c_x = (min_x + max_x) / 2
+        c_y = (min_y + max_y) / 2
+
+        first = self._alloc_block()
+        new_level = level + 1
+        init = self._init_node
+        init(first + NW, i, new_level, min_x, c_y, c_x, max_y)
+        init(first + NE, i, new_level, c_x, c_y, max_x, max_y)
+        init(first + SE, i, new_level, c_x, min_y, max_x, c_y)
+        init(first + SW, i, new_level, min_x, min_y, c_x, c_y)
+        self._child[i] = first
+        return first
+
+    def _link(self, i, entry):
+        slot = self._alloc_slot()
+        head = self._head[i]
+        self._slot_items[slot] = entry
+        self._slot_node[slot] = i
+        self._slot_prev[slot] = NO_NODE
+        self._slot_next[slot] = head
+        if head != NO_NODE:
+            self._slot_prev[head] = slot
+        self._head[i] = slot
+        self._include(i, self._mask_of(entry))
+        if self._owns(i, entry[0]):
+            self._add_count(i, 1)
+        return slot
+
+    def _mask_of(self, entry):
+        if self._masks is None:
+            return MASK_ALL
+        _, (_, obj) = entry
+        return self._masks.get(obj, MASK_ALL)
+
+    def _include(self, i, mask):
+        """ Add `mask` to masks of node `i` and it's ancestors
+        """
+        node_mask = self._mask
+        parent = self._parent
+        while i != NO_NODE and mask & ~node_mask[i]:
+            node_mask[i] |= mask
+            i = parent[i]
+
+    def _owns(self, i, bbox):
+        """ True if object with `bbox` held by node `i` is counted by it
+        """
+        min_x, min_y, max_x, max_y = owned_area(
+            (self._min_x[i], self._min_y[i], self._max_x[i], self._max_y[i]),
+            self._root_bounds)
+        x, y = bbox.min_point
+        return min_x <= x < max_x and min_y <= y < max_y
+
+    def _add_count(self, i, delta):
+        """ Add `delta` to object counts of node `i` and it's ancestors
+        """
+        count = self._count
+        parent = self._parent
+        while i != NO_NODE:
+            count[i] += delta
+            i = parent[i]
+
+    def _refresh_mask(self, i):
+        """ Recompute masks from node `i` up to the root after objects were
+            removed
+        """
+        node_mask = self._mask
+        child = self._child
+        while i != NO_NODE:
+            mask = 0
+            for entry in self._iter_node_objects(i):
+                mask |= self._mask_of(entry)
+            first = child[i]
+            if first != NO_NODE:
+                mask |= (node_mask[first] | node_mask[first + 1] |
+                         node_mask[first + 2] | node_mask[first + 3])
+            if mask == node_mask[i]:
+                return
+            node_mask[i] = mask
+            i = self._parent[i]
+
+    def _unlink(self, slot):
+        i = self._slot_node[slot]
+        prev = self._slot_prev[slot]
+        nxt = self._slot_next[slot]
+        if prev != NO_NODE:
+            self._slot_next[prev] = nxt
+        else:
+            self._head[i] = nxt
+        if nxt != NO_NODE:
+            self._slot_prev[nxt] = prev
+        bbox, _ = self._slot_items[slot]
+        if self._owns(i, bbox):
+            self._add_count(i, -1)
+        self._slot_items[slot] = None
+        self._slot_node[slot] = NO_NODE
+        self._free_slots.append(slot)
+        return i
+
+    def _is_empty_leaf(self, i):
+        return self._child[i] == NO_NODE and self._head[i] == NO_NODE
+
+    def _collapse(self, i):
+        """ Release empty child blocks from node `i` up to the root
+        """
+        child = self._child
+        while i != NO_NODE:
+            first = child[i]
+            if first != NO_NODE:
+                empty = self._is_empty_leaf
+                if not (empty(first) and empty(first + 1) and
+                        empty(first + 2) and empty(first + 3)):
+                    return
+                child[i] = NO_NODE
+                self._free_blocks.append(first)
+            if self._head[i] != NO_NODE:
+                return
+            i = self._parent[i]
+
+    def _iter_node_objects(self, i):
+        items = self._slot_items
+        nxt = self._slot_next
+        slot = self._head[i]
+        while slot != NO_NODE:
+            yield items[slot]
+            slot = nxt[slot]
+
+    # `_QuadNode` compatible interface
+
+    def get_all_objects(self, i=0, mask=MASK_ALL):
+        child = self._child
+        node_mask = self._mask
+        stack = [i]
+        while stack:
+            i = stack.pop()
+            if not node_mask[i] & mask:
+                continue
+            yield from self._iter_node_objects(i)
+            first = child[i]
+            if first != NO_NODE:
+                stack.extend((first + 3, first + 2, first + 1, first))
+
+    def clear(self):
+        self._reset()
+
+    def insert(self, bbox, obj, holders=None):
+        b_min_x, b_min_y = bbox.min_point
+        b_max_x, b_max_y = bbox.max_point
+        entry = (bbox, obj)
+
+        n_min_x = self._min_x
+        n_min_y = self._min_y
+        n_max_x = self._max_x
+        n_max_y = self._max_y
+        level = self._level
+        child = self._child
+        max_level = self._max_level
+
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            min_x = n_min_x[i]
+            min_y = n_min_y[i]
+            max_x = n_max_x[i]
+            max_y = n_max_y[i]
+            # If bbox covers all of this node - add it to objects list.
+            if (b_min_x <= min_x and b_max_x >= max_x and
+                    b_min_y <= min_y and b_max_y >= max_y):
+                slot = self._link(i, entry)
+                if holders is not None:
+                    holders.append(slot)
+                continue
+            # Same as `intersects` without border
+            if (b_min_y >= max_y or b_max_y <= min_y or
+                    b_min_x >= max_x or b_max_x <= min_x):
+                continue
+            if level[i] == max_level:
+                slot = self._link(i, entry)
+                if holders is not None:
+                    holders.append(slot)
+                continue
+            first = child[i]
+            if first == NO_NODE:
+                first = self.split(i)
+            stack.extend((first + 3, first + 2, first + 1, first))
+
+    def insert_cells(self, entries):
+        """ Insert presorted `(code, bbox, obj, holders)` entries. See
+            `_QuadNode.insert_cells`.
+        """
+        depth = self._max_level
+        child = self._child
+        path = [0]
+        prev_code = None
+        for code, bbox, obj, holders in entries:
+            if prev_code is not None:
+                del path[common_level(code, prev_code, depth) + 1:]
+            i = path[-1]
+            for level in range(len(path), depth + 1):
+                first = child[i]
+                if first == NO_NODE:
+                    first = self.split(i)
+                i = first + MORTON_TO_CHILD[morton_digit(code, level, depth)]
+                path.append(i)
+            holders.append(self._link(i, (bbox, obj)))
+            prev_code = code
+
+    def discard(self, holders, remove_obj):
+        """ Remove object from `holders` slots, as returned by `insert`.
+        """
+        for slot in holders:
+            i = self._unlink(slot)
+            self._refresh_mask(i)
+            self._collapse(i)
+
+    def relocate(self, holders, bbox, item):
+        """ Replace `item` bbox in place if it would still be held by the
+            same node. Returns False if the item needs to be reinserted.
+        """
+        if len(holders) != 1:
+            return False
+        slot, = holders
+        i = self._slot_node[slot]
+        if self._level[i] != self._max_level:
+            return False
+        b_min_x, b_min_y = bbox.min_point
+        b_max_x, b_max_y = bbox.max_point
+        if not (self._min_x[i] <= b_min_x and self._max_x[i] >= b_max_x and
+                self._min_y[i] <= b_min_y and self._max_y[i] >= b_max_y):
+            return False
+        old_bbox, _ = self._slot_items[slot]
+        self._slot_items[slot] = (bbox, item)
+        delta = self._owns(i, bbox) - self._owns(i, old_bbox)
+        if delta:
+            self._add_count(i, delta)
+        return True
+
+    def query(self, bbox, mask=MASK_ALL):
+        """ Yield entries of nodes `bbox` intersects, skipping subtrees
+            without objects in `mask` layers. See `_QuadNode.query`.
+        """
+        b_min_x, b_min_y = bbox.min_point
+        b_max_x, b_max_y = bbox.max_point
+
+        n_min_x = self._min_x
+        n_min_y = self._min_y
+        n_max_x = self._max_x
+        n_max_y = self._max_y
+        child = self._child
+        node_mask = self._mask
+
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if not node_mask[i] & mask:
+                continue
+            min_x = n_min_x[i]
+            min_y = n_min_y[i]
+            max_x = n_max_x[i]
+            max_y = n_max_y[i]
+            if (b_min_x <= min_x and b_max_x >= max_x and
+                    b_min_y <= min_y and b_max_y >= max_y):
+                yield from self.get_all_objects(i, mask)
+                continue
+            if (b_min_y >= max_y or b_max_y <= min_y or
+                    b_min_x >= max_x or b_max_x <= min_x):
+                # Children are inside of this node, so no need to go deeper
+                continue
+            yield from self._iter_node_objects(i)
+            first = child[i]
+            if first != NO_NODE:
+                stack.extend((first + 3, first + 2, first + 1, first))
+
+    def count(self, bbox):
+        """ Number of objects, whose bboxes overlap `bbox`. See
+            `_QuadNode.count`.
+        """
+        b_min_x, b_min_y = bbox.min_point
+        b_max_x, b_max_y = bbox.max_point
+        root_min_x, root_min_y, _, _ = self._root_bounds
+
+        n_min_x = self._min_x
+        n_min_y = self._min_y
+        n_max_x = self._max_x
+        n_max_y = self._max_y
+        child = self._child
+        count = self._count
+
+        total = 0
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            min_x = n_min_x[i]
+            min_y = n_min_y[i]
+            max_x = n_max_x[i]
+            max_y = n_max_y[i]
+            if (b_min_y >= max_y or b_max_y <= min_y or
+                    b_min_x >= max_x or b_max_x <= min_x):
+                continue
+            # Objects crossing min sides of `bbox` are counted by the node
+            # with the minimum corner of their overlap with `bbox` instead
+            if (b_min_x <= min_x and b_max_x >= max_x and
+                    b_min_y <= min_y and b_max_y >= max_y and
+                    (b_min_x < min_x or b_min_x <= root_min_x) and
+                    (b_min_y < min_y or b_min_y <= root_min_y)):
+                total += count[i]
+                continue
+            own_min_x, own_min_y, own_max_x, own_max_y = owned_area(
+                (min_x, min_y, max_x, max_y), self._root_bounds)
+            for entry_bbox, _ in self._iter_node_objects(i):
+                origin = overlap_origin(entry_bbox, bbox)
+                if origin is None:
+                    continue
+                x, y = origin
+                if (own_min_x <= x < own_max_x and
+                        own_min_y <= y < own_max_y):
+                    total += 1
+            first = child[i]
+            if first != NO_NODE:
+                stack.extend((first + 3, first + 2, first + 1, first))
+        return total
+
+    def density_grid(self, resolution):
+        """ Number of objects per cell of a `resolution` x `resolution`
+            grid as a list of rows. See `_QuadNode.density_grid`.
+        """
+        grid = [[0] * resolution for _ in range(resolution)]
+        origin_x, origin_y, root_max_x, _ = self._root_bounds
+        cell_size = (root_max_x - origin_x) / resolution
+
+        n_min_x = self._min_x
+        n_min_y = self._min_y
+        n_max_x = self._max_x
+        n_max_y = self._max_y
+        child = self._child
+        count = self._count
+
+        stack = [0]
+        while stack:
+            i = stack.pop()
+            if not count[i]:
+                continue
+            first_x, last_x = grid_range(
+                n_min_x[i], n_max_x[i], origin_x, cell_size, resolution)
+            first_y, last_y = grid_range(
+                n_min_y[i], n_max_y[i], origin_y, cell_size, resolution)
+            if first_x == last_x and first_y == last_y:
+                grid[first_y][first_x] += count[i]
+                continue
+            for bbox, _ in self._iter_node_objects(i):
+                if not self._owns(i, bbox):
+                    continue
+                x, y = bbox.min_point
+                x = int((x - origin_x) // cell_size)
+                y = int((y - origin_y) // cell_size)
+                grid[min(max(y, first_y), last_y)][
+                    min(max(x, first_x), last_x)] += 1
+            first = child[i]
+            if first != NO_NODE:
+                stack.extend((first + 3, first + 2, first + 1, first))
+        return grid
+
+    def nearest(self, point, max_radius=None):
+        """ Yield `(distance, (bbox, obj))` in order of distance from
+            `point`. See `_QuadNode.nearest`.
+        """
+        x, y = point
+        n_min_x = self._min_x
+        n_min_y = self._min_y
+        n_max_x = self._max_x
+        n_max_y = self._max_y
+        child = self._child
+
+        counter = it.count()
+        heap = [(box_distance(
+            n_min_x[0], n_min_y[0], n_max_x[0], n_max_y[0], x, y),
+            next(counter), 0, None)]
+        while heap:
+            dist, _, i, entry = heappop(heap)
+            if max_radius is not None and dist > max_radius:
+                return
+            if i == NO_NODE:
+                yield dist, entry
+                continue
+            for entry in self._iter_node_objects(i):
+                _, (shape, _) = entry
+                d = distance(shape, point)
+                if max_radius is None or d <= max_radius:
+                    heappush(heap, (d, next(counter), NO_NODE, entry))
+            first = child[i]
+            if first == NO_NODE:
+                continue
+            for i in range(first, first + 4):
+                d = box_distance(
+                    n_min_x[i], n_min_y[i], n_max_x[i], n_max_y[i], x, y)
+                if max_radius is None or d <= max_radius:
+                    heappush(heap, (d, next(counter), i, None))
+
+    def raycast(self, origin, direction, max_distance):
+        """ Yield `(distance, (bbox, obj))` for objects hit by the ray in
+            order of distance along it. See `_QuadNode.raycast`.
+        """
+        ox, oy = origin
+        dx, dy = direction
+        n_min_x = self._min_x
+        n_min_y = self._min_y
+        n_max_x = self._max_x
+        n_max_y = self._max_y
+        child = self._child
+
+        counter = it.count()
+        t = box_ray_distance(
+            n_min_x[0], n_min_y[0], n_max_x[0], n_max_y[0],
+            ox, oy, dx, dy, max_distance)
+        if t is None:
+            return
+        heap = [(t, next(counter), 0, None)]
+        while heap:
+            t, _, i, entry = heappop(heap)
+            if i == NO_NODE:
+                yield t, entry
+                continue
+            for entry in self._iter_node_objects(i):
+                _, (shape, _) = entry
+                t = ray_distance(shape, origin, direction, max_distance)
+                if t is not None:
+                    heappush(heap, (t, next(counter), NO_NODE, entry))
+            first = child[i]
+            if first == NO_NODE:
+                continue
+            for i in range(first, first + 4):
+                t = box_ray_distance(
+                    n_min_x[i], n_min_y[i], n_max_x[i], n_max_y[i],
+                    ox, oy, dx, dy, max_distance)
+                if t is not None:
+                    heappush(heap, (t, next(counter), i, None))
+
+    def join_view(self):
+        """ `(root, bounds, entries, children)` for `QuadTree.join`. See
+            `_QuadNode.join_view`.
+        """
+        def bounds(i):
+            return (
+                self._min_x[i], self._min_y[i], self._max_x[i], self._max_y[i])
+
+        def entries(i):
+            return list(self._iter_node_objects(i))
+
+        def children(i):
+            first = self._child[i]
+            if first == NO_NODE:
+                return ()
+            return range(first, first + 4)
+
+        return 0, bounds, entries, children
+
+    def iter_pairs(self):
+        """ Yield `(item, other)` for all objects, whose bboxes overlap. See
+            `_QuadNode.iter_pairs`.
+        """
+        n_min_x = self._min_x
+        n_min_y = self._min_y
+        n_max_x = self._max_x
+        n_max_y = self._max_y
+        child = self._child
+        root = self._root_bounds
+
+        stack = [(0, ())]
+        while stack:
+            i, above = stack.pop()
+            min_x, min_y, max_x, max_y = owned_area(
+                (n_min_x[i], n_min_y[i], n_max_x[i], n_max_y[i]), root)
+            objects = list(self._iter_node_objects(i))
+            for j, (bbox, item) in enumerate(objects):
+                for other_bbox, other in it.chain(above, objects[j + 1:]):
+                    origin = overlap_origin(bbox, other_bbox)
+                    if origin is None:
+                        continue
+                    x, y = origin
+                    if min_x <= x < max_x and min_y <= y < max_y:
+                        yield other, item
+            first = child[i]
+            if first != NO_NODE:
+                below = above + tuple(objects)
+                stack.extend((first + k, below) for k in range(4))
+
+    def __repr__(self):
+        return "FlatQuadNodes<nodes={}, objects={}, max_level={}>".format(
+            self.node_count, self._slot_count - len(self._free_slots),
+            self._max_level)
@@ -0,0 +1,276 @@
+""" GJK distance and EPA penetration for convex shapes.
+
+    Every shape is described by it's core - a set of points, whose convex
+    hull inflated by a margin gives the shape (a circle is it's center with
+    radius as margin). GJK and EPA only work with the cores through support
+    points, so any pair of registered shapes goes through the same code.
+"""
+import math
+
+from planar import Vec2
+
+from .shapes import Circle, BoundingBox, Polygon, LineSegment, \
+    with_compact, with_transformed
+from .moving_shapes import MovingCircle
+
+MAX_ITERATIONS = 64
+EPSILON = 1e-9
+
+
+def circle_core(circle):
+    return (tuple(circle.center),), circle.radius
+
+
+def bbox_core(bbox):
+    min_x, min_y = bbox.min_point
+    max_x, max_y = bbox.max_point
+    return ((min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)), 0
+
+
+def polygon_core(polygon):
+    if not polygon.is_convex:
+        raise ValueError("Only convex polygons are supported")
+    return polygon.vertices, 0
+
+
+def segment_core(segment):
+    return (tuple(segment.start), tuple(segment.end)), 0
+
+
+def moving_circle_core(mcircle):
+    return (tuple(mcircle.seg.start), tuple(mcircle.seg.end)), mcircle.radius
+
+
+_registry = with_transformed(with_compact({
+    Circle: circle_core,
+    BoundingBox: bbox_core,
+    Polygon: polygon_core,
+    LineSegment: segment_core,
+    MovingCircle: moving_circle_core,
+}))
+
+
+def core(shape):
+    """ Shape as `(points, margin)` - convex hull of `points` inflated by
+        `margin`.
+    """
+    handler = _registry.get(type(shape))
+    if handler is not None:
+        return handler(shape)
+    raise NotImplementedError
+
+
+def _support_point(points, dx, dy):
+    best = None
+    best_dot = None
+    for x, y in points:
+        dot = x * dx + y * dy
+        if best is None or dot > best_dot:
+            best = (x, y)
+            best_dot = dot
+    return best
+
+
+def support(shape, direction):
+    """ Point of `shape` furthest in `direction`
+    """
+    points, margin = core(shape)
+    dx, dy = direction
+    x, y = _support_point(points, dx, dy)
+    if margin:
+        length = math.hypot(dx, dy)
+        x += dx / length * margin
+        y += dy / length * margin
+    return Vec2(x, y)
+
+
+def _vertex(points, other_points, dx, dy):
+    """ Support point of Minkowski difference `points - other_points` as
+        `(x, y, a_x, a_y, b_x, b_y)`, where `a` and `b` are source points.
+    """
+    a_x, a_y = _support_point(points, dx, dy)
+    b_x, b_y = _support_point(other_points, -dx, -dy)
+    return (a_x - b_x, a_y - b_y, a_x, a_y, b_x, b_y)
+
+
+def _closest_on_segment(v1, v2):
+    x1, y1 = v1[0], v1[1]
+    x2, y2 = v2[0], v2[1]
+    e_x = x2 - x1
+    e_y = y2 - y1
+    length2 = e_x * e_x + e_y * e_y
+    if length2 < EPSILON * EPSILON:
+        return [v1], [1], (x1, y1)
+    t = -(x1 * e_x + y1 * e_y) / length2
+    if t <= 0:
+        return [v1], [1], (x1, y1)
+    if t >= 1:
+        return [v2], [1], (x2, y2)
+    return [v1, v2], [1 - t, t], (x1 + e_x * t, y1 + e_y * t)
+
+
+def _solve(simplex):
+    """ Closest to origin point of simplex. Returns reduced simplex, that
+        still contains it, barycentric weights of it's vertices and the
+        point. Weights are None if origin is inside of the simplex.
+    """
+    if len(simplex) == 1:
+        v, = simplex
+        return simplex, [1], (v[0], v[1])
+    if len(simplex) == 2:
+        return _closest_on_segment(*simplex)
+    signs = set([])
+    for i in range(3):
+        a, b = simplex[i - 1], simplex[i]
+        cross = (a[0] - b[0]) * b[1] - (a[1] - b[1]) * b[0]
+        if cross:
+            signs.add(cross > 0)
+    if len(signs) < 2:
+        return simplex, None, (0, 0)
+    best = None
+    for i in range(3):
+        result = _closest_on_segment(simplex[i - 1], simplex[i])
+        x, y = result[2]
+        d = x * x + y * y
+        if best is None or d < best[0]:
+            best = (d, result)
+    return best[1]
+
+
+def _gjk(points, other_points):
+    """ Find the point of Minkowski difference closest to origin. Returns
+        `(simplex, weights, point)`, weights are None if hulls overlap.
+    """
+    simplex = [_vertex(points, other_points, 1, 0)]
+    for _ in range(MAX_ITERATIONS):
+        simplex, weights, (p_x, p_y) = _solve(simplex)
+        if weights is None:
+            return simplex, None, (0, 0)
+        dist2 = p_x * p_x + p_y * p_y
+        if dist2 <= EPSILON * EPSILON:
+            # Origin is on the simplex, hulls touch
+            return simplex, None, (0, 0)
+        v = _vertex(points, other_points, -p_x, -p_y)
+        # New support point can't bring us closer to origin
+        if v in simplex or dist2 - (v[0] * p_x + v[1] * p_y) <= \
+                EPSILON * dist2:
+            break
+        simplex.append(v)
+    return simplex, weights, (p_x, p_y)
+
+
+def _epa(points, other_points, simplex):
+    """ Penetration depth and normal of overlapping hulls by expanding the
+        GJK simplex towards the boundary of Minkowski difference.
+    """
+    polytope = [(v[0], v[1]) for v in simplex]
+    if len(polytope) < 3:
+        # Hulls only touch, complete simplex to a triangle
+        if len(polytope) == 1:
+            x, y = polytope[0]
+            if x or y:
+                v = _vertex(points, other_points, -x, -y)
+            else:
+                v = _vertex(points, other_points, 1, 0)
+            polytope.append((v[0], v[1]))
+        (x1, y1), (x2, y2) = polytope
+        e_x = x2 - x1
+        e_y = y2 - y1
+        if not (e_x or e_y):
+            return 0, (1, 0)
+        for n_x, n_y in ((-e_y, e_x), (e_y, -e_x)):
+            v = _vertex(points, other_points, n_x, n_y)
+            if abs(e_x * (v[1] - y1) - e_y * (v[0] - x1)) > EPSILON:
+                polytope.append((v[0], v[1]))
+                break
+        else:
+            length = math.hypot(e_x, e_y)
+            return 0, (-e_y / length, e_x / length)
+    (x1, y1), (x2, y2), (x3, y3) = polytope
+    if (x2 - x1) * (y3 - y1) - (y2 - y1) * (x3 - x1) < 0:
+        # Keep counter clockwise order, so edge normals point outwards
+        polytope.reverse()
+
+    for _ in range(MAX_ITERATIONS):
+        best = None
+        for i in range(len(polytope)):
+            x1, y1 = polytope[i - 1]
+            x2, y2 = polytope[i]
+            length = math.hypot(x2 - x1, y2 - y1)
+            if not length:
+                continue
+            n_x = (y2 - y1) / length
+            n_y = -(x2 - x1) / length
+            dist = n_x * x1 + n_y * y1
+            if best is None or dist < best[0]:
+                best = (dist, i, n_x, n_y)
+        dist, i, n_x, n_y = best
+        v = _vertex(points, other_points, n_x, n_y)
+        if v[0] * n_x + v[1] * n_y - dist <= EPSILON:
+            break
+        polytope.insert(i, (v[0], v[1]))
+    return max(dist, 0), (n_x, n_y)
+
+
+def _query(shape, other):
+    points, margin = core(shape)
+    other_points, other_margin = core(other)
+    simplex, weights, (p_x, p_y) = _gjk(points, other_points)
+    return (points, margin, other_points, other_margin,
+            simplex, weights, p_x, p_y)
+
+
+def closest_points(shape, other):
+    """ Returns `(distance, point, other_point)` for closest points of two
+        convex shapes or None if shapes overlap or their cores touch.
+    """
+    points, margin, other_points, other_margin, simplex, weights, p_x, p_y = \
+        _query(shape, other)
+    if weights is None:
+        return None
+    dist = math.hypot(p_x, p_y)
+    gap = dist - margin - other_margin
+    if gap < 0:
+        return None
+    a_x = a_y = b_x = b_y = 0
+    for v, weight in zip(simplex, weights):
+        a_x += v[2] * weight
+        a_y += v[3] * weight
+        b_x += v[4] * weight
+        b_y += v[5] * weight
+    # Direction from `shape` to `other`
+    n_x = -p_x / dist
+    n_y = -p_y / dist
+    return (
+        gap,
+        Vec2(a_x + n_x * margin, a_y + n_y * margin),
+        Vec2(b_x - n_x * other_margin, b_y - n_y * other_margin))
+
+
+def penetration(shape, other):
+    """ Returns `(depth, normal)` for overlapping convex shapes or None if
+        they don't overlap. Moving `other` by `normal * depth` separates
+        them.
+    """
+    points, margin, other_points, other_margin, simplex, weights, p_x, p_y = \
+        _query(shape, other)
+    if weights is None:
+        depth, (n_x, n_y) = _epa(points, other_points, simplex)
+        return depth + margin + other_margin, Vec2(n_x, n_y)
+    dist = math.hypot(p_x, p_y)
+    depth = margin + other_margin - dist
+    if depth <= 0:
+        return None
+    return depth, Vec2(-p_x / dist, -p_y / dist)
+
+
+def separation(shape, other):
+    """ Distance between convex shapes or negative penetration depth if
+        they overlap.
+    """
+    points, margin, other_points, other_margin, simplex, weights, p_x, p_y = \
+        _query(shape, other)
+    if weights is None:
+        depth, _ = _epa(points, other_points, simplex)
+        return -(depth + margin + other_margin)
+    return math.hypot(p_x, p_y) - margin - other_margin
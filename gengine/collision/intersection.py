@@ -1,8 +1,10 @@
 import functools
-import itertools as it
 from planar import Vec2
 
-from .shapes import Circle, BoundingBox, Polygon
+from .shapes import Circle, BoundingBox, Polygon, with_compact, \
+    with_transformed
+from .moving_shapes import MovingCircle
+from .gjk import separation
 
 
 def inverse(func):
@@ -20,12 +22,15 @@ def moving_circle_to_circle(mcircle, other, border=False):
         return d < (other.radius + mcircle.radius)
 
 
-def moving_circle_to_bbox(mcircle, bbox):
-    p1, p2 = mcircle.seg.points()
+def moving_circle_to_bbox(mcircle, bbox, border=False):
+    p1, p2 = mcircle.seg.points
     r = mcircle.radius
+    c1 = Circle(p1, r)
+    if p1 == p2:
+        # Not moving at all
+        return intersects(c1, bbox, border=border)
     n = mcircle.seg.normal
     # We will check 3 parts - inital and ending positions and shaft between
-    c1 = Circle(p1, r)
     c2 = Circle(p2, r)
     pol = Polygon([
         p1 + n * r,
@@ -34,72 +39,118 @@ def moving_circle_to_bbox(mcircle, bbox):
         p2 + n * r],
         is_convex=True)
     return (
-        intersects(c1, bbox) or
-        intersects(c2, bbox) or
-        intersects(pol, bbox))
+        intersects(c1, bbox, border=border) or
+        intersects(c2, bbox, border=border) or
+        intersects(pol, bbox, border=border))
 
 
 def moving_circle_to_moving_circle(mcircle, other, border=False):
+    # Only the time window both circles move in counts
+    start = max(mcircle.timestamp, other.timestamp)
+    end = min(mcircle.timestamp + mcircle.dt, other.timestamp + other.dt)
+    if start > end:
+        return False
     # Find Closest point of approach (CPA)
     # http://geomalgorithms.com/a07-_distance.html
+    w0 = (mcircle.at(start - mcircle.timestamp).center -
+          other.at(start - other.timestamp).center)
     dv = mcircle.velocity - other.velocity
     # If velocities are equal just assume parallel lines
     if dv.is_null:
         cpa_time = 0
     else:
-        dv2 = dv.dot(dv)
-        w0 = mcircle.center - other.center
-        cpa_time = - w0.dot(dv) / dv2
-
-    if cpa_time <= 0:
-        # We had closes point earlier of directly at start
-        pass  # FIXME
-    elif cpa_time > mcircle.dt and cpa_time > other.dt:
-        pass  # FIXME
-    else:
-        c1 = mcircle.at(cpa_time)
-        c2 = other.at(cpa_time)
-        d = c1.center.distance_to(c2.center)
-        r_sum = c1.radius + c2.radius
-        if d > r_sum:
-            return False
-        if d < r_sum:
-            return True
-        return border
+        cpa_time = - w0.dot(dv) / dv.dot(dv)
+        # We had closest point before or after the window, so the edge of
+        # the window is as close as they get
+        cpa_time = min(max(cpa_time, 0), end - start)
+
+    d = (w0 + dv * cpa_time).length
+    r_sum = mcircle.radius + other.radius
+    if d > r_sum:
+        return False
+    if d < r_sum:
+        return True
+    return border
 
 
+def _convex_pieces(shape):
+    if isinstance(shape, Polygon):
+        return shape.convex_pieces
+    return (shape,)
+
+
+def concave(func):
+    """ Run a test for convex shapes on each pair of convex pieces of
+        polygons. Pieces, whose bounding boxes don't intersect, are skipped.
+    """
+    @functools.wraps(func)
+    def do(shape, other, border=False):
+        pieces = _convex_pieces(shape)
+        other_pieces = _convex_pieces(other)
+        if len(pieces) == 1 and len(other_pieces) == 1:
+            return func(shape, other, border=border)
+        for piece in pieces:
+            bbox = piece.bounding_box
+            for other_piece in other_pieces:
+                if not bbox_to_bbox(
+                        bbox, other_piece.bounding_box, border=border):
+                    continue
+                if func(piece, other_piece, border=border):
+                    return True
+        return False
+    return do
+
+
+def _separated(min_x, max_x, other_min, other_max, border):
+    if border:
+        return min_x > other_max or max_x < other_min
+    return min_x >= other_max or max_x <= other_min
+
+
+@concave
 def polygon_to_bbox(polygon, bbox, border=False):
-    pol2 = bbox.to_polygon()
-    return polygon_to_polygon(polygon, pol2, border=border)
+    # SAT on polygon axes and bbox axes, which are just X and Y
+    b_min_x, b_min_y = bbox.min_point
+    b_max_x, b_max_y = bbox.max_point
+    min_x, min_y, max_x, max_y = polygon.box_extents
+    if _separated(min_x, max_x, b_min_x, b_max_x, border) or \
+            _separated(min_y, max_y, b_min_y, b_max_y, border):
+        return False
+    c_x = (b_min_x + b_max_x) / 2
+    c_y = (b_min_y + b_max_y) / 2
+    half_w = (b_max_x - b_min_x) / 2
+    half_h = (b_max_y - b_min_y) / 2
+    for (a_x, a_y), (min_p, max_p) in zip(polygon.axes, polygon.extents):
+        center = c_x * a_x + c_y * a_y
+        radius = half_w * abs(a_x) + half_h * abs(a_y)
+        if _separated(min_p, max_p, center - radius, center + radius, border):
+            return False
+    return True
 
 
+@concave
 def polygon_to_polygon(polygon, other, border=False):
-    # FIXME: We can skip projecting the owner of edge, cause we can know
-    # exactly where is the maximum point (0, for this normal)
-
     # SAT or Separating Axis Theorem.
     # If we have a plane, on which projections of shapes do not intersect, than
-    # objects don't intersect
-    _seen = set([])
-    for edge in it.chain(polygon.iter_edges(), other.iter_edges()):
-        # Ignore projections on the same normal vectors.
-        # Useful for enhancing paralelogram tests
-        edge_normal = edge.normal
-        if edge_normal in _seen:
-            continue
-        _seen.add(edge.normal)
-        # We project on 1d plane so only 1 coordinate
-        min_x, max_x = polygon.project(edge_normal)
-        other_min, other_max = other.project(edge_normal)
-        if border:
-            if min_x > other_max or max_x < other_min:
-                return False
-        else:
-            if min_x >= other_max or max_x <= other_min:
+    # objects don't intersect. Projections of each polygon on it's own axes
+    # are cached, so only the other one is projected.
+    for owner, projected in ((polygon, other), (other, polygon)):
+        for axis, (min_x, max_x) in zip(owner.axes, owner.extents):
+            other_min, other_max = projected.project_axis(axis)
+            if _separated(min_x, max_x, other_min, other_max, border):
                 return False
     return True
 
 
+@concave
+def convex_to_convex(shape, other, border=False):
+    # General GJK/EPA path for pairs without a dedicated test
+    d = separation(shape, other)
+    if border:
+        return d <= 0
+    return d < 0
+
+
 def circle_to_bbox(circle, bbox, border=False):
     c_center = circle.center
     c_radius = circle.radius
@@ -191,15 +242,24 @@ def bbox_to_bbox(bbox, other, border=False):
             max_x <= other_min_x
             )
 
-_registry = {
+_registry = with_transformed(with_compact({
     (Circle, BoundingBox): circle_to_bbox,
     (BoundingBox, Circle): inverse(circle_to_bbox),
     (Circle, Circle): circle_to_circle,
     (BoundingBox, BoundingBox): bbox_to_bbox,
     (Polygon, BoundingBox): polygon_to_bbox,
     (BoundingBox, Polygon): inverse(polygon_to_bbox),
-    (Polygon, Polygon): polygon_to_polygon
-}
+    (Polygon, Polygon): polygon_to_polygon,
+    (MovingCircle, Circle): moving_circle_to_circle,
+    (Circle, MovingCircle): inverse(moving_circle_to_circle),
+    (MovingCircle, BoundingBox): moving_circle_to_bbox,
+    (BoundingBox, MovingCircle): inverse(moving_circle_to_bbox),
+    (MovingCircle, MovingCircle): moving_circle_to_moving_circle,
+    (Circle, Polygon): convex_to_convex,
+    (Polygon, Circle): convex_to_convex,
+    (MovingCircle, Polygon): convex_to_convex,
+    (Polygon, MovingCircle): convex_to_convex,
+}))
 
 
 def intersects(right, left, border=False):
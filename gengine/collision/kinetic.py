@@ -0,0 +1,221 @@
+import itertools as it
+from heapq import heappush, heappop
+
+from planar import Affine, Vec2
+
+from .shapes import Circle, BoundingBox, Polygon, TransformedPolygon, \
+    with_compact
+from .intersection import intersects
+from .containment import contains
+from .distance import distance
+from .quadtree import QuadTree, MASK_ALL
+
+
+def translate_circle(circle, offset):
+    return Circle(circle.center + offset, circle.radius)
+
+
+def translate_bbox(bbox, offset):
+    return BoundingBox([bbox.min_point + offset, bbox.max_point + offset])
+
+
+def translate_polygon(polygon, offset):
+    return Polygon(
+        [point + offset for point in polygon], is_convex=polygon.is_convex)
+
+
+def translate_transformed(shape, offset):
+    return shape.transformed(Affine.translation(offset))
+
+
+_registry = with_compact({
+    Circle: translate_circle,
+    BoundingBox: translate_bbox,
+    Polygon: translate_polygon,
+    TransformedPolygon: translate_transformed,
+})
+
+
+def translate(shape, offset):
+    """ Copy of `shape` moved by `offset` vector
+    """
+    handler = _registry.get(type(shape))
+    if handler is not None:
+        return handler(shape, offset)
+    raise NotImplementedError
+
+
+class _Trajectory:
+
+    __slots__ = ["shape", "velocity", "timestamp", "end"]
+
+    def __init__(self, shape, velocity, timestamp, end):
+        self.shape = shape
+        self.velocity = velocity
+        self.timestamp = timestamp
+        self.end = end
+
+    def offset_at(self, timestamp):
+        return self.velocity * (timestamp - self.timestamp)
+
+    def shape_at(self, timestamp):
+        if timestamp == self.timestamp or self.velocity.is_null:
+            return self.shape
+        return translate(self.shape, self.offset_at(timestamp))
+
+
+class KineticIndex:
+    """ Index of objects moving with constant velocity. Each object is
+        stored with it's trajectory - shape at `timestamp` and `velocity` -
+        and indexed in a QuadTree by the box it sweeps within `horizon`
+        seconds after that. So objects can be queried at any time in the
+        horizon without updating the index as time goes. Only velocity
+        changes and expired horizons cause reindexing.
+
+        Queries are expected to go forward in time, as objects with expired
+        horizon are reindexed from the queried time on. Objects are not
+        limited to the area of the tree, those that sweep out of it are
+        tested one by one.
+    """
+
+    def __init__(self, *, horizon, center, size, max_level, **options):
+        if horizon <= 0:
+            raise ValueError("`horizon` should be positive")
+        self._horizon = horizon
+        self._tree = QuadTree(
+            center=center, size=size, max_level=max_level, **options)
+        self._bbox = BoundingBox.from_center(center, size, size)
+        self._trajectories = {}
+        # Objects, whose swept boxes stick out of the tree. Tree queries can
+        # miss them, so they are not taken from the tree.
+        self._outside = set([])
+        # Heap of `(end, counter, obj)` for objects to reindex once their
+        # horizon ends. Contains stale records after updates.
+        self._expiry = []
+        self._counter = it.count()
+
+    def _index(self, obj, shape, velocity, timestamp, mask=None):
+        end = timestamp + self._horizon
+        trajectory = _Trajectory(shape, velocity, timestamp, end)
+        self._trajectories[obj] = trajectory
+        start_bbox = shape.bounding_box
+        end_bbox = translate_bbox(start_bbox, trajectory.offset_at(end))
+        swept = BoundingBox([
+            start_bbox.min_point, start_bbox.max_point,
+            end_bbox.min_point, end_bbox.max_point])
+        self._tree.update(swept, obj, mask)
+        if contains(self._bbox, swept):
+            self._outside.discard(obj)
+        else:
+            self._outside.add(obj)
+        heappush(self._expiry, (end, next(self._counter), obj))
+
+    def _advance(self, timestamp):
+        """ Reindex objects, whose horizon ended before `timestamp`
+        """
+        expiry = self._expiry
+        trajectories = self._trajectories
+        while expiry and expiry[0][0] < timestamp:
+            end, _, obj = heappop(expiry)
+            trajectory = trajectories.get(obj)
+            if trajectory is None or trajectory.end != end:
+                # Removed or updated since
+                continue
+            self._index(
+                obj, trajectory.shape_at(timestamp), trajectory.velocity,
+                timestamp)
+
+    def insert(self, shape, velocity, timestamp, obj, mask=MASK_ALL):
+        """ Add `obj` with `shape` at `timestamp` moving with `velocity`
+            in `mask` layers
+        """
+        self._index(obj, shape, velocity, timestamp, mask)
+
+    def update(self, shape, velocity, timestamp, obj, mask=None):
+        """ Set new trajectory of `obj`. Nothing is reindexed if `obj` just
+            continued to move along the old one. Layer `mask` is kept unless
+            a new one is passed.
+        """
+        trajectory = self._trajectories.get(obj)
+        if trajectory is not None and trajectory.velocity == velocity and \
+                timestamp <= trajectory.end and (
+                    mask is None or mask == self._tree.get_mask(obj)):
+            bbox = shape.bounding_box
+            expected = translate_bbox(
+                trajectory.shape.bounding_box,
+                trajectory.offset_at(timestamp))
+            if bbox.min_point.almost_equals(expected.min_point) and \
+                    bbox.max_point.almost_equals(expected.max_point):
+                return
+        self._index(obj, shape, velocity, timestamp, mask)
+
+    def remove(self, obj):
+        if self._trajectories.pop(obj, None) is not None:
+            self._tree.remove(obj)
+            self._outside.discard(obj)
+
+    def shape_at(self, obj, timestamp):
+        """ Shape of `obj` at `timestamp`
+        """
+        return self._trajectories[obj].shape_at(timestamp)
+
+    def query_iter(self, query_shape, timestamp, mask=MASK_ALL):
+        """ Yield objects in `mask` layers, whose shapes intersect
+            `query_shape` at `timestamp`.
+        """
+        self._advance(timestamp)
+        trajectories = self._trajectories
+        outside = self._outside
+        for obj in self._tree.query_iter(query_shape, mask):
+            if obj in outside:
+                continue
+            shape = trajectories[obj].shape_at(timestamp)
+            if intersects(query_shape, shape):
+                yield obj
+        for obj in list(outside):
+            if not self._tree.get_mask(obj) & mask:
+                continue
+            shape = trajectories[obj].shape_at(timestamp)
+            if intersects(query_shape, shape):
+                yield obj
+
+    def query(self, query_shape, timestamp, mask=MASK_ALL):
+        return list(self.query_iter(query_shape, timestamp, mask))
+
+    def nearest(self, point, timestamp, k=None, max_radius=None,
+                mask=MASK_ALL):
+        """ Return up to `k` objects in `mask` layers closest to `point` at
+            `timestamp` sorted by distance to their shapes. Distance to the
+            swept box of an object is never more, than to the object itself,
+            so objects are taken from the tree best-first and returned once
+            no closer one can follow.
+        """
+        if not isinstance(point, Vec2):
+            point = Vec2(*point)
+        result = []
+        if k is not None and k <= 0:
+            return result
+        self._advance(timestamp)
+        trajectories = self._trajectories
+        outside = self._outside
+        counter = it.count()
+        heap = []
+        for obj in outside:
+            if not self._tree.get_mask(obj) & mask:
+                continue
+            d = distance(trajectories[obj].shape_at(timestamp), point)
+            if max_radius is None or d <= max_radius:
+                heappush(heap, (d, next(counter), obj))
+        for bound, obj in self._tree.nearest_iter(point, max_radius, mask):
+            if obj in outside:
+                continue
+            while heap and heap[0][0] <= bound:
+                result.append(heappop(heap)[2])
+                if len(result) == k:
+                    return result
+            d = distance(trajectories[obj].shape_at(timestamp), point)
+            if max_radius is None or d <= max_radius:
+                heappush(heap, (d, next(counter), obj))
+        while heap and len(result) != k:
+            result.append(heappop(heap)[2])
+        return result
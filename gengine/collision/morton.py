@@ -0,0 +1,53 @@
+""" Helpers for Morton (Z-order) codes of QuadTree cells.
+
+    Each level of the tree adds 2 bits to the code - `(y_bit << 1) | x_bit`,
+    so sorting by the code groups cells by their common parent nodes.
+"""
+
+# Morton quadrant digit to index in `_QuadNode.nodes` (nw, ne, se, sw)
+MORTON_TO_CHILD = (3, 2, 0, 1)
+
+
+def morton_code(x, y):
+    """ Interleave bits of integer cell coordinates `x` and `y`
+    """
+    code = 0
+    shift = 0
+    while x or y:
+        code |= ((x & 1) | ((y & 1) << 1)) << shift
+        x >>= 1
+        y >>= 1
+        shift += 2
+    return code
+
+
+def morton_digit(code, level, depth):
+    """ Quadrant digit of `code` at `level` (1 based) of a tree `depth` deep
+    """
+    return (code >> (2 * (depth - level))) & 3
+
+
+def common_level(code, other, depth):
+    """ Deepest level shared by paths of 2 cell codes
+    """
+    diff = code ^ other
+    return depth - (diff.bit_length() + 1) // 2
+
+
+def cell_range(min_value, max_value, origin, cell_size):
+    """ Range of cells `[first, last]`, that a segment intersects. Segment
+        ends lying on the cell border do not count as intersection.
+    """
+    first = int((min_value - origin) // cell_size)
+    last = -int((origin - max_value) // cell_size) - 1
+    return first, last
+
+
+def grid_range(min_value, max_value, origin, cell_size, cells):
+    """ Same as `cell_range`, but kept within a grid of `cells` cells in case
+        of rounding errors
+    """
+    first, last = cell_range(min_value, max_value, origin, cell_size)
+    first = min(max(first, 0), cells - 1)
+    last = min(max(last, first), cells - 1)
+    return first, last
@@ -1,5 +1,5 @@
-from .shapes import Shape, LineSegment
-from gengine.util import lazy_property
+from .shapes import Shape, LineSegment, Circle
+from gengine.utils import lazy_property
 
 
 class MovingShape(Shape):
@@ -9,6 +9,10 @@ class MovingShape(Shape):
 
 
 class MovingCircle(MovingShape):
+    """ Circle moving with constant velocity from `seg.start` at `timestamp`
+        to `seg.end` at `timestamp + dt`. Covers the whole swept area, so
+        can be used to query all objects it can touch in that time window.
+    """
 
     def __init__(self, seg, radius, timestamp, dt):
         self.seg = seg
@@ -20,9 +24,26 @@ class MovingCircle(MovingShape):
     def from_velocity(cls, initial_circle, velocity, timestamp, dt):
         initial = initial_circle.center
         radius = initial_circle.radius
-        seg = LineSegment.from_points(initial, velocity * dt)
+        seg = LineSegment.from_points([initial, initial + velocity * dt])
         return cls(seg, radius, timestamp, dt)
 
+    @property
+    def center(self):
+        """ Center at `timestamp`
+        """
+        return self.seg.start
+
+    @property
+    def velocity(self):
+        if not self.dt:
+            return self.seg.vector * 0
+        return self.seg.vector / self.dt
+
+    def at(self, dt):
+        """ Circle at `timestamp + dt`
+        """
+        return Circle(self.center + self.velocity * dt, self.radius)
+
     @lazy_property
     def bounding_box(self):
         return self.seg.bounding_box.inflate(self.radius*2)
@@ -34,6 +55,7 @@ class MovingCircle(MovingShape):
     def __repr__(self):
         """Precise string representation."""
         return "MovingCircle(%s, %s, %s, %s, %s)" % (
-            self.initial, self.ending, self.radius, self.timestamp, self.dt)
+            self.seg.start, self.seg.end, self.radius, self.timestamp,
+            self.dt)
 
     __str__ = __repr__
@@ -0,0 +1,115 @@
+from .morton import morton_code, cell_range
+
+
+class OccupancyGrid:
+    """ Bitset of occupied max level cells of a QuadTree, addressed by Morton
+        code. Used as an acceleration layer for range queries - query bbox is
+        turned into a mask of covered cells and candidates are found with
+        integer mask operations, without walking the nodes.
+
+        Morton code is `x_bits | y_bits` where both parts have no common
+        bits, so mask of a cell rectangle is just a product of masks of its
+        columns and rows.
+    """
+
+    def __init__(self, bbox, max_level):
+        self._min_x, self._min_y = bbox.min_point
+        self._cells = cells = 1 << max_level
+        self._cell_size = bbox.width / cells
+        # `_x_prefix[i]` is a mask of columns [0, i), same for rows.
+        self._x_prefix = x_prefix = [0]
+        self._y_prefix = y_prefix = [0]
+        for i in range(cells):
+            x_prefix.append(x_prefix[-1] | (1 << morton_code(i, 0)))
+            y_prefix.append(y_prefix[-1] | (1 << morton_code(0, i)))
+        self.clear()
+
+    def clear(self):
+        self._occupied = 0
+        self._objects = {}
+        self._ranges = {}
+
+    def _cell_range(self, bbox):
+        """ Covered cells as `(first_x, last_x, first_y, last_y)` clipped to
+            grid bounds or None if bbox is outside of grid.
+        """
+        min_x, min_y = bbox.min_point
+        max_x, max_y = bbox.max_point
+        last = self._cells - 1
+        x, last_x = cell_range(min_x, max_x, self._min_x, self._cell_size)
+        y, last_y = cell_range(min_y, max_y, self._min_y, self._cell_size)
+        x = max(x, 0)
+        y = max(y, 0)
+        last_x = min(last_x, last)
+        last_y = min(last_y, last)
+        if x > last_x or y > last_y:
+            return None
+        return x, last_x, y, last_y
+
+    def mask(self, cells):
+        """ Mask of all cells in `(first_x, last_x, first_y, last_y)` range
+        """
+        x, last_x, y, last_y = cells
+        x_mask = self._x_prefix[last_x + 1] ^ self._x_prefix[x]
+        y_mask = self._y_prefix[last_y + 1] ^ self._y_prefix[y]
+        return x_mask * y_mask
+
+    def add(self, bbox, item):
+        _, obj = item
+        cells = self._cell_range(bbox)
+        self._ranges[obj] = cells
+        if cells is None:
+            return
+        objects = self._objects
+        x, last_x, y, last_y = cells
+        for cell_y in range(y, last_y + 1):
+            for cell_x in range(x, last_x + 1):
+                code = morton_code(cell_x, cell_y)
+                cell = objects.get(code)
+                if cell is None:
+                    cell = objects[code] = {}
+                cell[obj] = item
+        self._occupied |= self.mask(cells)
+
+    def discard(self, obj):
+        cells = self._ranges.pop(obj, None)
+        if cells is None:
+            return
+        objects = self._objects
+        x, last_x, y, last_y = cells
+        for cell_y in range(y, last_y + 1):
+            for cell_x in range(x, last_x + 1):
+                code = morton_code(cell_x, cell_y)
+                cell = objects[code]
+                del cell[obj]
+                if not cell:
+                    del objects[code]
+                    self._occupied &= ~(1 << code)
+
+    def update(self, bbox, item):
+        _, obj = item
+        cells = self._cell_range(bbox)
+        if cells is not None and self._ranges.get(obj) == cells:
+            # Same cells, just replace stored shape
+            x, last_x, y, last_y = cells
+            objects = self._objects
+            for cell_y in range(y, last_y + 1):
+                for cell_x in range(x, last_x + 1):
+                    objects[morton_code(cell_x, cell_y)][obj] = item
+            return
+        self.discard(obj)
+        self.add(bbox, item)
+
+    def query(self, bbox):
+        """ Yield `(shape, obj)` items of all cells bbox covers. Objects
+            spanning several cells are yielded for each of them.
+        """
+        cells = self._cell_range(bbox)
+        if cells is None:
+            return
+        hits = self.mask(cells) & self._occupied
+        objects = self._objects
+        while hits:
+            low = hits & -hits
+            hits ^= low
+            yield from objects[low.bit_length() - 1].values()
@@ -0,0 +1,309 @@
+""" Narrow phase over a process pool. Candidate pairs from a broad phase are
+    tested in worker processes, so a large collision pass is not limited to
+    one core by the GIL.
+
+    Shapes are never pickled. Each shape is packed once into flat float
+    arrays in `multiprocessing.shared_memory` blocks, pairs are stored as
+    indexes of those shapes and workers get only block names and a range of
+    pairs to test. Every worker writes results at the indexes of it's pairs,
+    so result order is the same as the order of pairs, whatever order the
+    chunks finish in.
+"""
+import math
+import multiprocessing
+from array import array
+
+from planar import Vec2
+
+from .shapes import Circle, BoundingBox, Polygon, TransformedPolygon, \
+    LineSegment, CompactCircle, CompactBox, with_compact
+from .moving_shapes import MovingCircle
+from .intersection import intersects
+from .gjk import penetration
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+# By default all pairs are tested in process. Below some number of pairs
+# copying shapes to shared memory and waking workers costs more, than the
+# tests themselves, and that number depends on the machine. Measure it with
+# `benchmarks/bench_parallel.py` and pass it as `min_pairs`.
+MIN_PARALLEL_PAIRS = None
+# Pairs are split into this many chunks per worker to even out the load
+CHUNKS_PER_PROCESS = 4
+
+CIRCLE, BBOX, POLYGON, MOVING_CIRCLE = range(4)
+
+
+def _pack_circle(circle):
+    x, y = circle.center
+    return CIRCLE, (x, y, circle.radius)
+
+
+def _pack_bbox(bbox):
+    min_x, min_y = bbox.min_point
+    max_x, max_y = bbox.max_point
+    return BBOX, (min_x, min_y, max_x, max_y)
+
+
+def _pack_polygon(polygon):
+    """ Convexity flag, number of vertices and vertices. Concave polygons
+        are followed by their convex pieces in the same layout, so workers
+        don't decompose them again.
+    """
+    values = _polygon_values(polygon)
+    if not polygon.is_convex:
+        for piece in polygon.convex_pieces:
+            values.extend(_polygon_values(piece))
+    return POLYGON, values
+
+
+def _polygon_values(polygon):
+    values = [float(polygon.is_convex), len(polygon)]
+    values.extend(c for vertex in polygon.vertices for c in vertex)
+    return values
+
+
+def _pack_transformed(shape):
+    return _pack_polygon(shape.polygon)
+
+
+def _pack_moving_circle(mcircle):
+    start_x, start_y = mcircle.seg.start
+    end_x, end_y = mcircle.seg.end
+    return MOVING_CIRCLE, (
+        start_x, start_y, end_x, end_y, mcircle.radius, mcircle.timestamp,
+        mcircle.dt)
+
+
+_packers = with_compact({
+    Circle: _pack_circle,
+    BoundingBox: _pack_bbox,
+    Polygon: _pack_polygon,
+    TransformedPolygon: _pack_transformed,
+    MovingCircle: _pack_moving_circle,
+})
+
+
+def _unpack(kind, values):
+    if kind == CIRCLE:
+        x, y, radius = values
+        return CompactCircle((x, y), radius)
+    if kind == BBOX:
+        return CompactBox(*values)
+    if kind == POLYGON:
+        polygon, end = _unpack_polygon(values, 0)
+        if end < len(values):
+            pieces = []
+            while end < len(values):
+                piece, end = _unpack_polygon(values, end)
+                pieces.append(piece)
+            # Set the lazy property to pieces, decomposed before packing
+            polygon.__dict__["convex_pieces"] = tuple(pieces)
+        return polygon
+    start_x, start_y, end_x, end_y, radius, timestamp, dt = values
+    seg = LineSegment.from_points(
+        [Vec2(start_x, start_y), Vec2(end_x, end_y)])
+    return MovingCircle(seg, radius, timestamp, dt)
+
+
+def _unpack_polygon(values, start):
+    """ Polygon, packed at `start` of `values`, and the offset after it
+    """
+    end = start + 2 + int(values[start + 1]) * 2
+    polygon = Polygon([
+        Vec2(values[i], values[i + 1]) for i in range(start + 2, end, 2)],
+        is_convex=bool(values[start]))
+    return polygon, end
+
+
+def _test_pair(shape, other, border, contacts):
+    if not contacts:
+        return intersects(shape, other, border=border)
+    return penetration(shape, other)
+
+
+def _run_chunk(task):
+    """ Test pairs `[start, end)` in a worker, reading shapes from and
+        writing results to shared memory blocks
+    """
+    names, shape_count, start, end, border, contacts = task
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    data = blocks[0].buf.cast('d')
+    table = blocks[1].buf.cast('q')
+    results = blocks[2].buf.cast('d' if contacts else 'B')
+    try:
+        # Table is kinds of shapes, their offsets in data with one more for
+        # the end of the last shape and pairs of shape indexes
+        offsets = shape_count
+        pairs = shape_count * 2 + 1
+        shapes = {}
+        for k in range(start, end):
+            pair = []
+            for i in (table[pairs + k * 2], table[pairs + k * 2 + 1]):
+                shape = shapes.get(i)
+                if shape is None:
+                    # Slice is dropped right away, as blocks can not be
+                    # closed while views into them exist
+                    shape = shapes[i] = _unpack(table[i], data[
+                        table[offsets + i]:table[offsets + i + 1]].tolist())
+                pair.append(shape)
+            result = _test_pair(pair[0], pair[1], border, contacts)
+            if not contacts:
+                results[k] = bool(result)
+            elif result is None:
+                results[k * 3] = math.nan
+            else:
+                depth, normal = result
+                results[k * 3] = depth
+                results[k * 3 + 1] = normal.x
+                results[k * 3 + 2] = normal.y
+    finally:
+        for view in (data, table, results):
+            view.release()
+        for block in blocks:
+            block.close()
+
+
+def _check_shared_memory():
+    if shared_memory is None:
+        raise RuntimeError(
+            "Parallel narrow phase requires `multiprocessing.shared_memory` "
+            "(Python 3.8+)")
+
+
+def _create_block(values):
+    """ Shared memory block with contents of `values` array
+    """
+    data = values.tobytes()
+    # Blocks can not be empty
+    block = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+    block.buf[:len(data)] = data
+    return block
+
+
+class ParallelNarrowPhase:
+    """ Tests candidate pairs of shapes in a pool of `processes` workers
+        (number of CPUs by default). Pool is started on first use and
+        should be closed with `close()` or by using executor as a context
+        manager. Pairs are only tested in workers if there are at least
+        `min_pairs` of them, by default all are tested in process.
+
+        Results always follow the order of pairs.
+    """
+
+    def __init__(self, processes=None, *, min_pairs=MIN_PARALLEL_PAIRS):
+        _check_shared_memory()
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        if processes < 1:
+            raise ValueError("`processes` should be at least 1")
+        self._processes = processes
+        self._min_pairs = min_pairs
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def intersects(self, pairs, border=False):
+        """ List of `intersects(shape, other, border)` for each
+            `(shape, other)` pair
+        """
+        return self._run(list(pairs), border, False)
+
+    def contacts(self, pairs):
+        """ List of `penetration(shape, other)` for each `(shape, other)`
+            pair - `(depth, normal)` or None if shapes do not overlap
+        """
+        return self._run(list(pairs), False, True)
+
+    def _run(self, pairs, border, contacts):
+        min_pairs = self._min_pairs
+        if min_pairs is None or len(pairs) < max(min_pairs, 1) or \
+                self._processes == 1:
+            return [
+                _test_pair(shape, other, border, contacts)
+                for shape, other in pairs]
+
+        kinds, offsets, data, pair_indexes = self._pack(pairs)
+        shape_count = len(kinds)
+        pair_count = len(pairs)
+        table = array('q', kinds)
+        table.extend(offsets)
+        table.extend(pair_indexes)
+        if contacts:
+            results = array('d', [0.0]) * (pair_count * 3)
+        else:
+            results = array('B', [0]) * pair_count
+
+        blocks = []
+        try:
+            for values in (data, table, results):
+                blocks.append(_create_block(values))
+            names = tuple(block.name for block in blocks)
+            chunks = self._processes * CHUNKS_PER_PROCESS
+            size = -(-pair_count // chunks)
+            tasks = [
+                (names, shape_count, start, min(start + size, pair_count),
+                 border, contacts)
+                for start in range(0, pair_count, size)]
+            self._get_pool().map(_run_chunk, tasks)
+            view = blocks[2].buf.cast('d' if contacts else 'B')
+            try:
+                if not contacts:
+                    return [bool(hit) for hit in view]
+                output = []
+                for k in range(pair_count):
+                    depth = view[k * 3]
+                    if math.isnan(depth):
+                        output.append(None)
+                    else:
+                        output.append((depth, Vec2(
+                            view[k * 3 + 1], view[k * 3 + 2])))
+                return output
+            finally:
+                view.release()
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def _pack(self, pairs):
+        """ Pack each distinct shape once. Returns kinds and data offsets of
+            shapes, their packed data and shape indexes of pairs.
+        """
+        kinds = array('q')
+        offsets = array('q', [0])
+        data = array('d')
+        indexes = {}
+        pair_indexes = array('q')
+        for pair in pairs:
+            for shape in pair:
+                i = indexes.get(id(shape))
+                if i is None:
+                    packer = _packers.get(type(shape))
+                    if packer is None:
+                        raise NotImplementedError
+                    kind, values = packer(shape)
+                    i = indexes[id(shape)] = len(kinds)
+                    kinds.append(kind)
+                    data.extend(values)
+                    offsets.append(len(data))
+                pair_indexes.append(i)
+        return kinds, offsets, data, pair_indexes
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(self._processes)
+        return self._pool
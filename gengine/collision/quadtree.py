@@ -1,29 +1,142 @@
+import itertools as it
+from bisect import bisect_left
+from heapq import heappush, heappop
 from planar import Vec2
-from .shapes import BoundingBox
+from .shapes import BoundingBox, CompactBox
 from .intersection import intersects
 from .containment import contains
+from .distance import distance, bbox_distance
+from .raycast import ray_distance, bbox_ray_distance
+from .occupancy import OccupancyGrid
+from .broadphase import overlap_origin, owned_area, _box, _boxes_overlap
+from .flat_quadtree import FlatQuadNodes, MASK_ALL
+from .morton import (
+    MORTON_TO_CHILD, morton_code, morton_digit, common_level, cell_range,
+    grid_range)
+from . import batch
+
+# Queries with at least this many candidates are filtered in one batch, if
+# NumPy is installed
+BATCH_MIN_CANDIDATES = 32
+
+# Occupancy grid takes `O(2 ** L * 4 ** L)` bits for max level L and
+# removals do big integer work over it. Above this level it takes more memory
+# and answers fewer queries than the nodes alone (see
+# `benchmarks/bench_quadtree.py`)
+MAX_OCCUPANCY_LEVEL = 8
+
+
+def _join_entries(entries, other_entries):
+    """ Yield `(item, other)` for `(bbox, item)` entries with overlapping
+        bboxes
+    """
+    for bbox, item in entries:
+        box = _box(bbox)
+        for other_bbox, other in other_entries:
+            if _boxes_overlap(box, _box(other_bbox)):
+                yield item, other
+
+
+def _join_below(entries, nodes, view):
+    """ Yield `(item, other)` for `entries` and overlapping entries in
+        subtrees of `nodes`. Entries are filtered by bounds of each node on
+        the way down.
+    """
+    bounds, node_entries, children = view
+    stack = [(node, entries) for node in nodes]
+    while stack:
+        node, entries = stack.pop()
+        box = bounds(node)
+        entries = [
+            entry for entry in entries if _boxes_overlap(_box(entry[0]), box)]
+        if not entries:
+            continue
+        yield from _join_entries(entries, node_entries(node))
+        stack.extend((child, entries) for child in children(node))
+
+
+def _unique(items):
+    """ Skip `(shape, obj)` items of objects, that were already met
+    """
+    _seen = set([])
+    for shape, obj in items:
+        if obj in _seen:
+            continue
+        _seen.add(obj)
+        yield shape, obj
+
+
+def _node_bounds(node):
+    return _box(node._bbox)
+
+
+def _node_entries(node):
+    return node._objects
+
+
+def _node_children(node):
+    return node.nodes
 
 
 class _QuadNode:
+    """ Node of a region QuadTree.
+
+        If `max_objects` is None, objects are pushed down to every max level
+        node their bbox intersects (or nodes their bbox covers entirely).
+        Otherwise node only splits once it holds more than `max_objects`
+        objects. Each object is then held by the deepest node, that
+        contains it, and sibling leaves merge back into their parent when
+        there are less than `max_objects` objects left in them.
+
+        Every node also keeps the number of objects in it's subtree. Objects
+        held by several nodes are only counted by the one, that contains
+        minimum corner of their bbox.
+    """
 
     def __init__(self, parent, bbox, level, *,
-                 max_level=None, max_objects=None):
+                 max_level=None, max_objects=None, handles=None, masks=None):
         self._parent = parent
+        # Region of this node in the tree subdivision
+        self._cell = bbox
+        # Region, that all objects of the node are within. Same as `_cell`
+        # for regular nodes.
         self._bbox = bbox
         self._level = level
         self._objects = []
+        # OR of masks of all objects in the subtree
+        self._mask = 0
+        # Number of objects in the subtree, see `_owns`
+        self._count = 0
         # Nodes
         self._nw = None
         self._sw = None
         self._ne = None
         self._se = None
 
-        if max_level is None:
+        if parent is not None:
             max_level = parent._max_level
-        self._max_level = max_level
-        if max_objects is None:
             max_objects = parent._max_objects
+            handles = parent._handles
+            masks = parent._masks
+            root = parent._root_bounds
+        else:
+            root = _box(bbox)
+        self._max_level = max_level
         self._max_objects = max_objects
+        # Holders of each object, shared by all nodes of the tree. Used to
+        # move objects between nodes on split and merge.
+        self._handles = handles
+        # Layer mask of each object, shared by all nodes of the tree.
+        # Objects without one are in all layers.
+        self._masks = masks
+        # Bounds of the root cell
+        self._root_bounds = root
+
+    @property
+    def holds_once(self):
+        """ True if each object is held by a single node only
+        """
+        return self._max_objects is not None
 
     @property
     def nodes(self):
@@ -38,9 +151,9 @@ class _QuadNode:
         if level == self._max_level:
             raise RuntimeError("Already splitted to max level")
 
-        min_point = self._bbox.min_point
-        max_point = self._bbox.max_point
-        center_point = self._bbox.center
+        min_point = self._cell.min_point
+        max_point = self._cell.max_point
+        center_point = self._cell.center
         min_x, min_y = min_point
         max_x, max_y = max_point
         c_x, c_y = center_point
@@ -63,10 +176,15 @@ class _QuadNode:
             bbox=BoundingBox([Vec2(c_x, min_y), Vec2(max_x, c_y)]),
             level=new_level)
 
-    def get_all_objects(self):
+    def get_all_objects(self, mask=MASK_ALL):
+        """ Yield all entries of the subtree. Subtrees without objects in
+            `mask` layers are skipped.
+        """
+        if not self._mask & mask:
+            return
         yield from self._objects
         for node in self.nodes:
-            yield from node.get_all_objects()
+            yield from node.get_all_objects(mask)
 
     def clear(self):
         # Clear all children
@@ -74,68 +192,477 @@ class _QuadNode:
             node.clear()
         # Clear itself then
         self._objects.clear()
+        self._mask = 0
+        self._count = 0
         # Clear nodes if we had any
         self._nw = None
         self._sw = None
         self._ne = None
         self._se = None
 
-    def insert(self, bbox, obj):
+    def insert(self, bbox, obj, holders=None):
+        """ Insert `obj` into all nodes, that `bbox` intersects. Nodes, that
+            actually hold the object are appended to `holders` list.
+        """
+        if self._max_objects is not None:
+            self._insert_adaptive(bbox, obj, holders)
+            return
         # FIXME: We probably can lower the intersection and contains checks.
 
         # If bbox covers all of this node - add it to objects list and exit.
         if contains(bbox, self._bbox):
-            self._objects.append((bbox, obj))
+            self._add(bbox, obj, holders)
             return
         if not intersects(bbox, self._bbox):
             return
         # If we reached the maximum level of detalisation we will just add it
         # to list of objects
         if self._level == self._max_level:
-            self._objects.append((bbox, obj))
+            self._add(bbox, obj, holders)
             return
 
         # Check all children for intersections
         if not self.nodes:
             self.split()
         for node in self.nodes:
-            node.insert(bbox, obj)
-
-    def remove(self, remove_obj):
-        to_remove = None
-        for pair in self._objects:
-            _, (_, obj) = pair
-            if obj is remove_obj:
-                to_remove = pair
-                # Not like we can insert more than 1 obj.
-                break
-        if to_remove is not None:
-            self._objects.remove(to_remove)
-        empty = True
+            node.insert(bbox, obj, holders)
+
+    def _add(self, bbox, obj, holders):
+        self._objects.append((bbox, obj))
+        if holders is not None:
+            holders.append(self)
+        self._include(self._mask_of(obj))
+        if self._owns(bbox):
+            self._add_count(1)
+
+    def _owns(self, bbox):
+        """ True if object with `bbox` held by this node is counted by it.
+            If objects can be held by several nodes, only the node, that
+            contains minimum corner of bbox counts it.
+        """
+        if self.holds_once:
+            return True
+        min_x, min_y, max_x, max_y = owned_area(
+            _box(self._cell), self._root_bounds)
+        x, y = bbox.min_point
+        return min_x <= x < max_x and min_y <= y < max_y
+
+    def _add_count(self, delta):
+        """ Add `delta` to object counts of this node and it's ancestors
+        """
+        node = self
+        while node is not None:
+            node._count += delta
+            node = node._parent
+
+    def _mask_of(self, item):
+        if self._masks is None:
+            return MASK_ALL
+        _, obj = item
+        return self._masks.get(obj, MASK_ALL)
+
+    def _include(self, mask):
+        """ Add `mask` to masks of this node and it's ancestors
+        """
+        node = self
+        while node is not None and mask & ~node._mask:
+            node._mask |= mask
+            node = node._parent
+
+    def _refresh_mask(self):
+        """ Recompute masks from this node up to the root after objects
+            were removed
+        """
+        node = self
+        while node is not None:
+            mask = 0
+            for _, item in node._objects:
+                mask |= node._mask_of(item)
+            for child in node.nodes:
+                mask |= child._mask
+            if mask == node._mask:
+                return
+            node._mask = mask
+            node = node._parent
+
+    def _child_for(self, bbox):
+        """ Child node, that fully contains `bbox` if any
+        """
+        for node in self.nodes:
+            if contains(node._bbox, bbox):
+                return node
+        return None
+
+    def _insert_adaptive(self, bbox, obj, holders):
+        if not intersects(bbox, self._bbox):
+            return
+        node = self
+        child = node._child_for(bbox)
+        while child is not None:
+            node = child
+            child = node._child_for(bbox)
+        node._add(bbox, obj, holders)
+        node._split_full()
+
+    def _move(self, index, node):
+        """ Move object at `index` to `node` and update it's holders
+        """
+        entry = self._objects.pop(index)
+        node._objects.append(entry)
+        bbox, item = entry
+        node._include(self._mask_of(item))
+        if self._owns(bbox):
+            self._add_count(-1)
+        if node._owns(bbox):
+            node._add_count(1)
+        _, obj = item
+        holders = self._handles.get(obj)
+        if holders is not None:
+            holders[holders.index(self)] = node
+
+    def _split_full(self):
+        """ Split node if it holds more than `max_objects` and push down
+            objects, that fit in a single child.
+        """
+        if (len(self._objects) <= self._max_objects or
+                self._level == self._max_level or self.nodes):
+            return
+        self.split()
+        for i in reversed(range(len(self._objects))):
+            bbox, _ = self._objects[i]
+            child = self._child_for(bbox)
+            if child is not None:
+                self._move(i, child)
         for node in self.nodes:
-            # Remove call will return True if this was the last object
-            empty = empty and node.remove(remove_obj)
-        if empty:
-            self._nw = None
-            self._sw = None
-            self._ne = None
-            self._se = None
-            return not self._objects
-        return False
-
-    def query(self, bbox):
+            node._split_full()
+
+    def _merge_sparse(self):
+        """ Merge leaf children back into node if they hold less than
+            `max_objects` together. Repeated up to the root.
+        """
+        node = self if self.nodes else self._parent
+        while node is not None:
+            children = node.nodes
+            if any(child.nodes for child in children):
+                return
+            total = len(node._objects)
+            total += sum(len(child._objects) for child in children)
+            if total >= node._max_objects:
+                return
+            for child in children:
+                for i in reversed(range(len(child._objects))):
+                    child._move(i, node)
+            node._nw = None
+            node._sw = None
+            node._ne = None
+            node._se = None
+            node = node._parent
+
+    def insert_cells(self, entries):
+        """ Insert presorted `(code, bbox, obj, holders)` entries, where code
+            is the Morton code of the max level cell containing `bbox`.
+            Nodes on the path shared with the previous entry are reused, so
+            no containment checks are done at all.
+        """
+        if self._max_objects is not None:
+            codes = [entry[0] for entry in entries]
+            self._insert_cells_adaptive(entries, codes, 0, len(entries), 0)
+            return
+        depth = self._max_level - self._level
+        path = [self]
+        prev_code = None
+        for code, bbox, obj, holders in entries:
+            if prev_code is not None:
+                del path[common_level(code, prev_code, depth) + 1:]
+            node = path[-1]
+            for level in range(len(path), depth + 1):
+                if not node.nodes:
+                    node.split()
+                node = node.nodes[
+                    MORTON_TO_CHILD[morton_digit(code, level, depth)]]
+                path.append(node)
+            node._add(bbox, obj, holders)
+            prev_code = code
+
+    def _insert_cells_adaptive(self, entries, codes, lo, hi, base):
+        """ Place `entries[lo:hi]` into this node, which covers codes from
+            `base`, splitting it while it would hold more than `max_objects`
+        """
+        if hi - lo <= self._max_objects or self._level == self._max_level:
+            for _, bbox, obj, holders in entries[lo:hi]:
+                self._add(bbox, obj, holders)
+            return
+        self.split()
+        span = 4 ** (self._max_level - self._level - 1)
+        nodes = self.nodes
+        start = lo
+        for digit in range(4):
+            end = bisect_left(codes, base + (digit + 1) * span, start, hi)
+            nodes[MORTON_TO_CHILD[digit]]._insert_cells_adaptive(
+                entries, codes, start, end, base + digit * span)
+            start = end
+
+    def _index_of(self, remove_obj):
+        # Objects are keys of `QuadTree._handles`, so match them the same
+        # way as dict does
+        for i, (_, (_, obj)) in enumerate(self._objects):
+            if obj is remove_obj or obj == remove_obj:
+                return i
+        raise ValueError("Object is not in node")
+
+    def _collapse(self):
+        """ Drop empty children from this node up to the root
+        """
+        node = self
+        while node is not None:
+            for child in node.nodes:
+                if child._objects or child.nodes:
+                    return
+            node._nw = None
+            node._sw = None
+            node._ne = None
+            node._se = None
+            if node._objects:
+                return
+            node = node._parent
+
+    def discard(self, holders, remove_obj):
+        """ Remove `obj` from `holders` nodes, as returned by `insert`.
+        """
+        for node in holders:
+            bbox, _ = node._objects.pop(node._index_of(remove_obj))
+            if node._owns(bbox):
+                node._add_count(-1)
+            node._refresh_mask()
+            if node._max_objects is None:
+                node._collapse()
+            else:
+                node._merge_sparse()
+
+    def relocate(self, holders, bbox, item):
+        """ Replace `item` bbox in place if it would still be held by the
+            same nodes. Returns False if the item needs to be reinserted.
+        """
+        if len(holders) != 1:
+            return False
+        node, = holders
+        if not contains(node._bbox, bbox):
+            return False
+        if node._max_objects is None:
+            if node._level != node._max_level:
+                return False
+        elif node._child_for(bbox) is not None:
+            return False
+        _, obj = item
+        i = node._index_of(obj)
+        old_bbox, _ = node._objects[i]
+        node._objects[i] = (bbox, item)
+        delta = node._owns(bbox) - node._owns(old_bbox)
+        if delta:
+            node._add_count(delta)
+        return True
+
+    def query(self, bbox, mask=MASK_ALL):
+        """ Yield entries of nodes `bbox` intersects. Subtrees without
+            objects in `mask` layers are skipped, but entries are not
+            filtered by their own masks.
+        """
         # FIXME: When querying we can take height and width to produce a binary
         #        mask of all lowest level quadrants to query for objects
         #        This can add the ability to work with binary masks and
         #        operations to determine intersections, which is very efficient
+        if not self._mask & mask:
+            return
         if contains(bbox, self._bbox):
             # return all objects
-            yield from self.get_all_objects()
+            yield from self.get_all_objects(mask)
             return
-        if intersects(bbox, self._bbox):
-            yield from self._objects
+        if not intersects(bbox, self._bbox):
+            # Children are inside of this node, so no need to go deeper
+            return
+        yield from self._objects
         for node in self.nodes:
-            yield from node.query(bbox)
+            yield from node.query(bbox, mask)
+
+    def _covered_by(self, box):
+        """ True if all objects counted in the subtree overlap `box` and no
+            other objects are counted there for it
+        """
+        min_x, min_y, max_x, max_y = box
+        n_min_x, n_min_y, n_max_x, n_max_y = _box(self._bbox)
+        if not (min_x <= n_min_x and n_max_x <= max_x and
+                min_y <= n_min_y and n_max_y <= max_y):
+            return False
+        if self.holds_once:
+            return True
+        # Objects crossing min sides of `box` are counted by the node with
+        # the minimum corner of their overlap with `box` instead
+        root_min_x, root_min_y, _, _ = self._root_bounds
+        return ((min_x < n_min_x or min_x <= root_min_x) and
+                (min_y < n_min_y or min_y <= root_min_y))
+
+    def _counts_in(self, bbox, box):
+        """ Number of objects of this node alone, that overlap `box`. Same
+            as for `iter_pairs` only the node, that contains minimum corner
+            of the overlap counts an object held by several nodes.
+        """
+        if self.holds_once:
+            return sum(
+                1 for entry_bbox, _ in self._objects
+                if _boxes_overlap(_box(entry_bbox), box))
+        min_x, min_y, max_x, max_y = owned_area(
+            _box(self._cell), self._root_bounds)
+        total = 0
+        for entry_bbox, _ in self._objects:
+            origin = overlap_origin(entry_bbox, bbox)
+            if origin is None:
+                continue
+            x, y = origin
+            if min_x <= x < max_x and min_y <= y < max_y:
+                total += 1
+        return total
+
+    def count(self, bbox):
+        """ Number of objects in subtree, whose bboxes overlap `bbox`.
+            Subtrees `bbox` covers are not walked, their stored count is
+            used instead.
+        """
+        box = _box(bbox)
+        total = 0
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not _boxes_overlap(_box(node._bbox), box):
+                continue
+            if node._covered_by(box):
+                total += node._count
+                continue
+            total += node._counts_in(bbox, box)
+            stack.extend(node.nodes)
+        return total
+
+    def density_grid(self, resolution):
+        """ Number of objects per cell of a `resolution` x `resolution` grid
+            over this node as a list of rows. Objects are placed by minimum
+            corner of their bbox. Nodes inside of a single grid cell add
+            their stored count without visiting objects.
+        """
+        grid = [[0] * resolution for _ in range(resolution)]
+        origin_x, origin_y = self._cell.min_point
+        cell_size = self._cell.width / resolution
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if not node._count:
+                continue
+            min_x, min_y = node._cell.min_point
+            max_x, max_y = node._cell.max_point
+            first_x, last_x = grid_range(
+                min_x, max_x, origin_x, cell_size, resolution)
+            first_y, last_y = grid_range(
+                min_y, max_y, origin_y, cell_size, resolution)
+            if first_x == last_x and first_y == last_y:
+                grid[first_y][first_x] += node._count
+                continue
+            for bbox, _ in node._objects:
+                if not node._owns(bbox):
+                    continue
+                x, y = bbox.min_point
+                # Objects of loose and root nodes can stick out of the cell
+                x = int((x - origin_x) // cell_size)
+                y = int((y - origin_y) // cell_size)
+                grid[min(max(y, first_y), last_y)][
+                    min(max(x, first_x), last_x)] += 1
+            stack.extend(node.nodes)
+        return grid
+
+    def nearest(self, point, max_radius=None):
+        """ Yield `(distance, (bbox, obj))` for objects of this subtree in
+            order of distance from `point` to their shapes. Objects held by
+            several nodes are yielded several times.
+        """
+        counter = it.count()
+        heap = [(bbox_distance(self._bbox, point), next(counter), self, None)]
+        while heap:
+            dist, _, node, entry = heappop(heap)
+            if max_radius is not None and dist > max_radius:
+                return
+            if node is None:
+                yield dist, entry
+                continue
+            for entry in node._objects:
+                _, (shape, _) = entry
+                d = distance(shape, point)
+                if max_radius is None or d <= max_radius:
+                    heappush(heap, (d, next(counter), None, entry))
+            for child in node.nodes:
+                d = bbox_distance(child._bbox, point)
+                if max_radius is None or d <= max_radius:
+                    heappush(heap, (d, next(counter), child, None))
+
+    def raycast(self, origin, direction, max_distance):
+        """ Yield `(distance, (bbox, obj))` for objects of this subtree hit
+            by the ray in order of distance along it. Only nodes the ray
+            crosses are visited, nearest entry first.
+        """
+        counter = it.count()
+        t = bbox_ray_distance(self._bbox, origin, direction, max_distance)
+        if t is None:
+            return
+        heap = [(t, next(counter), self, None)]
+        while heap:
+            t, _, node, entry = heappop(heap)
+            if node is None:
+                yield t, entry
+                continue
+            for entry in node._objects:
+                _, (shape, _) = entry
+                t = ray_distance(shape, origin, direction, max_distance)
+                if t is not None:
+                    heappush(heap, (t, next(counter), None, entry))
+            for child in node.nodes:
+                t = bbox_ray_distance(
+                    child._bbox, origin, direction, max_distance)
+                if t is not None:
+                    heappush(heap, (t, next(counter), child, None))
+
+    def join_view(self):
+        """ `(root, bounds, entries, children)` - root node of this subtree
+            and functions, that return `(min_x, min_y, max_x, max_y)` bounds,
+            `(bbox, item)` entries and children of a node. Lets
+            `QuadTree.join` walk trees with any node storage.
+        """
+        return self, _node_bounds, _node_entries, _node_children
+
+    def iter_pairs(self):
+        """ Yield `(item, other)` for all objects in subtree, whose bboxes
+            overlap. Each node pairs it's objects with each other and with
+            objects of it's ancestors. Pair is only yielded by the node, that
+            contains minimum corner of the overlap, so objects held by
+            several nodes are paired once.
+        """
+        root = _box(self._bbox)
+        holds_once = self.holds_once
+        stack = [(self, ())]
+        while stack:
+            node, above = stack.pop()
+            min_x, min_y, max_x, max_y = owned_area(_box(node._bbox), root)
+            objects = node._objects
+            for i, (bbox, item) in enumerate(objects):
+                for other_bbox, other in it.chain(above, objects[i + 1:]):
+                    origin = overlap_origin(bbox, other_bbox)
+                    if origin is None:
+                        continue
+                    if holds_once:
+                        yield other, item
+                        continue
+                    x, y = origin
+                    if min_x <= x < max_x and min_y <= y < max_y:
+                        yield other, item
+            if node.nodes:
+                below = above + tuple(objects)
+                for child in node.nodes:
+                    stack.append((child, below))
 
     def __repr__(self):
         padd = lambda x, t, s='\n': s.join([t+line for line in x.split(s)])
@@ -146,41 +673,465 @@ class _QuadNode:
             self._bbox, self._objects, self._level) + padd(nodes_repr, '  ')
 
 
+class _LooseQuadNode(_QuadNode):
+    """ Node of a loose QuadTree. Node bounds are expanded by `looseness`
+        factor around it's cell and each object is held by the single
+        deepest node, whose expanded bounds contain it. Which node that is
+        only depends on object's center and size, so no node ever needs to
+        be tested against neighbours.
+    """
+
+    def __init__(self, parent, bbox, level, *, looseness=None, **kw):
+        super().__init__(parent, bbox, level, **kw)
+        if parent is not None:
+            looseness = parent._looseness
+        self._looseness = looseness
+        self._bbox = BoundingBox.from_center(
+            bbox.center, bbox.width * looseness, bbox.height * looseness)
+
+    @property
+    def holds_once(self):
+        return True
+
+    def _loose_child_fits(self, bbox):
+        """ True if `bbox` fits into loose bounds of the child, that
+            contains it's center. Child does not need to exist.
+        """
+        if self._level == self._max_level:
+            return False
+        min_x, min_y = self._cell.min_point
+        max_x, max_y = self._cell.max_point
+        c_x, c_y = self._cell.center
+        x, y = bbox.center
+        # Same quadrant choice as `_child_at`
+        if x >= c_x:
+            min_x = c_x
+        else:
+            max_x = c_x
+        if y >= c_y:
+            min_y = c_y
+        else:
+            max_y = c_y
+        pad_x = (max_x - min_x) * (self._looseness - 1) / 2
+        pad_y = (max_y - min_y) * (self._looseness - 1) / 2
+        b_min_x, b_min_y = bbox.min_point
+        b_max_x, b_max_y = bbox.max_point
+        return (min_x - pad_x <= b_min_x and b_max_x <= max_x + pad_x and
+                min_y - pad_y <= b_min_y and b_max_y <= max_y + pad_y)
+
+    def _child_at(self, point):
+        x, y = point
+        c_x, c_y = self._cell.center
+        if x >= c_x:
+            return self._ne if y >= c_y else self._se
+        return self._nw if y >= c_y else self._sw
+
+    def insert(self, bbox, obj, holders=None):
+        """ Insert `obj` into the deepest node, that contains it. Objects,
+            that stick out of the root are held by the root.
+        """
+        if not intersects(bbox, self._bbox):
+            return
+        node = self
+        center = bbox.center
+        while node._loose_child_fits(bbox):
+            if not node.nodes:
+                node.split()
+            node = node._child_at(center)
+        node._add(bbox, obj, holders)
+
+    def insert_cells(self, entries):
+        # Placement depends on size of objects, not only on their cell
+        for _, bbox, obj, holders in entries:
+            self.insert(bbox, obj, holders)
+
+    def relocate(self, holders, bbox, item):
+        if len(holders) != 1:
+            return False
+        node, = holders
+        if not contains(node._bbox, bbox) or node._loose_child_fits(bbox):
+            return False
+        # Path from the root is chosen by the center of the object
+        center = bbox.center
+        child = node
+        while child._parent is not None:
+            if child._parent._child_at(center) is not child:
+                return False
+            child = child._parent
+        _, obj = item
+        node._objects[node._index_of(obj)] = (bbox, item)
+        return True
+
+    def iter_pairs(self):
+        """ Yield `(item, other)` for all objects in subtree, whose bboxes
+            overlap. Loose bounds of siblings overlap, so objects are paired
+            by querying the tree rather than by walking down from ancestors.
+        """
+        for bbox, item in self.get_all_objects():
+            for other_bbox, other in self.query(bbox):
+                if id(other) >= id(item):
+                    continue
+                if overlap_origin(bbox, other_bbox) is not None:
+                    yield other, item
+
+
 class QuadTree:
+    """ Region QuadTree over a square area of `size` around `center`.
+
+        By default nodes are separate `_QuadNode` objects. Pass `flat=True` to
+        store nodes in flat arrays (see `FlatQuadNodes`), which uses less
+        memory per node and avoids shape dispatch while walking the tree.
+
+        With `occupancy=True` tree also keeps an `OccupancyGrid` of max level
+        cells, that is used to find query candidates with integer mask
+        operations instead of walking the nodes. Grid has `4 ** max_level`
+        cells, so it's only supported up to `MAX_OCCUPANCY_LEVEL`.
+
+        If `max_objects` is set, nodes split only when they hold more objects
+        than that and merge back when they get sparse, so the depth follows
+        the actual density of objects rather than `max_level`.
+
+        With `looseness` set (for example 2) it's a loose QuadTree: node
+        bounds are expanded by this factor and each object is held by a
+        single node, so queries need no deduplication and large objects are
+        not copied into many nodes.
+
+        Objects can be inserted with a layer `mask` (up to 64 bits) and
+        queries only return objects sharing a bit with the query `mask`.
+        Every node keeps the OR of masks in it's subtree, so subtrees
+        without matching layers are not visited at all.
+
+        Nodes also keep the number of objects in their subtree, so `count`
+        and `density_grid` only walk the nodes on the borders of regions.
+    """
 
     _quad_node_cls = _QuadNode
+    _loose_node_cls = _LooseQuadNode
+    _flat_nodes_cls = FlatQuadNodes
 
-    def __init__(self, *, center, size, max_level):
-        self._root = self._quad_node_cls(
-            parent=None,
-            bbox=BoundingBox.from_center(center, size, size),
-            level=0,
-            max_level=max_level,
-            max_objects=1)
+    def __init__(self, *, center, size, max_level, max_objects=None,
+                 looseness=None, flat=False, occupancy=False):
+        if max_objects is not None and max_objects < 1:
+            raise ValueError("`max_objects` should be at least 1")
+        if looseness is not None and looseness < 1:
+            raise ValueError("`looseness` should be at least 1")
+        if flat and (max_objects is not None or looseness is not None):
+            raise ValueError(
+                "`max_objects` and `looseness` are not supported by flat "
+                "nodes")
+        if max_objects is not None and looseness is not None:
+            raise ValueError(
+                "`max_objects` can not be used together with `looseness`")
+        if occupancy and max_level > MAX_OCCUPANCY_LEVEL:
+            raise ValueError(
+                "`occupancy` is only supported up to max level {}".format(
+                    MAX_OCCUPANCY_LEVEL))
+        # Nodes (or node slots for flat storage), that hold each object.
+        # Let's us remove and update objects without walking the tree.
+        self._handles = {}
+        # Layer masks of objects, that are not in all layers
+        self._masks = {}
+        bbox = BoundingBox.from_center(center, size, size)
+        self._bbox = bbox
+        if flat:
+            self._root = self._flat_nodes_cls(
+                bbox, max_level, masks=self._masks)
+        elif looseness is not None:
+            self._root = self._loose_node_cls(
+                parent=None,
+                bbox=bbox,
+                level=0,
+                max_level=max_level,
+                handles=self._handles,
+                masks=self._masks,
+                looseness=looseness)
+        else:
+            self._root = self._quad_node_cls(
+                parent=None,
+                bbox=bbox,
+                level=0,
+                max_level=max_level,
+                max_objects=max_objects,
+                handles=self._handles,
+                masks=self._masks)
         self._size = size
         self._max_level = max_level
+        self._flat = flat
+        if occupancy:
+            self._occupancy = OccupancyGrid(bbox, max_level)
+        else:
+            self._occupancy = None
+
+    @classmethod
+    def bulk_load(cls, pairs, **kw):
+        """ Construct a tree from iterable of `(shape, obj)` pairs at once.
+            Accepts the same keyword arguments as the constructor.
+        """
+        tree = cls(**kw)
+        tree.rebuild(pairs)
+        return tree
+
+    def rebuild(self, pairs):
+        """ Replace contents of the tree with `(shape, obj)` pairs.
+
+            Shapes, that fit in a single max level cell are sorted by
+            Morton code of that cell and placed in one pass, others are
+            inserted as usual.
+        """
+        self._root.clear()
+        self._handles.clear()
+        self._masks.clear()
+        if self._occupancy is not None:
+            self._occupancy.clear()
+
+        min_x, min_y = self._bbox.min_point
+        cells = 1 << self._max_level
+        cell_size = self._size / cells
+        shapes = {}
+        for shape, obj in pairs:
+            shapes[obj] = shape
+
+        entries = []
+        rest = []
+        for obj, shape in shapes.items():
+            bbox = shape.bounding_box
+            b_min_x, b_min_y = bbox.min_point
+            b_max_x, b_max_y = bbox.max_point
+            x, last_x = cell_range(b_min_x, b_max_x, min_x, cell_size)
+            y, last_y = cell_range(b_min_y, b_max_y, min_y, cell_size)
+            if x != last_x or y != last_y or not (
+                    0 <= x < cells and 0 <= y < cells):
+                rest.append((shape, obj))
+                continue
+            holders = self._handles[obj] = []
+            entries.append(
+                (morton_code(x, y), bbox, (shape, obj), holders))
+
+        entries.sort(key=lambda entry: entry[0])
+        self._root.insert_cells(entries)
+        if self._occupancy is not None:
+            for _, bbox, item, _ in entries:
+                self._occupancy.add(bbox, item)
+        for shape, obj in rest:
+            self.insert(shape, obj)
 
-    def insert(self, shape, obj):
+    def insert(self, shape, obj, mask=MASK_ALL):
+        """ Add `obj` with `shape` in layers set in `mask`
+        """
+        if not 0 <= mask <= MASK_ALL:
+            raise ValueError("`mask` should be a 64 bit unsigned integer")
+        if obj in self._handles:
+            self.remove(obj)
+        if mask != MASK_ALL:
+            self._masks[obj] = mask
         bbox = shape.bounding_box
-        self._root.insert(bbox, (shape, obj))
+        item = (shape, obj)
+        holders = self._handles[obj] = []
+        self._root.insert(bbox, item, holders)
+        if self._occupancy is not None:
+            self._occupancy.add(bbox, item)
 
-    def query_iter(self, query_shape):
+    def get_mask(self, obj):
+        """ Layer mask `obj` was inserted with
+        """
+        if obj not in self._handles:
+            raise KeyError(obj)
+        return self._masks.get(obj, MASK_ALL)
+
+    def query_iter(self, query_shape, mask=MASK_ALL):
+        """ Yield objects, whose shapes intersect `query_shape`. Pass a
+            `MovingCircle` to get all objects it can touch while moving.
+            Only objects in any of `mask` layers are returned.
+        """
         bbox = query_shape.bounding_box
-        assert isinstance(bbox, BoundingBox)
+        assert isinstance(bbox, (BoundingBox, CompactBox))
+        if self._occupancy is not None:
+            candidates = _unique(self._occupancy.query(bbox))
+        else:
+            candidates = (item for _, item in self._root.query(bbox, mask))
+            if not self._root.holds_once:
+                candidates = _unique(candidates)
+        if mask != MASK_ALL and self._masks:
+            masks = self._masks
+            candidates = (
+                item for item in candidates
+                if masks.get(item[1], MASK_ALL) & mask)
+        if batch.np is None:
+            rest = ()
+        else:
+            # First candidates are streamed through scalar tests, so the
+            # iterator stays lazy. Many more are tested at once with NumPy
+            # kernels.
+            rest = candidates
+            candidates = it.islice(candidates, BATCH_MIN_CANDIDATES)
+        for shape, obj in candidates:
+            if intersects(query_shape, shape):
+                yield obj
+        rest = list(rest)
+        if len(rest) < BATCH_MIN_CANDIDATES:
+            for shape, obj in rest:
+                if intersects(query_shape, shape):
+                    yield obj
+            return
+        hits = batch.intersects_many(query_shape, [shape for shape, _ in rest])
+        for (_, obj), hit in zip(rest, hits):
+            if hit:
+                yield obj
+
+    def query(self, query_shape, mask=MASK_ALL):
+        return list(self.query_iter(query_shape, mask))
+
+    def count(self, bbox):
+        """ Number of objects, whose bounding boxes overlap `bbox`. Shapes
+            themselves are not tested. Nodes keep the number of objects in
+            their subtree, so subtrees inside of `bbox` are not walked.
+        """
+        return self._root.count(bbox)
+
+    def density_grid(self, resolution):
+        """ Histogram of objects over the area of the tree split into
+            `resolution` x `resolution` cells as a list of rows, so counts
+            are `grid[y][x]` with `(0, 0)` at the minimum corner. Each object
+            is counted once, in the cell of it's bbox minimum corner. Loose
+            trees can place objects, that stick out of their node, in a
+            neighbour cell.
+        """
+        if resolution < 1:
+            raise ValueError("`resolution` should be at least 1")
+        return self._root.density_grid(resolution)
+
+    def nearest_iter(self, point, max_radius=None, mask=MASK_ALL):
+        """ Yield `(distance, obj)` for objects in `mask` layers in order of
+            distance from `point` to their shapes. Objects further than
+            `max_radius` are not returned.
+        """
+        if not isinstance(point, Vec2):
+            point = Vec2(*point)
+        masks = self._masks if mask != MASK_ALL else None
         _seen = set([])
-        for shape_bbox, (shape, obj) in self._root.query(bbox):
+        for d, (_, (_, obj)) in self._root.nearest(point, max_radius):
             if obj in _seen:
                 continue
             _seen.add(obj)
-            if intersects(query_shape, shape):
-                yield obj
+            if masks is not None and not masks.get(obj, MASK_ALL) & mask:
+                continue
+            yield d, obj
+
+    def nearest(self, point, k=None, max_radius=None, mask=MASK_ALL):
+        """ Return up to `k` objects closest to `point` sorted by distance
+            from `point` to their shapes. Objects further than `max_radius`
+            are not returned. Nodes are visited best-first, so only nodes
+            closer than the k-th result are ever looked at.
+        """
+        result = []
+        if k is not None and k <= 0:
+            return result
+        for _, obj in self.nearest_iter(point, max_radius, mask):
+            result.append(obj)
+            if k is not None and len(result) == k:
+                break
+        return result
 
-    def query(self, query_shape):
-        return list(self.query_iter(query_shape))
+    def raycast(self, origin, direction, max_distance):
+        """ Find the first object hit by the ray from `origin` along
+            `direction` not further than `max_distance`. Returns
+            `(obj, distance, point)` or None if nothing was hit. Point is
+            `origin` itself for objects, that contain it.
+        """
+        if not isinstance(origin, Vec2):
+            origin = Vec2(*origin)
+        if not isinstance(direction, Vec2):
+            direction = Vec2(*direction)
+        if direction.is_null:
+            raise ValueError("`direction` should not be a zero vector")
+        direction = direction.normalized()
+        for t, (_, (_, obj)) in self._root.raycast(
+                origin, direction, max_distance):
+            return obj, t, origin + direction * t
+        return None
+
+    def segment_query(self, segment):
+        """ Find the first object hit along `LineSegment` going from it's
+            start to end. See `raycast`.
+        """
+        start, end = segment.start, segment.end
+        if start == end:
+            # Only objects containing the point can be hit
+            return self.raycast(start, Vec2(1, 0), 0)
+        return self.raycast(start, end - start, start.distance_to(end))
+
+    def join(self, other):
+        """ Yield `(obj, other_obj)` for each object of this tree and
+            object of `other` tree, whose shapes intersect. Both trees are
+            walked at once and only pairs of nodes with overlapping bounds
+            are visited, so the cost follows the number of close objects
+            rather than the size of trees.
+        """
+        root, *view = self._root.join_view()
+        other_root, *other_view = other._root.join_view()
+        bounds, entries, children = view
+        other_bounds, other_entries, other_children = other_view
+        holds_once = self._root.holds_once and other._root.holds_once
+        _seen = set([])
+        stack = [(root, other_root)]
+        while stack:
+            node, other_node = stack.pop()
+            if not _boxes_overlap(bounds(node), other_bounds(other_node)):
+                continue
+            objects = entries(node)
+            other_objects = other_entries(other_node)
+            nodes = children(node)
+            other_nodes = other_children(other_node)
+            # Objects of a node are also paired with the whole subtree of
+            # the other node, as they are not passed down
+            candidates = it.chain(
+                _join_entries(objects, other_objects),
+                _join_below(objects, other_nodes, other_view),
+                ((item, other_item) for other_item, item in _join_below(
+                    other_objects, nodes, view)))
+            for (shape, obj), (other_shape, other_obj) in candidates:
+                if not holds_once:
+                    if (obj, other_obj) in _seen:
+                        continue
+                    _seen.add((obj, other_obj))
+                if intersects(shape, other_shape):
+                    yield obj, other_obj
+            stack.extend(
+                (child, other_child)
+                for child in nodes for other_child in other_nodes)
+
+    def iter_overlapping_pairs(self):
+        """ Yield each unordered pair of objects, whose shapes intersect,
+            exactly once. Walks every node only once.
+        """
+        for (shape, obj), (other_shape, other) in self._root.iter_pairs():
+            if intersects(shape, other_shape):
+                yield obj, other
 
     def remove(self, obj):
-        self._root.remove(obj)
+        holders = self._handles.get(obj)
+        if holders is not None:
+            self._root.discard(holders, obj)
+            del self._handles[obj]
+            self._masks.pop(obj, None)
+            if self._occupancy is not None:
+                self._occupancy.discard(obj)
 
-    def update(self, shape, obj):
+    def update(self, shape, obj, mask=None):
+        """ Set new `shape` of `obj`. It's layer `mask` is kept unless a
+            new one is passed.
+        """
+        holders = self._handles.get(obj)
+        if mask is None:
+            mask = self._masks.get(obj, MASK_ALL)
+        elif holders is not None and mask != self.get_mask(obj):
+            # Masks of all nodes on the way need to change, just reinsert
+            holders = None
+        bbox = shape.bounding_box
+        item = (shape, obj)
+        if holders is not None and self._root.relocate(holders, bbox, item):
+            if self._occupancy is not None:
+                self._occupancy.update(bbox, item)
+            return
         self.remove(obj)
-        self.insert(shape, obj)
+        self.insert(shape, obj, mask)
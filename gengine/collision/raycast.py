@@ -0,0 +1,125 @@
+import math
+
+from .shapes import Circle, BoundingBox, Polygon, LineSegment, \
+    with_compact, with_transformed
+
+EPSILON = 1e-9
+
+
+def box_ray_distance(min_x, min_y, max_x, max_y, ox, oy, dx, dy,
+                     max_distance):
+    """ Distance along the ray `(ox, oy) + t * (dx, dy)` at which it enters
+        a box given by raw coordinates. 0 if origin is inside of the box,
+        None if ray misses the box or enters it further than `max_distance`.
+    """
+    t_min = 0
+    t_max = max_distance
+    for o, d, low, high in ((ox, dx, min_x, max_x), (oy, dy, min_y, max_y)):
+        if abs(d) < EPSILON:
+            # Parallel to the slab, it should already be inside of it
+            if o < low or o > high:
+                return None
+            continue
+        t1 = (low - o) / d
+        t2 = (high - o) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+        t_min = max(t_min, t1)
+        t_max = min(t_max, t2)
+        if t_min > t_max:
+            return None
+    return t_min
+
+
+def bbox_ray_distance(bbox, origin, direction, max_distance):
+    min_x, min_y = bbox.min_point
+    max_x, max_y = bbox.max_point
+    ox, oy = origin
+    dx, dy = direction
+    return box_ray_distance(
+        min_x, min_y, max_x, max_y, ox, oy, dx, dy, max_distance)
+
+
+def circle_ray_distance(circle, origin, direction, max_distance):
+    # Solve |origin + t * direction - center| = radius for unit direction
+    s = origin - circle.center
+    c = s.dot(s) - circle.radius * circle.radius
+    if c <= 0:
+        return 0
+    b = s.dot(direction)
+    if b >= 0:
+        # Outside of circle and moving away from it
+        return None
+    d = b * b - c
+    if d < 0:
+        return None
+    t = -b - math.sqrt(d)
+    if t > max_distance:
+        return None
+    return t
+
+
+def _segment_ray_distance(start, end, origin, direction, max_distance):
+    ox, oy = origin
+    dx, dy = direction
+    px, py = start
+    ex = end[0] - px
+    ey = end[1] - py
+    wx = px - ox
+    wy = py - oy
+    denom = dx * ey - dy * ex
+    if abs(denom) < EPSILON:
+        # Parallel. Only collinear segment can be hit, at it's closest end
+        if abs(wx * dy - wy * dx) > EPSILON:
+            return None
+        t_start = wx * dx + wy * dy
+        t_end = t_start + ex * dx + ey * dy
+        if t_start > t_end:
+            t_start, t_end = t_end, t_start
+        if t_end < 0:
+            return None
+        t = max(t_start, 0)
+    else:
+        t = (wx * ey - wy * ex) / denom
+        s = (wx * dy - wy * dx) / denom
+        if t < 0 or s < 0 or s > 1:
+            return None
+    if t > max_distance:
+        return None
+    return t
+
+
+def segment_ray_distance(segment, origin, direction, max_distance):
+    return _segment_ray_distance(
+        segment.start, segment.end, origin, direction, max_distance)
+
+
+def polygon_ray_distance(polygon, origin, direction, max_distance):
+    if polygon.contains_point(origin):
+        return 0
+    result = None
+    for i in range(len(polygon)):
+        t = _segment_ray_distance(
+            polygon[i - 1], polygon[i], origin, direction, max_distance)
+        if t is not None and (result is None or t < result):
+            result = t
+    return result
+
+
+_registry = with_transformed(with_compact({
+    Circle: circle_ray_distance,
+    BoundingBox: bbox_ray_distance,
+    Polygon: polygon_ray_distance,
+    LineSegment: segment_ray_distance,
+}))
+
+
+def ray_distance(shape, origin, direction, max_distance):
+    """ Distance along the ray from `origin` in unit `direction` to the first
+        point of `shape`. 0 if origin is inside of the shape, None if there
+        is no hit closer than `max_distance`.
+    """
+    handler = _registry.get(type(shape))
+    if handler is not None:
+        return handler(shape, origin, direction, max_distance)
+    raise NotImplementedError
@@ -1,15 +1,22 @@
 import abc
+import itertools as it
+import math
 from gengine.utils import lazy_property
 from planar import BoundingBox as OriginalBBox, Vec2
 from planar.line import LineSegment as OriginalLineSegment
 from planar.polygon import Polygon as OriginalPolygon  # Segfault on C impl =(.
 
+from .decomposition import convex_decomposition
+
 
 __all__ = [
     "Shape",
     "LineSegment",
     "BoundingBox",
-    "Circle"
+    "Circle",
+    "TransformedPolygon",
+    "CompactBox",
+    "CompactCircle",
 ]
 
 
@@ -17,6 +24,7 @@ class Shape:
     """ Base class for 2D shapes
     """
     __metaclass__ = abc.ABCMeta
+    __slots__ = ()
 
     @abc.abstractproperty
     def bounding_box(self):
@@ -76,17 +84,312 @@ class LineSegment(OriginalLineSegment, Shape):
 
 
 class Polygon(OriginalPolygon, Shape):
+    """ Polygon with cached edges and SAT data. Cached values are computed
+        on first access, so vertices should not be changed after that.
+    """
+
+    @lazy_property
+    def vertices(self):
+        """ Vertices as a tuple of `(x, y)` pairs
+        """
+        return tuple((x, y) for x, y in self)
+
+    @lazy_property
+    def edges(self):
+        return tuple(
+            LineSegment.from_points([self[i], self[i - 1]])
+            for i in range(len(self)))
+
+    @lazy_property
+    def axes(self):
+        """ Unique normalised edge normals as `(x, y)` pairs. Opposite
+            normals give the same projection, so only one of them is kept.
+        """
+        axes = []
+        _seen = set([])
+        vertices = self.vertices
+        for i in range(len(vertices)):
+            x1, y1 = vertices[i - 1]
+            x2, y2 = vertices[i]
+            n_x, n_y = y1 - y2, x2 - x1
+            length = math.hypot(n_x, n_y)
+            if not length:
+                continue
+            n_x /= length
+            n_y /= length
+            if n_x < 0 or (n_x == 0 and n_y < 0):
+                n_x, n_y = -n_x, -n_y
+            if (n_x, n_y) in _seen:
+                continue
+            _seen.add((n_x, n_y))
+            axes.append((n_x, n_y))
+        return tuple(axes)
+
+    @lazy_property
+    def extents(self):
+        """ `(min, max)` projections on each of `axes`
+        """
+        return tuple(self.project_axis(axis) for axis in self.axes)
+
+    @lazy_property
+    def box_extents(self):
+        """ `(min_x, min_y, max_x, max_y)` of vertices
+        """
+        xs = [x for x, _ in self.vertices]
+        ys = [y for _, y in self.vertices]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    @lazy_property
+    def bounding_box(self):
+        min_x, min_y, max_x, max_y = self.box_extents
+        return BoundingBox([Vec2(min_x, min_y), Vec2(max_x, max_y)])
+
+    @lazy_property
+    def convex_pieces(self):
+        """ Convex polygons, that make up this one. Just the polygon itself
+            if it's convex.
+        """
+        if self.is_convex:
+            return (self,)
+        return tuple(
+            Polygon([self[i] for i in piece], is_convex=True)
+            for piece in convex_decomposition(self.vertices))
 
     def iter_edges(self):
-        for i in range(len(self)):
-            yield LineSegment.from_points([self[i], self[i - 1]])
+        return iter(self.edges)
+
+    def project_axis(self, axis):
+        """ `(min, max)` projection of vertices on `(x, y)` axis
+        """
+        a_x, a_y = axis
+        projections = [x * a_x + y * a_y for x, y in self.vertices]
+        return min(projections), max(projections)
 
     def project(self, vector):
-        min_point = max_point = vector.dot(self[0])
-        for vertice in self:
-            x = vector.dot(vertice)
-            if x < min_point:
-                min_point = x
-            if x > max_point:
-                max_point = x
-        return min_point, max_point
+        return self.project_axis(vector)
+
+
+class TransformedPolygon(Shape):
+    """ Polygon in local coordinates with an `Affine` transform applied.
+        World space polygon and it's bounding box are computed on first
+        access and reset only when `transform` is changed.
+    """
+
+    def __init__(self, local, transform):
+        self.local = local
+        self._transform = transform
+
+    @property
+    def transform(self):
+        return self._transform
+
+    @transform.setter
+    def transform(self, transform):
+        self._transform = transform
+        self.__dict__.pop("polygon", None)
+        self.__dict__.pop("bounding_box", None)
+
+    def transformed(self, transform):
+        """ Shape with `transform` applied after the current one. Shares the
+            local polygon, so no vertices are computed until needed.
+        """
+        return TransformedPolygon(self.local, transform * self._transform)
+
+    @lazy_property
+    def polygon(self):
+        """ `Polygon` in world space
+        """
+        transform = self._transform
+        return Polygon(
+            [point * transform for point in self.local],
+            is_convex=self.local.is_convex)
+
+    @lazy_property
+    def bounding_box(self):
+        return self.polygon.bounding_box
+
+    def contains_point(self, point):
+        return self.polygon.contains_point(point)
+
+    def __repr__(self):
+        return "TransformedPolygon(%r, %r)" % (self.local, self._transform)
+
+    __str__ = __repr__
+
+
+class _Compact(Shape):
+    """ Base for slotted immutable shapes. They keep only float fields and
+        have no `__dict__`, so take a lot less memory, than planar based
+        shapes, for large amounts of entities.
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    __delattr__ = __setattr__
+
+
+class CompactBox(_Compact):
+    """ Immutable bounding box. Can be used anywhere `BoundingBox` is.
+    """
+    __slots__ = ("min_x", "min_y", "max_x", "max_y")
+
+    def __init__(self, min_x, min_y, max_x, max_y):
+        set_field = object.__setattr__
+        set_field(self, "min_x", float(min(min_x, max_x)))
+        set_field(self, "min_y", float(min(min_y, max_y)))
+        set_field(self, "max_x", float(max(min_x, max_x)))
+        set_field(self, "max_y", float(max(min_y, max_y)))
+
+    @classmethod
+    def from_bbox(cls, bbox):
+        min_x, min_y = bbox.min_point
+        max_x, max_y = bbox.max_point
+        return cls(min_x, min_y, max_x, max_y)
+
+    @classmethod
+    def from_center(cls, center, width, height):
+        x, y = center
+        half_w = width / 2
+        half_h = height / 2
+        return cls(x - half_w, y - half_h, x + half_w, y + half_h)
+
+    @property
+    def bounding_box(self):
+        return self
+
+    @property
+    def min_point(self):
+        return Vec2(self.min_x, self.min_y)
+
+    @property
+    def max_point(self):
+        return Vec2(self.max_x, self.max_y)
+
+    @property
+    def center(self):
+        return Vec2(
+            (self.min_x + self.max_x) / 2, (self.min_y + self.max_y) / 2)
+
+    @property
+    def width(self):
+        return self.max_x - self.min_x
+
+    @property
+    def height(self):
+        return self.max_y - self.min_y
+
+    def inflate(self, amount):
+        """ Box grown by `amount` in width and height, same as
+            `BoundingBox.inflate`
+        """
+        return CompactBox.from_center(
+            self.center, self.width + amount, self.height + amount)
+
+    def contains_point(self, point):
+        # Same as `BoundingBox` - lower and left borders are not included
+        x, y = point
+        return (self.min_x < x <= self.max_x and
+                self.min_y < y <= self.max_y)
+
+    def to_polygon(self):
+        return BoundingBox([self.min_point, self.max_point]).to_polygon()
+
+    def __eq__(self, other):
+        return (isinstance(other, CompactBox) and
+                self.min_x == other.min_x and self.min_y == other.min_y and
+                self.max_x == other.max_x and self.max_y == other.max_y)
+
+    def __hash__(self):
+        return hash((self.min_x, self.min_y, self.max_x, self.max_y))
+
+    def __repr__(self):
+        return "CompactBox(%s, %s, %s, %s)" % (
+            self.min_x, self.min_y, self.max_x, self.max_y)
+
+    __str__ = __repr__
+
+
+class CompactCircle(_Compact):
+    """ Immutable circle. Can be used anywhere `Circle` is. Bounding box
+        is computed once on construction.
+    """
+    __slots__ = ("x", "y", "radius", "bounding_box")
+
+    def __init__(self, center, radius):
+        x, y = center
+        x = float(x)
+        y = float(y)
+        r = float(radius)
+        set_field = object.__setattr__
+        set_field(self, "x", x)
+        set_field(self, "y", y)
+        set_field(self, "radius", r)
+        set_field(self, "bounding_box", CompactBox(x - r, y - r, x + r, y + r))
+
+    @property
+    def center(self):
+        return Vec2(self.x, self.y)
+
+    def contains_point(self, point):
+        x, y = point
+        return math.hypot(x - self.x, y - self.y) <= self.radius
+
+    def __repr__(self):
+        return "CompactCircle((%s, %s), %s)" % (self.x, self.y, self.radius)
+
+    __str__ = __repr__
+
+
+# Compact shapes work with the same handlers as the shapes they replace
+COMPACT_TYPES = {
+    Circle: CompactCircle,
+    BoundingBox: CompactBox,
+}
+
+
+def with_compact(registry):
+    """ Copy of a handler registry, keyed by shape types or tuples of them,
+        with the same handlers registered for compact variants of shapes.
+    """
+    result = dict(registry)
+    for key, handler in registry.items():
+        if isinstance(key, tuple):
+            options = [
+                (t, COMPACT_TYPES[t]) if t in COMPACT_TYPES else (t,)
+                for t in key]
+            for variant in it.product(*options):
+                result.setdefault(variant, handler)
+        elif key in COMPACT_TYPES:
+            result.setdefault(COMPACT_TYPES[key], handler)
+    return result
+
+
+def _world_space(handler, count):
+    def do(*args, **kw):
+        shapes = [
+            shape.polygon if isinstance(shape, TransformedPolygon) else shape
+            for shape in args[:count]]
+        return handler(*(shapes + list(args[count:])), **kw)
+    return do
+
+
+def with_transformed(registry):
+    """ Copy of a handler registry, keyed by shape types or tuples of them,
+        where `TransformedPolygon` is handled as `Polygon` in world space.
+    """
+    result = dict(registry)
+    for key, handler in registry.items():
+        if isinstance(key, tuple):
+            if Polygon not in key:
+                continue
+            options = [
+                (t, TransformedPolygon) if t is Polygon else (t,)
+                for t in key]
+            for variant in it.product(*options):
+                result.setdefault(
+                    variant, _world_space(handler, len(key)))
+        elif key is Polygon:
+            result.setdefault(TransformedPolygon, _world_space(handler, 1))
+    return result
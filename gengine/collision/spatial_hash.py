@@ -0,0 +1,122 @@
+import math
+
+from .intersection import intersects
+
+
+class SpatialHashGrid:
+    """ Unbounded uniform grid of `cell_size` cells, stored in a dict by cell
+        coordinates. Has the same interface as `QuadTree` and is better
+        suited for many objects of roughly the same size, as both update and
+        query only touch cells, covered by the bbox.
+    """
+
+    def __init__(self, *, cell_size):
+        self._cell_size = cell_size
+        # (x, y) -> set of objects
+        self._cells = {}
+        self._shapes = {}
+        self._ranges = {}
+
+    def _cell_range(self, bbox):
+        """ Covered cells as `(first_x, last_x, first_y, last_y)`. Unlike
+            QuadTree cells include their borders.
+        """
+        cell_size = self._cell_size
+        min_x, min_y = bbox.min_point
+        max_x, max_y = bbox.max_point
+        return (
+            int(math.floor(min_x / cell_size)),
+            int(math.floor(max_x / cell_size)),
+            int(math.floor(min_y / cell_size)),
+            int(math.floor(max_y / cell_size)))
+
+    def _add_cells(self, obj, cells, skip=None):
+        x, last_x, y, last_y = cells
+        grid = self._cells
+        for cell_x in range(x, last_x + 1):
+            for cell_y in range(y, last_y + 1):
+                if skip is not None and _in_range(cell_x, cell_y, skip):
+                    continue
+                cell = grid.get((cell_x, cell_y))
+                if cell is None:
+                    cell = grid[cell_x, cell_y] = set([])
+                cell.add(obj)
+
+    def _remove_cells(self, obj, cells, skip=None):
+        x, last_x, y, last_y = cells
+        grid = self._cells
+        for cell_x in range(x, last_x + 1):
+            for cell_y in range(y, last_y + 1):
+                if skip is not None and _in_range(cell_x, cell_y, skip):
+                    continue
+                cell = grid[cell_x, cell_y]
+                cell.discard(obj)
+                if not cell:
+                    del grid[cell_x, cell_y]
+
+    def insert(self, shape, obj):
+        if obj in self._shapes:
+            self.remove(obj)
+        cells = self._cell_range(shape.bounding_box)
+        self._shapes[obj] = shape
+        self._ranges[obj] = cells
+        self._add_cells(obj, cells)
+
+    def _covered_cells(self, cells):
+        """ Yield non empty cells in `cells` range. If the range is larger,
+            than the number of occupied cells, those are filtered instead,
+            so large queries over a fine grid do not walk empty cells.
+        """
+        x, last_x, y, last_y = cells
+        grid = self._cells
+        if (last_x - x + 1) * (last_y - y + 1) > len(grid):
+            for (cell_x, cell_y), cell in list(grid.items()):
+                if _in_range(cell_x, cell_y, cells):
+                    yield cell
+            return
+        for cell_x in range(x, last_x + 1):
+            for cell_y in range(y, last_y + 1):
+                cell = grid.get((cell_x, cell_y))
+                if cell is not None:
+                    yield cell
+
+    def query_iter(self, query_shape):
+        cells = self._cell_range(query_shape.bounding_box)
+        shapes = self._shapes
+        _seen = set([])
+        for cell in self._covered_cells(cells):
+            for obj in cell:
+                if obj in _seen:
+                    continue
+                _seen.add(obj)
+                if intersects(query_shape, shapes[obj]):
+                    yield obj
+
+    def query(self, query_shape):
+        return list(self.query_iter(query_shape))
+
+    def remove(self, obj):
+        cells = self._ranges.pop(obj, None)
+        if cells is None:
+            return
+        del self._shapes[obj]
+        self._remove_cells(obj, cells)
+
+    def update(self, shape, obj):
+        old_cells = self._ranges.get(obj)
+        if old_cells is None:
+            self.insert(shape, obj)
+            return
+        cells = self._cell_range(shape.bounding_box)
+        self._shapes[obj] = shape
+        if cells == old_cells:
+            return
+        # Only touch cells object left or entered
+        self._remove_cells(obj, old_cells, skip=cells)
+        self._add_cells(obj, cells, skip=old_cells)
+        self._ranges[obj] = cells
+
+
+def _in_range(cell_x, cell_y, cells):
+    x, last_x, y, last_y = cells
+    return x <= cell_x <= last_x and y <= cell_y <= last_y
@@ -0,0 +1,220 @@
+""" Time of impact for a moving circle and another shape. Circle is
+    followed by it's center, so every test is a ray of the center against
+    the other shape inflated by circle radius.
+
+    Same as in `intersects`, touching is only a contact with `border=True`.
+    Without it shapes, that only touch at some moment, do not collide, and
+    for shapes, that do overlap, the moment of first touch is returned.
+"""
+import math
+
+from planar import Vec2
+
+from .shapes import Circle, BoundingBox, Polygon, with_compact, \
+    with_transformed
+from .moving_shapes import MovingCircle
+
+
+def _circle_toi(x, y, v_x, v_y, c_x, c_y, r, duration, border):
+    """ First time in `[0, duration]` when point `(x, y)` moving with
+        velocity `(v_x, v_y)` gets to the circle `(c_x, c_y, r)`.
+    """
+    w_x = x - c_x
+    w_y = y - c_y
+    c = w_x * w_x + w_y * w_y - r * r
+    b = w_x * v_x + w_y * v_y
+    if c < 0:
+        return 0
+    if c == 0:
+        # Touching at start, only moving inside counts without border
+        if border or b < 0:
+            return 0
+        return None
+    if b >= 0:
+        # Moving away
+        return None
+    a = v_x * v_x + v_y * v_y
+    d = b * b - a * c
+    if d < 0 or (d == 0 and not border):
+        return None
+    t = (-b - math.sqrt(d)) / a
+    if t > duration:
+        return None
+    return t
+
+
+def _box_toi(x, y, v_x, v_y, min_x, min_y, max_x, max_y, duration, border):
+    """ First time in `[0, duration]` when point `(x, y)` moving with
+        velocity `(v_x, v_y)` gets into the box. Without `border` it has to
+        go through the inside of the box.
+    """
+    t_min = 0
+    t_max = duration
+    for o, d, low, high in ((x, v_x, min_x, max_x), (y, v_y, min_y, max_y)):
+        if not d:
+            if border:
+                if o < low or o > high:
+                    return None
+            elif o <= low or o >= high:
+                return None
+            continue
+        t1 = (low - o) / d
+        t2 = (high - o) / d
+        if t1 > t2:
+            t1, t2 = t2, t1
+        t_min = max(t_min, t1)
+        t_max = min(t_max, t2)
+    if t_min > t_max:
+        return None
+    if not border and t_min == t_max:
+        # Only touches the box. Point, that stops on the border at the end
+        # of the window, is not inside either
+        return None
+    return t_min
+
+
+def _first(*times):
+    times = [t for t in times if t is not None]
+    if not times:
+        return None
+    return min(times)
+
+
+def _window(mcircle, t0, t1):
+    start = max(t0, mcircle.timestamp)
+    end = min(t1, mcircle.timestamp + mcircle.dt)
+    return start, end
+
+
+def _center_at(mcircle, timestamp):
+    x, y = mcircle.center
+    v_x, v_y = mcircle.velocity
+    dt = timestamp - mcircle.timestamp
+    return x + v_x * dt, y + v_y * dt, v_x, v_y
+
+
+def moving_circle_to_moving_circle_toi(mcircle, other, t0, t1, border=False):
+    start, end = _window(mcircle, t0, t1)
+    other_start, other_end = _window(other, t0, t1)
+    start = max(start, other_start)
+    end = min(end, other_end)
+    if start > end:
+        return None
+    # Move in the frame of the other circle
+    x, y, v_x, v_y = _center_at(mcircle, start)
+    o_x, o_y, o_v_x, o_v_y = _center_at(other, start)
+    t = _circle_toi(
+        x, y, v_x - o_v_x, v_y - o_v_y, o_x, o_y,
+        mcircle.radius + other.radius, end - start, border)
+    if t is None:
+        return None
+    return start + t
+
+
+def moving_circle_to_circle_toi(mcircle, circle, t0, t1, border=False):
+    start, end = _window(mcircle, t0, t1)
+    if start > end:
+        return None
+    x, y, v_x, v_y = _center_at(mcircle, start)
+    c_x, c_y = circle.center
+    t = _circle_toi(
+        x, y, v_x, v_y, c_x, c_y, mcircle.radius + circle.radius,
+        end - start, border)
+    if t is None:
+        return None
+    return start + t
+
+
+def moving_circle_to_bbox_toi(mcircle, bbox, t0, t1, border=False):
+    start, end = _window(mcircle, t0, t1)
+    if start > end:
+        return None
+    x, y, v_x, v_y = _center_at(mcircle, start)
+    r = mcircle.radius
+    min_x, min_y = bbox.min_point
+    max_x, max_y = bbox.max_point
+    duration = end - start
+    # Bbox inflated by radius with rounded corners - 2 boxes and 4 circles
+    t = _first(
+        _box_toi(x, y, v_x, v_y, min_x - r, min_y, max_x + r, max_y,
+                 duration, border),
+        _box_toi(x, y, v_x, v_y, min_x, min_y - r, max_x, max_y + r,
+                 duration, border),
+        *(_circle_toi(x, y, v_x, v_y, c_x, c_y, r, duration, border)
+          for c_x, c_y in ((min_x, min_y), (min_x, max_y),
+                           (max_x, min_y), (max_x, max_y))))
+    if t is None:
+        return None
+    return start + t
+
+
+def _capsule_toi(x, y, v_x, v_y, a, b, r, duration, border):
+    """ Time of impact of a moving point and a segment inflated by `r`
+    """
+    a_x, a_y = a
+    b_x, b_y = b
+    e_x = b_x - a_x
+    e_y = b_y - a_y
+    length = math.hypot(e_x, e_y)
+    ends = (
+        _circle_toi(x, y, v_x, v_y, a_x, a_y, r, duration, border),
+        _circle_toi(x, y, v_x, v_y, b_x, b_y, r, duration, border))
+    if not length:
+        return _first(*ends)
+    u_x = e_x / length
+    u_y = e_y / length
+    # Move into segment's coordinates, where it's a box
+    w_x = x - a_x
+    w_y = y - a_y
+    return _first(
+        _box_toi(w_x * u_x + w_y * u_y, w_y * u_x - w_x * u_y,
+                 v_x * u_x + v_y * u_y, v_y * u_x - v_x * u_y,
+                 0, -r, length, r, duration, border),
+        *ends)
+
+
+def moving_circle_to_polygon_toi(mcircle, polygon, t0, t1, border=False):
+    start, end = _window(mcircle, t0, t1)
+    if start > end:
+        return None
+    x, y, v_x, v_y = _center_at(mcircle, start)
+    if polygon.contains_point(Vec2(x, y)):
+        return start
+    r = mcircle.radius
+    duration = end - start
+    vertices = polygon.vertices
+    t = _first(*(
+        _capsule_toi(x, y, v_x, v_y, vertices[i - 1], vertices[i], r,
+                     duration, border)
+        for i in range(len(vertices))))
+    if t is None:
+        return None
+    return start + t
+
+
+def inverse(func):
+    def do(shape, mcircle, t0, t1, border=False):
+        return func(mcircle, shape, t0, t1, border=border)
+    return do
+
+
+_registry = with_transformed(with_compact({
+    (MovingCircle, MovingCircle): moving_circle_to_moving_circle_toi,
+    (MovingCircle, Circle): moving_circle_to_circle_toi,
+    (Circle, MovingCircle): inverse(moving_circle_to_circle_toi),
+    (MovingCircle, BoundingBox): moving_circle_to_bbox_toi,
+    (BoundingBox, MovingCircle): inverse(moving_circle_to_bbox_toi),
+    (MovingCircle, Polygon): moving_circle_to_polygon_toi,
+    (Polygon, MovingCircle): inverse(moving_circle_to_polygon_toi),
+}))
+
+
+def time_of_impact(shape, other, t0, t1, border=False):
+    """ First time in `[t0, t1]` when shapes come into contact or None if
+        they don't. Returns `t0` (or the start of movement) if shapes
+        already overlap.
+    """
+    handler = _registry.get((type(shape), type(other)))
+    if handler is not None:
+        return handler(shape, other, t0, t1, border=border)
+    raise NotImplementedError
@@ -4,7 +4,7 @@ from planar import Vec2, Affine
 from pyglet.gl import GL_LINE_LOOP
 from pyglet.graphics import draw as gl_draw
 
-from gengine.collision import Shape, Polygon, Circle
+from gengine.collision import Shape, Polygon, Circle, TransformedPolygon
 
 
 class Component:
@@ -37,15 +37,19 @@ class Component:
 class PolygonComponent(Component):
 
     def draw(self, timestamp):
-        dt = timestamp - self.timestamp
-        shape = self.shape
-        transform = self._get_transform(dt)
-        n_points = len(shape)
+        polygon = self.world_shape(timestamp).polygon
+        n_points = len(polygon)
         flatten_array = []
-        for vertice in shape:
-            flatten_array.extend(vertice * transform)
+        for vertice in polygon:
+            flatten_array.extend(vertice)
         gl_draw(n_points, GL_LINE_LOOP, ('v2f', flatten_array))
 
+    def world_shape(self, timestamp):
+        """ Shape in world space at `timestamp`, to be indexed and collided
+        """
+        dt = timestamp - self.timestamp
+        return TransformedPolygon(self.shape, self._get_transform(dt))
+
     def _get_transform(self, dt):
         position = Affine.translation(self._position + self._velocity * dt)
         return position
@@ -1,5 +1,15 @@
+from planar import Vec2
+from gengine import collision
+from gengine.collision.kinetic import KineticIndex
+
 CAPSULE_SIZE = 10
 MASK_ALL = 0xffff
+# Area covered by spatial index around (0, 0) and it's detalisation.
+# Characters outside of it are still found, but tested one by one.
+INDEX_SIZE = 2 ** 16
+INDEX_MAX_LEVEL = 10
+# Characters are only reindexed if they move this long without changes
+INDEX_HORIZON = 10
 
 
 class SimpleObjectIndex:
@@ -8,10 +18,23 @@ class SimpleObjectIndex:
 
     def __init__(self):
         self._objects = {}
+        self._index = KineticIndex(
+            horizon=INDEX_HORIZON, center=Vec2(0, 0), size=INDEX_SIZE,
+            max_level=INDEX_MAX_LEVEL)
+        self._timestamp = None
 
     def update_character(self, obj):
         geometry = Circle(centre=obj.position, radius=CAPSULE_SIZE)
         self._objects[obj.character_id] = (geometry, obj, MASK_ALL)
+        velocity = obj.velocity
+        if velocity is None:
+            velocity = Vec2(0, 0)
+        # Characters moving along the same line are not reindexed
+        self._index.update(
+            collision.Circle(obj.position, CAPSULE_SIZE), velocity,
+            obj.timestamp, obj, _index_mask(MASK_ALL))
+        if self._timestamp is None or obj.timestamp > self._timestamp:
+            self._timestamp = obj.timestamp
 
     def get_objects_circle(self, centre, radius, query_mask=MASK_ALL):
         other = Circle(centre, radius)
@@ -19,15 +42,29 @@ class SimpleObjectIndex:
             if (query_mask & obj_mask) and geometry.intersection(other):
                 yield obj
 
-    def get_nearest_objects(self, centre, max_radius, query_mask=MASK_ALL):
+    def get_nearest_objects(self, centre, max_radius, query_mask=MASK_ALL,
+                            timestamp=None):
+        """ Objects with capsule centre in `max_radius` around `centre` at
+            `timestamp` (time of latest update by default) sorted by
+            distance.
+        """
+        if timestamp is None:
+            timestamp = self._timestamp
+        if timestamp is None:
+            return []
+        # Index measures distance to capsule border, so all capsules with
+        # centre in `max_radius` are at most `max_radius - CAPSULE_SIZE` away
+        candidates = self._index.nearest(
+            centre, timestamp, max_radius=max(max_radius - CAPSULE_SIZE, 0),
+            mask=_index_mask(query_mask))
         objs = []
-        for geometry, obj, obj_mask in self._objects.values():
-            if (query_mask & obj_mask):
-                objs.append((
-                    geometry.centre.distance_to(centre),
-                    obj
-                ))
-        objs.sort()
+        for obj in candidates:
+            position = self._index.shape_at(obj, timestamp).center
+            d = position.distance_to(centre)
+            if d <= max_radius:
+                objs.append((d, obj))
+        # Only capsules covering `centre` can be out of order here
+        objs.sort(key=lambda x: x[0])
         return [x[1] for x in objs]
 
     def get_collisions(
@@ -35,6 +72,16 @@ class SimpleObjectIndex:
         return []
 
 
+def _index_mask(mask):
+    """ Index layers are 64 bit, all world layers map to all of them. So
+        the index neither stores masks of objects in all layers nor filters
+        candidates of queries in all layers.
+    """
+    if mask == MASK_ALL:
+        return collision.MASK_ALL
+    return mask
+
+
 class Geometry:
     """ Base class for 2D shapes
     """
@@ -84,7 +84,8 @@ class WorldStateMachine:
                     self._reschedule_character(character, event_timestamp)
                     # Notify subscribers
                     affected = self._object_index.get_nearest_objects(
-                        character.position, NEARBY_RADIUS)
+                        character.position, NEARBY_RADIUS,
+                        timestamp=event_timestamp)
                     self._notify(
                         event="character_move",
                         affects=affected,
@@ -132,7 +133,7 @@ class WorldStateMachine:
 
         # Notify subscribers
         affected = self._object_index.get_nearest_objects(
-            character.position, NEARBY_RADIUS)
+            character.position, NEARBY_RADIUS, timestamp=timestamp)
         self._notify(
             event="character_load",
             affects=affected,
@@ -155,7 +156,7 @@ class WorldStateMachine:
 
         # Notify subscribes
         affected = self._object_index.get_nearest_objects(
-            character.position, NEARBY_RADIUS)
+            character.position, NEARBY_RADIUS, timestamp=timestamp)
         self._notify(
             event="character_move",
             affects=affected,
@@ -38,6 +38,10 @@ args = dict(
     url='https://github.com/Drizzt1991/gengine',
     packages=find_packages(),
     install_requires=install_requires,
+    extras_require={
+        # Batched intersection tests
+        'numpy': ['numpy'],
+    },
     entry_points={
         'console_scripts': [
             'gengine-client = gengine.client.client:main',
@@ -0,0 +1,94 @@
+from unittest import TestCase
+from gengine.collision import AABBTree, Circle, BoundingBox
+from planar import Vec2
+
+
+class TestAABBTree(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tree = AABBTree(margin=1)
+
+    def _check_node(self, node):
+        if node.is_leaf:
+            self.assertEqual(node.height, 0)
+            return
+        left, right = node.left, node.right
+        self.assertIs(left.parent, node)
+        self.assertIs(right.parent, node)
+        self.assertEqual(node.height, 1 + max(left.height, right.height))
+        self.assertEqual(
+            (node.min_x, node.min_y, node.max_x, node.max_y),
+            (min(left.min_x, right.min_x), min(left.min_y, right.min_y),
+             max(left.max_x, right.max_x), max(left.max_y, right.max_y)))
+        self._check_node(left)
+        self._check_node(right)
+
+    def test_query(self):
+        x = Circle(Vec2(30, 30), 10)
+        y = Circle(Vec2(-10, -10), 10)
+        z = Circle(Vec2(0, 0), 10)
+        # No bounds for the tree
+        far = Circle(Vec2(10000, -10000), 1)
+        for shape in (x, y, z, far):
+            self.tree.insert(shape, shape)
+        self._check_node(self.tree._root)
+
+        # Helper to ignore results order
+        def o(shapes):
+            return list(sorted(shapes, key=lambda x: x.center.x))
+
+        results = self.tree.query(
+            BoundingBox.from_center(Vec2(30, 30), 22, 22))
+        self.assertEqual(results, [x])
+        results = self.tree.query(
+            BoundingBox.from_center(Vec2(-10, 0), 2, 2))
+        self.assertEqual(o(results), o([y, z]))
+        results = self.tree.query(
+            BoundingBox.from_center(Vec2(10000, -10000), 1, 1))
+        self.assertEqual(results, [far])
+
+    def test_balance(self):
+        # Inserting objects in a line is the worst case without rotations
+        for i in range(64):
+            shape = Circle(Vec2(i * 10, 0), 1)
+            self.tree.insert(shape, i)
+        self._check_node(self.tree._root)
+        # Would be 63 if the tree was not rebalanced
+        self.assertLessEqual(self.tree.height, 12)
+        results = self.tree.query(
+            BoundingBox([Vec2(95, -5), Vec2(125, 5)]))
+        self.assertEqual(sorted(results), [10, 11, 12])
+
+    def test_update(self):
+        obj = object()
+        self.tree.insert(Circle(Vec2(0, 0), 2), obj)
+        self.tree.insert(Circle(Vec2(20, 0), 2), object())
+        leaf = self.tree._leaves[obj]
+        fat_box = (leaf.min_x, leaf.min_y, leaf.max_x, leaf.max_y)
+
+        # Small move stays inside of inflated bbox
+        self.tree.update(Circle(Vec2(0.5, 0.5), 2), obj)
+        self.assertEqual(
+            (leaf.min_x, leaf.min_y, leaf.max_x, leaf.max_y), fat_box)
+        self.assertEqual(
+            self.tree.query(Circle(Vec2(2.2, 2.2), 0.5)), [obj])
+
+        self.tree.update(Circle(Vec2(50, 0), 2), obj)
+        self.assertIs(self.tree._leaves[obj], leaf)
+        self.assertEqual(leaf.min_x, 47)
+        self.assertEqual(self.tree.query(Circle(Vec2(0, 0), 2)), [])
+        self.assertEqual(self.tree.query(Circle(Vec2(50, 0), 2)), [obj])
+        self._check_node(self.tree._root)
+
+    def test_remove(self):
+        objs = [object() for i in range(10)]
+        for i, obj in enumerate(objs):
+            self.tree.insert(Circle(Vec2(i * 5, 0), 2), obj)
+        for obj in objs[:9]:
+            self.tree.remove(obj)
+            self._check_node(self.tree._root)
+        self.assertTrue(self.tree._root.is_leaf)
+        self.tree.remove(objs[9])
+        self.assertIsNone(self.tree._root)
+        self.assertEqual(self.tree.query(Circle(Vec2(0, 0), 100)), [])
@@ -0,0 +1,94 @@
+import random
+from unittest import TestCase, skipIf
+
+from planar import Vec2
+from gengine.collision import Circle, BoundingBox, Polygon, CompactCircle, \
+    CompactBox, intersects, intersects_many, intersects_pairs
+from gengine.collision import batch
+
+
+@skipIf(batch.np is None, "NumPy is not installed")
+class TestBatchIntersection(TestCase):
+
+    def setUp(self):
+        self.shapes = [
+            Circle(Vec2(0, 0), 2),
+            Circle(Vec2(4, 0), 2),
+            Circle(Vec2(0, 5), 1),
+            Circle(Vec2(6, 6), 3),
+            BoundingBox.from_center(Vec2(0, 4), 4, 4),
+            BoundingBox([Vec2(3, 4), Vec2(5, 6)]),
+            BoundingBox([Vec2(-2, -2), Vec2(2, 2)]),
+            BoundingBox([Vec2(2, -1), Vec2(3, 1)]),
+            BoundingBox([Vec2(10, 10), Vec2(12, 12)]),
+        ]
+
+    def test_intersects_many(self):
+        shapes = self.shapes
+        for border in (False, True):
+            for shape in shapes:
+                expected = [
+                    intersects(shape, other, border=border)
+                    for other in shapes]
+                self.assertEqual(
+                    list(intersects_many(shape, shapes, border=border)),
+                    expected, (shape, border))
+
+    def test_border_aligned(self):
+        # Circles touching inflated borders of boxes. Values are not exact
+        # in binary, so both tests have to inflate boxes the same way
+        rnd = random.Random(1)
+        values = [i * 0.1 for i in range(-20, 21)]
+        radii = [i * 0.1 for i in range(1, 11)]
+        circles = []
+        boxes = []
+        for _ in range(300):
+            x = rnd.choice(values)
+            y = rnd.choice(values)
+            r = rnd.choice(radii)
+            circles.append(CompactCircle((x, y), r))
+            circles.append(Circle(Vec2(x, y), r))
+            min_x, max_x = sorted(rnd.sample(values, 2))
+            min_y, max_y = sorted(rnd.sample(values, 2))
+            boxes.append(CompactBox(min_x, min_y, max_x, max_y))
+            boxes.append(
+                BoundingBox([Vec2(min_x, min_y), Vec2(max_x, max_y)]))
+        circles.append(Circle(Vec2(0, -0.7), 0.7))
+        boxes.append(CompactBox(-2, 0, 0, 0.7))
+
+        for border in (False, True):
+            expected = [
+                intersects(circle, box, border=border)
+                for circle, box in zip(circles, boxes)]
+            self.assertEqual(
+                list(intersects_pairs(circles, boxes, border=border)),
+                expected)
+            self.assertEqual(
+                list(intersects_pairs(boxes, circles, border=border)),
+                expected)
+
+    def test_fallback(self):
+        # No kernel for polygons, scalar test is used
+        polygon = Polygon([Vec2(0, 0), Vec2(0, 2), Vec2(2, 2)])
+        bbox = BoundingBox([Vec2(1, 1), Vec2(3, 3)])
+        others = [polygon, bbox, BoundingBox([Vec2(5, 5), Vec2(6, 6)])]
+        self.assertEqual(
+            list(intersects_many(bbox, others)), [True, True, False])
+
+    def test_intersects_pairs(self):
+        shapes = self.shapes
+        left = []
+        right = []
+        for shape in shapes:
+            for other in shapes:
+                left.append(shape)
+                right.append(other)
+        for border in (False, True):
+            expected = [
+                intersects(shape, other, border=border)
+                for shape, other in zip(left, right)]
+            self.assertEqual(
+                list(intersects_pairs(left, right, border=border)), expected)
+
+        with self.assertRaises(ValueError):
+            intersects_pairs(left, right[1:])
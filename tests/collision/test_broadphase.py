@@ -0,0 +1,98 @@
+import math
+from unittest import TestCase
+from gengine.collision import SweepAndPrune, Circle, BoundingBox
+from gengine.collision.broadphase import owned_area
+from planar import Vec2
+
+
+class TestSweepAndPrune(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.sap = SweepAndPrune()
+
+    def _pairs(self, pairs):
+        return set(frozenset(pair) for pair in pairs)
+
+    def _check_sorted(self):
+        for endpoints in self.sap._axes:
+            keys = [endpoint.key() for endpoint in endpoints]
+            self.assertEqual(keys, sorted(keys))
+            self.assertEqual(
+                [endpoint.index for endpoint in endpoints],
+                list(range(len(endpoints))))
+
+    def test_insert(self):
+        a = BoundingBox([Vec2(0, 0), Vec2(4, 4)])
+        b = BoundingBox([Vec2(2, 2), Vec2(6, 6)])
+        c = BoundingBox([Vec2(5, -5), Vec2(8, 1)])
+        # Only touches `a`
+        d = BoundingBox([Vec2(4, 0), Vec2(5, 4)])
+        for shape in (a, b, c, d):
+            self.sap.insert(shape, shape)
+        self._check_sorted()
+
+        self.assertEqual(
+            self._pairs(self.sap.pairs),
+            {frozenset([a, b]), frozenset([b, d])})
+        began, ended = self.sap.flush()
+        self.assertEqual(self._pairs(began), self._pairs(self.sap.pairs))
+        self.assertEqual(ended, set())
+        self.assertEqual(self.sap.flush(), (set(), set()))
+
+    def test_update(self):
+        a = object()
+        b = object()
+        self.sap.insert(Circle(Vec2(0, 0), 2), a)
+        self.sap.insert(Circle(Vec2(10, 0), 2), b)
+        self.assertEqual(self.sap.flush(), (set(), set()))
+
+        # Move `a` towards `b` step by step
+        self.sap.update(Circle(Vec2(4, 0), 2), a)
+        self.assertEqual(self.sap.flush(), (set(), set()))
+        self.sap.update(Circle(Vec2(7, 0), 2), a)
+        began, ended = self.sap.flush()
+        self.assertEqual(self._pairs(began), {frozenset([a, b])})
+        self.assertEqual(ended, set())
+        self._check_sorted()
+
+        # Jump over `b` in a single update
+        self.sap.update(Circle(Vec2(20, 0), 2), a)
+        began, ended = self.sap.flush()
+        self.assertEqual(began, set())
+        self.assertEqual(self._pairs(ended), {frozenset([a, b])})
+        self._check_sorted()
+
+        # Begin and end between flushes cancel out
+        self.sap.update(Circle(Vec2(11, 1), 2), a)
+        self.sap.update(Circle(Vec2(11, 30), 2), a)
+        self.assertEqual(self.sap.flush(), (set(), set()))
+
+    def test_remove(self):
+        a = BoundingBox([Vec2(0, 0), Vec2(4, 4)])
+        b = BoundingBox([Vec2(2, 2), Vec2(6, 6)])
+        self.sap.insert(a, a)
+        self.sap.insert(b, b)
+        self.sap.flush()
+
+        self.sap.remove(a)
+        self._check_sorted()
+        began, ended = self.sap.flush()
+        self.assertEqual(self._pairs(ended), {frozenset([a, b])})
+        self.assertEqual(self.sap.pairs, frozenset())
+        self.assertEqual(len(self.sap._axes[0]), 2)
+
+
+class TestOwnedArea(TestCase):
+
+    def test_owned_area(self):
+        root = (-40, -40, 40, 40)
+        inf = math.inf
+        self.assertEqual(
+            owned_area((-10, -10, 0, 0), root), (-10, -10, 0, 0))
+        # Border nodes own everything past the root border
+        self.assertEqual(
+            owned_area((0, 0, 40, 40), root), (0, 0, inf, inf))
+        self.assertEqual(
+            owned_area((-40, 0, 0, 40), root), (-inf, 0, 0, inf))
+        self.assertEqual(owned_area(root, root), (-inf, -inf, inf, inf))
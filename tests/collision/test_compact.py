@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+from planar import Vec2
+from gengine.collision import Circle, BoundingBox, CompactCircle, \
+    CompactBox, QuadTree, intersects, contains
+
+
+class TestCompactShapes(TestCase):
+
+    def test_immutable(self):
+        circle = CompactCircle((1, 2), 3)
+        with self.assertRaises(AttributeError):
+            circle.radius = 4
+        with self.assertRaises(AttributeError):
+            circle.foo = 4
+        self.assertFalse(hasattr(circle, "__dict__"))
+        box = CompactBox(0, 0, 2, 2)
+        with self.assertRaises(AttributeError):
+            box.min_x = 1
+        self.assertFalse(hasattr(box, "__dict__"))
+
+    def test_bbox(self):
+        circle = CompactCircle(Vec2(1, 2), 3)
+        self.assertEqual(circle.center, Vec2(1, 2))
+        self.assertEqual(circle.bounding_box, CompactBox(-2, -1, 4, 5))
+        # Computed once
+        self.assertIs(circle.bounding_box, circle.bounding_box)
+        with self.assertRaises(AttributeError):
+            circle.bounding_box = CompactBox(0, 0, 1, 1)
+        box = CompactBox.from_bbox(BoundingBox([Vec2(3, 4), Vec2(1, 2)]))
+        self.assertEqual(box, CompactBox(1, 2, 3, 4))
+        self.assertEqual(box.min_point, Vec2(1, 2))
+        self.assertEqual(box.max_point, Vec2(3, 4))
+        self.assertEqual(box.center, Vec2(2, 3))
+        self.assertEqual(box.inflate(2), CompactBox(0, 1, 4, 5))
+
+    def test_same_as_planar(self):
+        circles = [
+            Circle(Vec2(0.3, 0.1), 2), Circle(Vec2(4.5, 0.2), 2),
+            Circle(Vec2(0.1, 5.3), 1), Circle(Vec2(1, 1), 10)]
+        boxes = [
+            BoundingBox.from_center(Vec2(0, 4), 4, 4),
+            BoundingBox([Vec2(3, 4), Vec2(5, 6)]),
+            BoundingBox([Vec2(-2, -2), Vec2(2, 2)]),
+            BoundingBox([Vec2(10, 10), Vec2(12, 12)])]
+        pairs = [
+            (circle, CompactCircle(circle.center, circle.radius))
+            for circle in circles]
+        pairs += [(box, CompactBox.from_bbox(box)) for box in boxes]
+
+        for shape, compact in pairs:
+            for other, other_compact in pairs:
+                for border in (False, True):
+                    self.assertEqual(
+                        intersects(compact, other_compact, border),
+                        intersects(shape, other, border), (shape, other))
+                    self.assertEqual(
+                        intersects(shape, other_compact, border),
+                        intersects(shape, other, border), (shape, other))
+                self.assertEqual(
+                    contains(compact, other_compact),
+                    contains(shape, other), (shape, other))
+
+    def test_quadtree(self):
+        tree = QuadTree(center=Vec2(0, 0), size=80, max_level=3)
+        x = CompactCircle((30, 30), 10)
+        y = CompactCircle((-10, -10), 10)
+        z = CompactBox(-2, -2, 2, 5)
+        for shape in (x, y, z):
+            tree.insert(shape, shape)
+
+        self.assertEqual(
+            tree.query(CompactBox.from_center((30, 30), 22, 22)), [x])
+        self.assertEqual(
+            set(tree.query(BoundingBox.from_center(Vec2(-3, 0), 4, 4))),
+            {y, z})
+        self.assertEqual(tree.query(CompactCircle((22, 22), 2)), [x])
+        tree.update(CompactCircle((30, 30), 5), x)
+        self.assertEqual(tree.query(CompactCircle((22, 22), 2)), [])
+        tree.remove(y)
+        self.assertEqual(tree.query(CompactBox(-40, -40, 0, 0)), [z])
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from planar import Vec2
+from gengine.collision import Circle, BoundingBox, Polygon, intersects, \
+    closest_points, penetration
+from gengine.collision.gjk import support, separation
+
+
+class TestGJK(TestCase):
+
+    def setUp(self):
+        self.square = Polygon([
+            Vec2(2, -1), Vec2(2, 1), Vec2(4, 1), Vec2(4, -1)])
+
+    def assertVecEqual(self, vec, expected):
+        self.assertAlmostEqual(vec.x, expected[0])
+        self.assertAlmostEqual(vec.y, expected[1])
+
+    def test_support(self):
+        self.assertEqual(
+            support(Circle(Vec2(1, 1), 2), Vec2(0, -3)), Vec2(1, -1))
+        self.assertEqual(
+            support(BoundingBox([Vec2(0, 0), Vec2(2, 3)]), Vec2(1, -1)),
+            Vec2(2, 0))
+        self.assertEqual(support(self.square, Vec2(-1, 1)), Vec2(2, 1))
+
+    def test_circle_polygon(self):
+        self.assertFalse(intersects(Circle(Vec2(0, 0), 1), self.square))
+        self.assertTrue(intersects(self.square, Circle(Vec2(0, 0), 2.5)))
+        # Touches the left edge
+        circle = Circle(Vec2(0, 0), 2)
+        self.assertFalse(intersects(circle, self.square))
+        self.assertTrue(intersects(circle, self.square, border=True))
+        # Inside of polygon
+        self.assertTrue(intersects(Circle(Vec2(3, 0), 0.5), self.square))
+        self.assertTrue(intersects(Circle(Vec2(3, 0), 5), self.square))
+
+    def test_closest_points(self):
+        dist, point, other_point = closest_points(
+            Circle(Vec2(0, 0), 1), self.square)
+        self.assertAlmostEqual(dist, 1)
+        self.assertVecEqual(point, (1, 0))
+        self.assertVecEqual(other_point, (2, 0))
+
+        dist, point, other_point = closest_points(
+            self.square, BoundingBox([Vec2(5, 2), Vec2(6, 3)]))
+        self.assertAlmostEqual(dist, 2 ** 0.5)
+        self.assertVecEqual(point, (4, 1))
+        self.assertVecEqual(other_point, (5, 2))
+
+        self.assertIsNone(closest_points(Circle(Vec2(0, 0), 3), self.square))
+
+    def test_penetration(self):
+        # Boxes overlap by 1 along X
+        depth, normal = penetration(
+            BoundingBox([Vec2(0, 0), Vec2(2, 2)]),
+            BoundingBox([Vec2(1, 0), Vec2(3, 2)]))
+        self.assertAlmostEqual(depth, 1)
+        self.assertVecEqual(normal, (1, 0))
+
+        depth, normal = penetration(
+            Circle(Vec2(0, 0), 1), Circle(Vec2(1.5, 0), 1))
+        self.assertAlmostEqual(depth, 0.5)
+        self.assertVecEqual(normal, (1, 0))
+
+        # Circle center is inside of the polygon
+        depth, normal = penetration(Circle(Vec2(2.5, 0), 0.25), self.square)
+        self.assertAlmostEqual(depth, 0.75)
+        self.assertVecEqual(normal, (1, 0))
+
+        self.assertIsNone(penetration(Circle(Vec2(0, 0), 1), self.square))
+        self.assertAlmostEqual(
+            separation(Circle(Vec2(0, 0), 1), self.square), 1)
+        self.assertAlmostEqual(
+            separation(Circle(Vec2(2.5, 0), 0.25), self.square), -0.75)
@@ -2,7 +2,7 @@ from unittest import TestCase, skip
 
 from planar import Vec2
 from gengine.collision import Circle, BoundingBox, intersects, contains, \
-    Polygon
+    Polygon, MovingCircle
 
 
 class TestBBoxToCircle(TestCase):
@@ -211,3 +211,131 @@ class TestPolygonPolygon(TestCase):
         self.assertTrue(intersects(pol1, pol2, border=True))
         self.assertFalse(contains(pol1, pol2))
         self.assertFalse(contains(pol1, pol2))
+
+
+class TestPolygonAxes(TestCase):
+
+    def test_axes(self):
+        # Opposite edges of the rectangle share projection axes
+        pol = BoundingBox([Vec2(0, 0), Vec2(4, 2)]).to_polygon()
+        self.assertEqual(set(pol.axes), {(1, 0), (0, 1)})
+        self.assertEqual(
+            dict(zip(pol.axes, pol.extents)), {(1, 0): (0, 4), (0, 1): (0, 2)})
+        self.assertEqual(pol.box_extents, (0, 0, 4, 2))
+        # Cached
+        self.assertIs(pol.axes, pol.axes)
+        self.assertIs(pol.edges, pol.edges)
+
+    def test_triangle(self):
+        pol = Polygon([Vec2(0, 0), Vec2(0, 2), Vec2(2, 2)])
+        self.assertEqual(len(pol.axes), 3)
+        for (x, y), (min_p, max_p) in zip(pol.axes, pol.extents):
+            self.assertAlmostEqual(x * x + y * y, 1)
+            self.assertLessEqual(min_p, max_p)
+
+
+class TestConvexPieces(TestCase):
+
+    def setUp(self):
+        # U shape with the notch from the top
+        self.u_shape = Polygon([
+            Vec2(0, 0), Vec2(6, 0), Vec2(6, 6), Vec2(4, 6), Vec2(4, 2),
+            Vec2(2, 2), Vec2(2, 6), Vec2(0, 6)])
+
+    def area(self, polygon):
+        points = list(polygon)
+        return abs(sum(
+            points[i - 1].x * points[i].y - points[i].x * points[i - 1].y
+            for i in range(len(points)))) / 2
+
+    def test_pieces(self):
+        triangle = Polygon([Vec2(0, 0), Vec2(0, 2), Vec2(2, 2)])
+        self.assertEqual(triangle.convex_pieces, (triangle,))
+        pieces = self.u_shape.convex_pieces
+        self.assertIs(self.u_shape.convex_pieces, pieces)
+        self.assertGreater(len(pieces), 1)
+        for piece in pieces:
+            self.assertTrue(piece.is_convex)
+        self.assertAlmostEqual(
+            sum(self.area(piece) for piece in pieces), 28)
+        self.assertEqual(
+            self.u_shape.bounding_box,
+            BoundingBox([Vec2(0, 0), Vec2(6, 6)]))
+
+    def test_intersects(self):
+        # Shapes inside of the notch do not touch the polygon
+        notch = BoundingBox([Vec2(2.5, 3), Vec2(3.5, 5)])
+        self.assertFalse(intersects(self.u_shape, notch))
+        self.assertFalse(intersects(notch, self.u_shape))
+        self.assertFalse(intersects(
+            self.u_shape, Polygon([Vec2(3, 3), Vec2(2.5, 5), Vec2(3.5, 5)])))
+        self.assertFalse(intersects(Circle(Vec2(3, 4), 0.5), self.u_shape))
+        # Only touches the bottom of the notch
+        notch = BoundingBox([Vec2(2.5, 2), Vec2(3.5, 5)])
+        self.assertFalse(intersects(self.u_shape, notch))
+        self.assertTrue(intersects(self.u_shape, notch, border=True))
+
+        self.assertTrue(intersects(
+            self.u_shape, BoundingBox([Vec2(1, 3), Vec2(3, 5)])))
+        self.assertTrue(intersects(Circle(Vec2(3, 1), 0.5), self.u_shape))
+        self.assertTrue(intersects(self.u_shape, Polygon([
+            Vec2(1, 5), Vec2(5, 5), Vec2(5, 7), Vec2(1, 7)])))
+        other = Polygon([
+            Vec2(3, 3), Vec2(3, 8), Vec2(8, 8), Vec2(8, 7), Vec2(5, 7),
+            Vec2(5, 3)])
+        self.assertTrue(intersects(self.u_shape, other))
+
+
+class TestMovingCircle(TestCase):
+
+    def setUp(self):
+        # Moves from (0, 0) to (10, 0) in 1 second
+        self.mc = MovingCircle.from_velocity(
+            Circle(Vec2(0, 0), 1), Vec2(10, 0), timestamp=0, dt=1)
+
+    def test_bbox(self):
+        mc = self.mc
+        self.assertEqual(
+            mc.bounding_box, BoundingBox([Vec2(-1, -1), Vec2(11, 1)]))
+        r = BoundingBox.from_center(Vec2(5, 5), 2, 2)
+        self.assertFalse(intersects(mc, r))
+        # Touched by the shaft between start and end positions
+        r = BoundingBox.from_center(Vec2(5, 1.5), 2, 2)
+        self.assertTrue(intersects(mc, r))
+        self.assertTrue(intersects(r, mc))
+        r = BoundingBox.from_center(Vec2(12.5, 0), 2, 2)
+        self.assertFalse(intersects(mc, r))
+        r = BoundingBox.from_center(Vec2(11.5, 0), 2, 2)
+        self.assertTrue(intersects(mc, r))
+
+    def test_not_moving(self):
+        mc = MovingCircle.from_velocity(
+            Circle(Vec2(0, 0), 1), Vec2(0, 0), timestamp=0, dt=1)
+        self.assertTrue(
+            intersects(mc, BoundingBox.from_center(Vec2(0, 1.5), 2, 2)))
+        self.assertFalse(
+            intersects(mc, BoundingBox.from_center(Vec2(0, 2.5), 2, 2)))
+
+    def test_circle(self):
+        mc = self.mc
+        self.assertFalse(intersects(mc, Circle(Vec2(5, 3), 1)))
+        self.assertFalse(intersects(mc, Circle(Vec2(5, 2), 1)))
+        self.assertTrue(intersects(mc, Circle(Vec2(5, 2), 1), border=True))
+        self.assertTrue(intersects(Circle(Vec2(5, 1), 1), mc))
+
+    def test_moving_circle(self):
+        mc = self.mc
+        towards = MovingCircle.from_velocity(
+            Circle(Vec2(10, 0), 1), Vec2(-10, 0), timestamp=0, dt=1)
+        self.assertTrue(intersects(mc, towards))
+        parallel = MovingCircle.from_velocity(
+            Circle(Vec2(0, 5), 1), Vec2(10, 0), timestamp=0, dt=1)
+        self.assertFalse(intersects(mc, parallel))
+        # Paths cross, but circles pass the crossing at different times
+        crossing = MovingCircle.from_velocity(
+            Circle(Vec2(10, -5), 1), Vec2(0, 10), timestamp=0, dt=1)
+        self.assertFalse(intersects(mc, crossing))
+        # Same path, but later
+        later = MovingCircle.from_velocity(
+            Circle(Vec2(10, 0), 1), Vec2(-10, 0), timestamp=2, dt=1)
+        self.assertFalse(intersects(mc, later))
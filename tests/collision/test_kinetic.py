@@ -0,0 +1,119 @@
+from unittest import TestCase
+from gengine.collision import Circle, BoundingBox
+from gengine.collision.kinetic import KineticIndex
+from planar import Vec2
+
+
+class TestKineticIndex(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.index = KineticIndex(
+            horizon=10,
+            center=Vec2(0, 0),
+            size=200,  # BBOX (-100, -100) to (100, 100)
+            max_level=4,
+            )
+
+    def test_query(self):
+        index = self.index
+        # Moves right by 5 per second
+        index.insert(Circle(Vec2(-50, 0), 2), Vec2(5, 0), 0, "mover")
+        index.insert(Circle(Vec2(20, 20), 2), Vec2(0, 0), 0, "static")
+
+        area = BoundingBox.from_center(Vec2(20, 20), 10, 10)
+        self.assertEqual(index.query(area, 0), ["static"])
+        index.remove("static")
+        self.assertEqual(index.query(area, 0), [])
+
+        area = BoundingBox.from_center(Vec2(0, 0), 10, 10)
+        self.assertEqual(index.query(area, 0), [])
+        self.assertEqual(
+            index.shape_at("mover", 4).center, Vec2(-30, 0))
+        self.assertEqual(index.query(area, 10), ["mover"])
+        self.assertEqual(index.query(area, 12), [])
+
+    def test_masks(self):
+        index = self.index
+        index.insert(Circle(Vec2(-50, 0), 2), Vec2(5, 0), 0, "bullet", 1)
+        index.insert(Circle(Vec2(0, 0), 2), Vec2(0, 0), 0, "ship", 2)
+
+        area = BoundingBox.from_center(Vec2(0, 0), 10, 10)
+        self.assertEqual(index.query(area, 10, mask=1), ["bullet"])
+        self.assertEqual(index.query(area, 10, mask=2), ["ship"])
+        # Same trajectory in another layer
+        index.update(Circle(Vec2(0, 0), 2), Vec2(5, 0), 10, "bullet", 2)
+        self.assertEqual(index.query(area, 10, mask=1), [])
+        self.assertEqual(
+            set(index.query(area, 10, mask=2)), {"bullet", "ship"})
+
+    def test_nearest(self):
+        index = self.index
+        # Swept box of the mover covers the origin all the time
+        index.insert(Circle(Vec2(-50, 0), 2), Vec2(5, 0), 0, "mover", 1)
+        index.insert(Circle(Vec2(10, 0), 2), Vec2(0, 0), 0, "static", 1)
+        index.insert(Circle(Vec2(0, 30), 2), Vec2(0, 0), 0, "far", 2)
+
+        origin = Vec2(0, 0)
+        self.assertEqual(
+            index.nearest(origin, 0), ["static", "far", "mover"])
+        self.assertEqual(index.nearest(origin, 0, k=1), ["static"])
+        self.assertEqual(
+            index.nearest(origin, 9), ["mover", "static", "far"])
+        self.assertEqual(
+            index.nearest((0, 0), 9, max_radius=10), ["mover", "static"])
+        self.assertEqual(index.nearest(origin, 9, mask=2), ["far"])
+        self.assertEqual(index.nearest(origin, 9, k=0), [])
+
+    def test_outside(self):
+        index = self.index
+        index.insert(Circle(Vec2(500, 0), 2), Vec2(0, 0), 0, "far", 1)
+        # Leaves the tree in it's horizon
+        index.insert(Circle(Vec2(90, 0), 2), Vec2(5, 0), 0, "mover", 2)
+        index.insert(Circle(Vec2(0, 0), 2), Vec2(0, 0), 0, "static", 2)
+
+        area = BoundingBox.from_center(Vec2(500, 0), 10, 10)
+        self.assertEqual(index.query(area, 0), ["far"])
+        self.assertEqual(index.query(area, 0, mask=2), [])
+        area = BoundingBox.from_center(Vec2(130, 0), 10, 10)
+        self.assertEqual(index.query(area, 8), ["mover"])
+
+        origin = Vec2(0, 0)
+        self.assertEqual(
+            index.nearest(origin, 0), ["static", "mover", "far"])
+        self.assertEqual(index.nearest(Vec2(400, 0), 8, k=1), ["far"])
+        self.assertEqual(index.nearest(origin, 0, mask=1), ["far"])
+        self.assertEqual(
+            index.nearest(origin, 0, max_radius=100), ["static", "mover"])
+
+        index.remove("far")
+        self.assertEqual(index.nearest(origin, 0, mask=1), [])
+
+    def test_update(self):
+        index = self.index
+        index.insert(Circle(Vec2(-50, 0), 2), Vec2(5, 0), 0, "mover")
+        trajectory = index._trajectories["mover"]
+
+        # Still on the same trajectory, nothing reindexed
+        index.update(Circle(Vec2(-40, 0), 2), Vec2(5, 0), 2, "mover")
+        self.assertIs(index._trajectories["mover"], trajectory)
+
+        # Turned up
+        index.update(Circle(Vec2(-40, 0), 2), Vec2(0, 5), 2, "mover")
+        self.assertIsNot(index._trajectories["mover"], trajectory)
+        area = BoundingBox.from_center(Vec2(-40, 20), 4, 4)
+        self.assertEqual(index.query(area, 6), ["mover"])
+        self.assertEqual(
+            index.query(BoundingBox.from_center(Vec2(-20, 0), 4, 4), 6), [])
+
+    def test_horizon(self):
+        index = self.index
+        index.insert(Circle(Vec2(-90, 0), 2), Vec2(5, 0), 0, "mover")
+        area = BoundingBox.from_center(Vec2(50, 0), 10, 10)
+        # Position after the horizon is still found, object is reindexed
+        # from the queried time
+        self.assertEqual(index.query(area, 28), ["mover"])
+        trajectory = index._trajectories["mover"]
+        self.assertEqual(trajectory.timestamp, 28)
+        self.assertEqual(trajectory.shape.center, Vec2(50, 0))
+        self.assertEqual(index.query(area, 36), [])
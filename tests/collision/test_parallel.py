@@ -0,0 +1,98 @@
+from unittest import TestCase, skipIf
+
+from planar import Vec2
+from gengine.collision import Circle, BoundingBox, Polygon, MovingCircle, \
+    ParallelNarrowPhase, intersects, penetration
+from gengine.collision import parallel
+
+
+@skipIf(parallel.shared_memory is None, "Requires shared_memory")
+class TestParallelNarrowPhase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Test all pairs in workers
+        self.executor = ParallelNarrowPhase(2, min_pairs=0)
+        self.addCleanup(self.executor.close)
+
+    def make_shapes(self):
+        square = Polygon([
+            Vec2(2, -1), Vec2(2, 1), Vec2(4, 1), Vec2(4, -1)])
+        concave = Polygon([
+            Vec2(0, 0), Vec2(6, 0), Vec2(6, 6), Vec2(4, 6), Vec2(4, 2),
+            Vec2(2, 2), Vec2(2, 6), Vec2(0, 6)])
+        return [
+            Circle(Vec2(0, 0), 1),
+            Circle(Vec2(1, 0), 1),
+            Circle(Vec2(3, 4), 0.5),
+            BoundingBox([Vec2(-1, -1), Vec2(1, 1)]),
+            BoundingBox([Vec2(1, 1), Vec2(3, 3)]),
+            square,
+            concave,
+            MovingCircle.from_velocity(
+                Circle(Vec2(-5, 0), 1), Vec2(10, 0), 0, 1),
+        ]
+
+    def make_pairs(self):
+        shapes = self.make_shapes()
+        return [(shape, other) for shape in shapes for other in shapes]
+
+    def test_intersects(self):
+        pairs = self.make_pairs()
+        for border in (False, True):
+            expected = [
+                intersects(shape, other, border=border)
+                for shape, other in pairs]
+            self.assertEqual(
+                self.executor.intersects(pairs, border=border), expected)
+
+    def test_contacts(self):
+        circle = Circle(Vec2(0, 0), 2)
+        pairs = [
+            (circle, Circle(Vec2(3, 0), 2)),
+            (circle, Circle(Vec2(5, 0), 2)),
+            (BoundingBox([Vec2(-1, -1), Vec2(1, 1)]), circle),
+        ] * 10
+        result = self.executor.contacts(pairs)
+        self.assertEqual(len(result), len(pairs))
+        for (shape, other), contact in zip(pairs, result):
+            expected = penetration(shape, other)
+            if expected is None:
+                self.assertIsNone(contact)
+                continue
+            depth, normal = contact
+            self.assertAlmostEqual(depth, expected[0])
+            self.assertAlmostEqual(normal.x, expected[1].x)
+            self.assertAlmostEqual(normal.y, expected[1].y)
+
+    def test_in_process(self):
+        pairs = self.make_pairs()
+        executor = ParallelNarrowPhase(2, min_pairs=len(pairs) + 1)
+        self.assertEqual(
+            executor.intersects(pairs),
+            [intersects(shape, other) for shape, other in pairs])
+        # Pool is not even started
+        self.assertIsNone(executor._pool)
+        self.assertEqual(self.executor.intersects([]), [])
+        with self.assertRaises(ValueError):
+            ParallelNarrowPhase(0)
+
+        # Workers are only used with explicit `min_pairs`
+        executor = ParallelNarrowPhase(2)
+        executor.intersects(pairs)
+        self.assertIsNone(executor._pool)
+
+    def test_pack(self):
+        square, concave = self.make_shapes()[5:7]
+
+        unpacked = parallel._unpack(*parallel._pack_polygon(square))
+        self.assertEqual(list(unpacked), list(square))
+        self.assertTrue(unpacked.is_convex)
+        # Pieces are packed, not decomposed again
+        unpacked = parallel._unpack(*parallel._pack_polygon(concave))
+        self.assertEqual(list(unpacked), list(concave))
+        self.assertFalse(unpacked.is_convex)
+        self.assertIn("convex_pieces", unpacked.__dict__)
+        self.assertEqual(
+            [list(piece) for piece in unpacked.convex_pieces],
+            [list(piece) for piece in concave.convex_pieces])
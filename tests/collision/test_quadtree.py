@@ -1,40 +1,37 @@
-
-from unittest import TestCase
-from gengine.collision import QuadTree, Circle, BoundingBox
+from unittest import TestCase, mock, skipIf
+from gengine.collision import QuadTree, Circle, BoundingBox, intersects, \
+    MovingCircle
+from gengine.collision import quadtree, batch
+from gengine.collision.shapes import LineSegment
+from gengine.collision.quadtree import MASK_ALL, BATCH_MIN_CANDIDATES
+from gengine.collision.broadphase import overlap_origin
 from planar import Vec2
 
 
+TREE_OPTIONS = [
+    {}, {"max_objects": 2}, {"looseness": 2}, {"flat": True},
+    {"occupancy": True}]
+
+
 class TestQuadTree(TestCase):
+    """ Behaviour, that does not depend on how nodes are stored. Subclasses
+        run it for other modes by overriding `tree_options`.
+    """
     maxDiff = None
+    tree_options = {}
 
     def setUp(self):
         super().setUp()
-        self.tree = QuadTree(
+        self.tree = self.make_tree()
+
+    def make_tree(self, **kw):
+        options = dict(
             center=Vec2(0, 0),
             size=80,  # BBOX (-40, -40) to (40, 40)
-            max_level=3,  # Min BOX 10X10
-            )
-
-    def _get_nodes_data(self, tree):
-        return self._get_node_data(tree._root)
-
-    def _get_node_data(self, node):
-        data = {
-            "level": node._level,
-            # "bbox": [
-            #     tuple(node._bbox.min_point),
-            #     tuple(node._bbox.max_point),
-            # ],
-        }
-        if node._objects:
-            data["objects"] = [
-                obj for _, (_, obj) in node._objects]
-
-        if node.nodes:
-            data['nodes'] = nodes = []
-            for inner_node in node.nodes:
-                nodes.append(self._get_node_data(inner_node))
-        return data
+            max_level=3)  # Min BOX 10X10
+        options.update(self.tree_options)
+        options.update(kw)
+        return QuadTree(**options)
 
     def test_query(self):
         x = Circle(Vec2(30, 30), 10)
@@ -45,7 +42,8 @@ class TestQuadTree(TestCase):
         self.tree.insert(z, z)
 
         # Helper to ignore results order
-        o = lambda x: list(sorted(x, key=lambda x: x.center.x))
+        def o(shapes):
+            return list(sorted(shapes, key=lambda x: x.center.x))
 
         # Contains circle
         results = self.tree.query(
@@ -83,6 +81,384 @@ class TestQuadTree(TestCase):
             BoundingBox.from_center(Vec2(0, 0), 80, 80))
         self.assertEqual(o(results), o([x, y, z]))
 
+    def test_remove(self):
+        bbox = BoundingBox([Vec2(-2, -2), Vec2(2, 5)])
+        other = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.insert(bbox, bbox)
+        self.tree.insert(other, other)
+        self.tree.remove(bbox)
+
+        self.assertNotIn(bbox, self.tree._handles)
+        self.assertEqual(self.tree.query(bbox), [other])
+        self.tree.remove(other)
+        self.assertEqual(self.tree.query(bbox), [])
+        self.assertEqual(list(self.tree._root.get_all_objects()), [])
+        # Unknown objects are ignored
+        self.tree.remove(other)
+
+    def test_update(self):
+        obj = object()
+        # In [(-10, -10), (0, 0)] quadrant
+        bbox = BoundingBox([Vec2(-3, -3), Vec2(-1, -1)])
+        self.tree.insert(bbox, obj)
+
+        # In [(0, 0), (10, 10)] quadrant
+        new_bbox = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.update(new_bbox, obj)
+
+        self.assertEqual(self.tree.query(bbox), [])
+        self.assertEqual(self.tree.query(new_bbox), [obj])
+        self.assertEqual(
+            list(self.tree._root.get_all_objects()),
+            [(new_bbox, (new_bbox, obj))])
+
+    def test_update_in_place(self):
+        obj = object()
+        bbox = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.insert(bbox, obj)
+        holders = self.tree._handles[obj]
+
+        # Still in [(0, 0), (10, 10)] quadrant
+        new_bbox = BoundingBox([Vec2(5, 5), Vec2(9, 9)])
+        self.tree.update(new_bbox, obj)
+
+        self.assertIs(self.tree._handles[obj], holders)
+        self.assertEqual(self.tree.query(bbox), [])
+        self.assertEqual(self.tree.query(new_bbox), [obj])
+
+    def test_equal_keys(self):
+        # Objects are looked up by equality, as in a dict
+        key = int("1000")
+        other_key = int("1000")
+        self.assertIsNot(key, other_key)
+        self.tree.insert(BoundingBox([Vec2(1, 1), Vec2(4, 4)]), key)
+
+        bbox = BoundingBox([Vec2(5, 5), Vec2(9, 9)])
+        self.tree.update(bbox, other_key)
+        self.assertEqual(self.tree.query(bbox), [key])
+        new_bbox = BoundingBox([Vec2(-9, -9), Vec2(-5, -5)])
+        self.tree.update(new_bbox, int("1000"))
+        self.assertEqual(self.tree.query(bbox), [])
+        self.assertEqual(self.tree.query(new_bbox), [key])
+
+        self.tree.remove(int("1000"))
+        self.assertEqual(self.tree.query(new_bbox), [])
+        self.assertEqual(self.tree._handles, {})
+
+    def test_bulk_load(self):
+        shapes = [
+            # Single cell shapes
+            BoundingBox([Vec2(1, 1), Vec2(4, 4)]),
+            BoundingBox([Vec2(-3, -3), Vec2(-1, -1)]),
+            BoundingBox([Vec2(31, -39), Vec2(39, -31)]),
+            Circle(Vec2(25, 25), 2),
+            # Spans 4 quadrants
+            BoundingBox([Vec2(-2, -2), Vec2(2, 5)]),
+            # Outside of tree
+            BoundingBox([Vec2(50, 50), Vec2(60, 60)]),
+        ]
+        for shape in shapes:
+            self.tree.insert(shape, shape)
+        tree = QuadTree.bulk_load(
+            [(shape, shape) for shape in reversed(shapes)],
+            center=Vec2(0, 0), size=80, max_level=3, **self.tree_options)
+
+        query = BoundingBox.from_center(Vec2(0, 0), 80, 80)
+        self.assertEqual(
+            sorted(map(id, tree.query(query))),
+            sorted(map(id, self.tree.query(query))))
+        tree.remove(shapes[0])
+        self.assertEqual(tree.query(shapes[0]), [shapes[4]])
+
+    def test_nearest(self):
+        x = Circle(Vec2(30, 30), 5)
+        y = Circle(Vec2(-10, -10), 5)
+        z = Circle(Vec2(2, 2), 1)
+        big = BoundingBox([Vec2(-2, -2), Vec2(2, 5)])
+        for shape in (x, y, z, big):
+            self.tree.insert(shape, shape)
+
+        self.assertEqual(self.tree.nearest(Vec2(0, 0), k=1), [big])
+        self.assertEqual(
+            self.tree.nearest(Vec2(20, 20), k=3), [x, big, z])
+        self.assertEqual(
+            self.tree.nearest((-10, -20), max_radius=6), [y])
+        self.assertEqual(
+            self.tree.nearest(Vec2(0, 0)), [big, z, y, x])
+        self.assertEqual(self.tree.nearest(Vec2(0, 0), k=0), [])
+        # Empty mask matches no objects, even those in all layers
+        self.assertEqual(self.tree.nearest(Vec2(0, 0), mask=0), [])
+
+    def test_raycast(self):
+        x = Circle(Vec2(30, 30), 5)
+        y = Circle(Vec2(-10, -10), 5)
+        z = Circle(Vec2(2, 2), 1)
+        big = BoundingBox([Vec2(-2, -2), Vec2(2, 5)])
+        for shape in (x, y, z, big):
+            self.tree.insert(shape, shape)
+
+        self.assertEqual(
+            self.tree.raycast(Vec2(-35, 0), Vec2(1, 0), 100),
+            (big, 33, Vec2(-2, 0)))
+        self.assertEqual(
+            self.tree.raycast(Vec2(-35, -10), Vec2(2, 0), 100),
+            (y, 20, Vec2(-15, -10)))
+        self.assertIsNone(
+            self.tree.raycast(Vec2(-35, -10), Vec2(1, 0), 10))
+        # Origin inside of the shape
+        self.assertEqual(
+            self.tree.raycast((0, 0), (0, 1), 100), (big, 0, Vec2(0, 0)))
+        obj, dist, point = self.tree.raycast((40, 40), (-1, -1), 100)
+        self.assertIs(obj, x)
+        self.assertAlmostEqual(dist, 50 ** 0.5 * 2 - 5)
+        with self.assertRaises(ValueError):
+            self.tree.raycast((0, 0), (0, 0), 100)
+
+        segment = LineSegment.from_points([Vec2(-10, -30), Vec2(-10, 0)])
+        self.assertEqual(
+            self.tree.segment_query(segment), (y, 15, Vec2(-10, -15)))
+        segment = LineSegment.from_points([Vec2(-10, -30), Vec2(-10, -20)])
+        self.assertIsNone(self.tree.segment_query(segment))
+        segment = LineSegment.from_points([Vec2(30, 0), Vec2(30, 40)])
+        self.assertEqual(
+            self.tree.segment_query(segment), (x, 25, Vec2(30, 25)))
+
+    def test_swept_query(self):
+        x = Circle(Vec2(30, 30), 5)
+        y = Circle(Vec2(-10, -10), 5)
+        z = Circle(Vec2(20, 0), 1)
+        big = BoundingBox([Vec2(-2, -2), Vec2(2, 5)])
+        for shape in (x, y, z, big):
+            self.tree.insert(shape, shape)
+
+        # Moves from left to right along y = 10
+        mc = MovingCircle.from_velocity(
+            Circle(Vec2(-30, 10), 2), Vec2(20, 0), timestamp=0, dt=3)
+        self.assertEqual(self.tree.query(mc), [])
+        # Diagonal sweep covers whole tree with it's bbox, but does not
+        # reach `z`
+        mc = MovingCircle.from_velocity(
+            Circle(Vec2(-30, -30), 1), Vec2(20, 20), timestamp=0, dt=3)
+        self.assertEqual(set(self.tree.query(mc)), {x, y, big})
+        # Stops before reaching `y`
+        mc = MovingCircle.from_velocity(
+            Circle(Vec2(-30, -30), 1), Vec2(10, 10), timestamp=0, dt=1)
+        self.assertEqual(self.tree.query(mc), [])
+
+    def _brute_force_pairs(self, shapes):
+        pairs = set([])
+        for i, shape in enumerate(shapes):
+            for other in shapes[i + 1:]:
+                if intersects(shape, other):
+                    pairs.add(frozenset([shape, other]))
+        return pairs
+
+    def _check_pairs(self, shapes):
+        tree = self.make_tree()
+        for shape in shapes:
+            tree.insert(shape, shape)
+        pairs = list(tree.iter_overlapping_pairs())
+        self.assertEqual(
+            len(pairs), len(set(frozenset(pair) for pair in pairs)))
+        self.assertEqual(
+            set(frozenset(pair) for pair in pairs),
+            self._brute_force_pairs(shapes))
+
+    def test_iter_overlapping_pairs(self):
+        self._check_pairs([
+            # Spans 4 quadrants
+            BoundingBox([Vec2(-2, -2), Vec2(2, 5)]),
+            # Spans same quadrants, overlaps the first one
+            BoundingBox([Vec2(-3, -1), Vec2(3, 3)]),
+            BoundingBox([Vec2(1, 1), Vec2(4, 4)]),
+            Circle(Vec2(25, 25), 3),
+            Circle(Vec2(29, 25), 3),
+            # Covers whole quadrant, so is held by level 1 node
+            BoundingBox([Vec2(-40, -40), Vec2(0, 0)]),
+            # Sticks out of the tree
+            BoundingBox([Vec2(-45, -45), Vec2(-35, -35)]),
+            # Only touches the first one
+            BoundingBox([Vec2(2, -2), Vec2(3, -1)]),
+        ])
+
+    def test_iter_overlapping_pairs_max_edge(self):
+        self._check_pairs([
+            # Cross the max borders of the tree and overlap next to them
+            BoundingBox([Vec2(30, 0), Vec2(50, 5)]),
+            BoundingBox([Vec2(39, 2), Vec2(45, 8)]),
+            BoundingBox([Vec2(0, 35), Vec2(5, 45)]),
+            BoundingBox([Vec2(2, 39.5), Vec2(8, 50)]),
+            BoundingBox([Vec2(38, 38), Vec2(42, 42)]),
+            Circle(Vec2(40, 40), 1),
+        ])
+
+    def test_join(self):
+        bullets = [
+            Circle(Vec2(x, y), 1)
+            for x in range(-35, 40, 7) for y in range(-35, 40, 9)]
+        asteroids = [
+            Circle(Vec2(-20, -20), 8), Circle(Vec2(0, 0), 3),
+            BoundingBox([Vec2(5, -38), Vec2(38, -30)]),
+            BoundingBox([Vec2(-40, 10), Vec2(40, 12)]),
+            Circle(Vec2(30, 30), 15)]
+        expected = {
+            (bullet, asteroid)
+            for bullet in bullets for asteroid in asteroids
+            if intersects(bullet, asteroid)}
+        self.assertTrue(expected)
+
+        bullet_tree = QuadTree.bulk_load(
+            [(bullet, bullet) for bullet in bullets],
+            center=Vec2(0, 0), size=80, max_level=3, **self.tree_options)
+        # Other tree has other bounds and may use any other mode
+        for asteroid_options in TREE_OPTIONS:
+            asteroid_tree = QuadTree(
+                center=Vec2(5, 5), size=100, max_level=4,
+                **asteroid_options)
+            for asteroid in asteroids:
+                asteroid_tree.insert(asteroid, asteroid)
+            pairs = list(bullet_tree.join(asteroid_tree))
+            self.assertEqual(len(pairs), len(expected))
+            self.assertEqual(set(pairs), expected)
+            reverse = set(asteroid_tree.join(bullet_tree))
+            self.assertEqual(
+                reverse, {(a, b) for b, a in expected})
+
+    def _check_counts(self, tree, boxes):
+        queries = [
+            BoundingBox([Vec2(-20, -20), Vec2(20, 20)]),
+            BoundingBox([Vec2(0, 0), Vec2(40, 40)]),
+            BoundingBox([Vec2(-13, -7), Vec2(17, 3)]),
+            BoundingBox([Vec2(-40, -40), Vec2(40, 40)]),
+            BoundingBox([Vec2(-50, -50), Vec2(50, 50)]),
+            BoundingBox([Vec2(25, -40), Vec2(26, 40)])]
+        for query in queries:
+            expected = sum(
+                1 for bbox in boxes if overlap_origin(bbox, query))
+            self.assertEqual(tree.count(query), expected, query)
+
+        # Loose trees count objects in cells of their holders
+        exact_density = "looseness" not in self.tree_options
+        for resolution in (1, 3, 4, 16):
+            grid = tree.density_grid(resolution)
+            self.assertEqual(len(grid), resolution)
+            self.assertEqual(sum(map(sum, grid)), len(boxes))
+            if not exact_density:
+                continue
+            expected = [[0] * resolution for _ in range(resolution)]
+            cell_size = 80 / resolution
+            for bbox in boxes:
+                x, y = bbox.min_point
+                x = min(max(int((x + 40) // cell_size), 0), resolution - 1)
+                y = min(max(int((y + 40) // cell_size), 0), resolution - 1)
+                expected[y][x] += 1
+            self.assertEqual(grid, expected)
+
+    def test_count_and_density(self):
+        boxes = [
+            BoundingBox([Vec2(x, y), Vec2(x + 1 + x % 7, y + 2)])
+            for x in range(-38, 38, 6) for y in range(-37, 37, 5)]
+        boxes += [
+            BoundingBox([Vec2(-30, -25), Vec2(30, 5)]),
+            BoundingBox([Vec2(-45, -45), Vec2(-35, -35)]),
+            # Cross max borders of the tree
+            BoundingBox([Vec2(35, 10), Vec2(45, 12)]),
+            BoundingBox([Vec2(38, 38), Vec2(45, 45)])]
+
+        tree = self.tree
+        for i, bbox in enumerate(boxes):
+            tree.insert(bbox, i)
+        self._check_counts(tree, boxes)
+
+        # Counts follow updates in place, moves and removals
+        moved = list(boxes)
+        moved[0] = BoundingBox([Vec2(-37.5, -37), Vec2(-37, -36)])
+        moved[1] = BoundingBox([Vec2(11, 12), Vec2(14, 13)])
+        for i in (0, 1):
+            tree.update(moved[i], i)
+        for i in (2, len(boxes) - 1):
+            tree.remove(i)
+            moved[i] = None
+        self._check_counts(
+            tree, [bbox for bbox in moved if bbox is not None])
+
+        with self.assertRaises(ValueError):
+            tree.density_grid(0)
+
+    def test_masks(self):
+        bullets, ships = 1, 2
+        bullet = BoundingBox([Vec2(21, 21), Vec2(22, 22)])
+        ship = BoundingBox([Vec2(-22, -22), Vec2(-21, -21)])
+        wall = BoundingBox([Vec2(-30, 20), Vec2(30, 25)])
+        self.tree.insert(bullet, "bullet", mask=bullets)
+        self.tree.insert(ship, "ship", mask=ships)
+        self.tree.insert(wall, "wall")
+
+        everything = BoundingBox.from_center(Vec2(0, 0), 80, 80)
+        self.assertEqual(
+            set(self.tree.query(everything)), {"bullet", "ship", "wall"})
+        self.assertEqual(
+            set(self.tree.query(everything, mask=bullets)),
+            {"bullet", "wall"})
+        self.assertEqual(
+            set(self.tree.query(wall, mask=ships)), {"wall"})
+        self.assertEqual(self.tree.query(bullet, mask=4), ["wall"])
+        self.assertEqual(
+            set(self.tree.query(everything, mask=bullets | ships)),
+            {"bullet", "ship", "wall"})
+        self.assertEqual(
+            self.tree.nearest(Vec2(0, 0), mask=ships), ["wall", "ship"])
+
+        self.tree.remove("wall")
+        self.assertEqual(self.tree.query(everything, mask=4), [])
+
+        self.tree.update(bullet, "bullet", mask=ships)
+        self.assertEqual(self.tree.get_mask("bullet"), ships)
+        self.assertEqual(self.tree.query(everything, mask=bullets), [])
+        # Mask is kept on updates without one
+        self.tree.update(
+            BoundingBox([Vec2(-23, -23), Vec2(-21, -21)]), "ship")
+        self.assertEqual(self.tree.get_mask("ship"), ships)
+        self.assertEqual(self.tree.query(ship, mask=bullets), [])
+
+        with self.assertRaises(ValueError):
+            self.tree.insert(ship, "other", mask=-1)
+
+
+class TestQuadNode(TestCase):
+    """ Layout of `_QuadNode` trees
+    """
+    maxDiff = None
+
+    def setUp(self):
+        super().setUp()
+        self.tree = QuadTree(
+            center=Vec2(0, 0),
+            size=80,  # BBOX (-40, -40) to (40, 40)
+            max_level=3,  # Min BOX 10X10
+            )
+
+    def _get_nodes_data(self, tree):
+        return self._get_node_data(tree._root)
+
+    def _get_node_data(self, node):
+        data = {
+            "level": node._level,
+            # "bbox": [
+            #     tuple(node._bbox.min_point),
+            #     tuple(node._bbox.max_point),
+            # ],
+        }
+        if node._objects:
+            data["objects"] = [
+                obj for _, (_, obj) in node._objects]
+
+        if node.nodes:
+            data['nodes'] = nodes = []
+            for inner_node in node.nodes:
+                nodes.append(self._get_node_data(inner_node))
+        return data
+
     def test_insert_single_quadrant(self):
         # In [(0, 0), (10, 10)] quadrant
         bbox = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
@@ -230,3 +606,363 @@ class TestQuadTree(TestCase):
                 {"level": 1},
             ]
         })
+
+    def test_remove_spanning_object(self):
+        bbox = BoundingBox([Vec2(-2, -2), Vec2(2, 5)])
+        other = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.insert(bbox, bbox)
+        self.tree.insert(other, other)
+        self.assertEqual(len(self.tree._handles[bbox]), 4)
+        self.tree.remove(bbox)
+
+        # Only the branch holding `other` is left
+        data = self._get_nodes_data(self.tree)
+        self.assertEqual(
+            [node.get("nodes") is not None for node in data["nodes"]],
+            [False, True, False, False])
+
+    def test_update_in_place(self):
+        obj = object()
+        bbox = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.insert(bbox, obj)
+        node, = self.tree._handles[obj]
+
+        new_bbox = BoundingBox([Vec2(5, 5), Vec2(9, 9)])
+        self.tree.update(new_bbox, obj)
+        self.assertEqual(node._objects, [(new_bbox, (new_bbox, obj))])
+
+    def test_bulk_load(self):
+        shapes = [
+            BoundingBox([Vec2(1, 1), Vec2(4, 4)]),
+            BoundingBox([Vec2(-3, -3), Vec2(-1, -1)]),
+            BoundingBox([Vec2(31, -39), Vec2(39, -31)]),
+            Circle(Vec2(25, 25), 2),
+            BoundingBox([Vec2(-2, -2), Vec2(2, 5)]),
+            BoundingBox([Vec2(50, 50), Vec2(60, 60)]),
+        ]
+        for shape in shapes:
+            self.tree.insert(shape, shape)
+        tree = QuadTree.bulk_load(
+            [(shape, shape) for shape in reversed(shapes)],
+            center=Vec2(0, 0), size=80, max_level=3)
+
+        # Same nodes as with inserts one by one
+        self.assertEqual(
+            self._get_nodes_data(tree), self._get_nodes_data(self.tree))
+
+    def test_masks(self):
+        bullets, ships = 1, 2
+        self.tree.insert(
+            BoundingBox([Vec2(21, 21), Vec2(22, 22)]), "bullet",
+            mask=bullets)
+        self.tree.insert(
+            BoundingBox([Vec2(-22, -22), Vec2(-21, -21)]), "ship",
+            mask=ships)
+        self.tree.insert(BoundingBox([Vec2(-30, 20), Vec2(30, 25)]), "wall")
+
+        # Each node knows layers of it's subtree
+        root = self.tree._root
+        nw, ne, se, sw = root.nodes
+        self.assertEqual(root._mask, MASK_ALL)
+        self.assertEqual(ne._mask, MASK_ALL)
+        self.assertEqual(sw._mask, ships)
+        self.assertEqual(se._mask, 0)
+
+        self.tree.remove("wall")
+        self.assertEqual(root._mask, bullets | ships)
+        self.assertEqual(ne._mask, bullets)
+
+        self.tree.update(
+            BoundingBox([Vec2(21, 21), Vec2(22, 22)]), "bullet", mask=ships)
+        self.assertEqual(root._mask, ships)
+
+    def _spy_candidates(self):
+        """ Record candidates as `query_iter` takes them from the nodes
+        """
+        pulled = []
+        unique = quadtree._unique
+
+        def spy(entries):
+            for item in unique(entries):
+                pulled.append(item)
+                yield item
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(quadtree, "_unique", spy).start()
+        return pulled
+
+    def test_query_iter_lazy(self):
+        boxes = [
+            BoundingBox([Vec2(i, i), Vec2(i + 1, i + 1)]) for i in range(3)]
+        for box in boxes:
+            self.tree.insert(box, box)
+        pulled = self._spy_candidates()
+
+        found = next(self.tree.query_iter(BoundingBox.from_center(
+            Vec2(0, 0), 80, 80)))
+        self.assertIn(found, boxes)
+        self.assertEqual(len(pulled), 1)
+
+    @skipIf(batch.np is None, "NumPy is not installed")
+    def test_query_iter_batch(self):
+        # First candidates are tested one by one, the rest at once
+        boxes = [
+            BoundingBox([Vec2(i - 36, 1), Vec2(i - 35.5, 2)])
+            for i in range(BATCH_MIN_CANDIDATES * 2)]
+        for box in boxes:
+            self.tree.insert(box, box)
+        pulled = self._spy_candidates()
+
+        query = BoundingBox.from_center(Vec2(0, 0), 80, 80)
+        with mock.patch.object(
+                batch, "intersects_many",
+                wraps=batch.intersects_many) as intersects_many:
+            self.assertEqual(
+                set(self.tree.query_iter(query)), set(boxes))
+        intersects_many.assert_called_once_with(query, mock.ANY)
+        self.assertEqual(len(pulled), len(boxes))
+
+    def test_owns_max_edge(self):
+        # Nodes on the max borders own everything past them
+        on_edge = BoundingBox([Vec2(40, 40), Vec2(45, 45)])
+        tree = QuadTree(center=Vec2(0, 0), size=80, max_level=1)
+        tree.insert(BoundingBox([Vec2(1, 1), Vec2(2, 2)]), "small")
+        self.assertTrue(tree._root._owns(on_edge))
+        nw, ne, se, sw = tree._root.nodes
+        self.assertTrue(ne._owns(on_edge))
+        self.assertFalse(se._owns(on_edge))
+
+
+class TestMaxObjectsQuadTree(TestQuadTree):
+    tree_options = {"max_objects": 2}
+
+    def _objects(self, node):
+        return [obj for _, (_, obj) in node._objects]
+
+    def test_max_objects(self):
+        tree = self.tree
+        a = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        b = BoundingBox([Vec2(-3, -3), Vec2(-1, -1)])
+        c = BoundingBox([Vec2(21, 21), Vec2(24, 24)])
+        d = BoundingBox([Vec2(-2, -2), Vec2(2, 5)])
+        e = BoundingBox([Vec2(5, 5), Vec2(6, 6)])
+
+        def o(node):
+            return set(self._objects(node))
+
+        tree.insert(a, a)
+        tree.insert(b, b)
+        self.assertEqual(tree._root.nodes, ())
+        self.assertEqual(self._objects(tree._root), [a, b])
+
+        # Third object splits the root
+        tree.insert(c, c)
+        nw, ne, se, sw = tree._root.nodes
+        self.assertEqual(o(tree._root), set())
+        self.assertEqual(o(ne), {a, c})
+        self.assertEqual(o(sw), {b})
+        self.assertEqual(tree._handles[a], [ne])
+
+        # Does not fit in any child, so is held by the root
+        tree.insert(d, d)
+        self.assertEqual(o(tree._root), {d})
+        self.assertEqual(tree._handles[d], [tree._root])
+
+        tree.insert(e, e)
+        ne_nw, ne_ne, ne_se, ne_sw = ne.nodes
+        self.assertEqual(o(ne), set())
+        self.assertEqual(o(ne_sw), {a, e})
+        self.assertEqual(o(ne_ne), {c})
+        self.assertEqual(ne_sw._level, 2)
+        self.assertEqual(tree._handles[a], [ne_sw])
+        self.assertEqual(
+            sorted(map(id, tree.query(
+                BoundingBox([Vec2(0, 0), Vec2(10, 10)])))),
+            sorted(map(id, [a, d, e])))
+
+        # Merge back when there are less than 2 objects in the leaves
+        tree.remove(e)
+        self.assertEqual(len(ne.nodes), 4)
+        tree.remove(c)
+        self.assertEqual(ne.nodes, ())
+        self.assertEqual(o(ne), {a})
+        self.assertEqual(tree._handles[a], [ne])
+
+        tree.remove(d)
+        tree.remove(b)
+        self.assertEqual(tree._root.nodes, ())
+        self.assertEqual(self._objects(tree._root), [a])
+        self.assertEqual(tree._handles[a], [tree._root])
+
+    def test_max_objects_bulk_load(self):
+        shapes = [
+            BoundingBox([Vec2(1, 1), Vec2(4, 4)]),
+            BoundingBox([Vec2(5, 5), Vec2(6, 6)]),
+            BoundingBox([Vec2(21, 21), Vec2(24, 24)]),
+            BoundingBox([Vec2(-3, -3), Vec2(-1, -1)]),
+        ]
+        tree = QuadTree.bulk_load(
+            [(shape, shape) for shape in shapes],
+            center=Vec2(0, 0), size=80, max_level=3, max_objects=2)
+        nw, ne, se, sw = tree._root.nodes
+        self.assertEqual(len(sw._objects), 1)
+        ne_nw, ne_ne, ne_se, ne_sw = ne.nodes
+        self.assertEqual(len(ne_sw._objects), 2)
+        self.assertEqual(len(ne_ne._objects), 1)
+        self.assertEqual(tree._handles[shapes[2]], [ne_ne])
+
+
+class TestFlatQuadTree(TestQuadTree):
+    tree_options = {"flat": True}
+
+    def test_insert_single_quadrant(self):
+        bbox = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.insert(bbox, bbox)
+        # Root + 3 levels of 4 child blocks
+        self.assertEqual(self.tree._root.node_count, 13)
+        self.assertEqual(
+            list(self.tree._root.get_all_objects()), [(bbox, (bbox, bbox))])
+
+    def test_remove_nodes(self):
+        bbox = BoundingBox([Vec2(-2, -2), Vec2(2, 5)])
+        self.tree.insert(bbox, bbox)
+        self.tree.remove(bbox)
+        self.assertEqual(self.tree._root.node_count, 1)
+
+    def test_update_nodes(self):
+        obj = object()
+        self.tree.insert(BoundingBox([Vec2(-3, -3), Vec2(-1, -1)]), obj)
+        self.tree.update(BoundingBox([Vec2(1, 1), Vec2(4, 4)]), obj)
+        self.assertEqual(self.tree._root.node_count, 13)
+
+    def test_bulk_load_nodes(self):
+        x = Circle(Vec2(30, 30), 3)
+        y = Circle(Vec2(-10, -10), 10)
+        z = Circle(Vec2(1, 1), 0.5)
+        tree = QuadTree.bulk_load(
+            [(x, x), (y, y), (z, z)],
+            center=Vec2(0, 0), size=80, max_level=3, flat=True)
+
+        for shape in (x, y, z):
+            self.tree.insert(shape, shape)
+        self.assertEqual(tree._root.node_count, 21)
+        self.assertEqual(self.tree._root.node_count, 21)
+
+    def test_node_masks(self):
+        self.tree.insert(
+            BoundingBox([Vec2(21, 21), Vec2(22, 22)]), "bullet", mask=1)
+        self.tree.insert(
+            BoundingBox([Vec2(-22, -22), Vec2(-21, -21)]), "ship", mask=2)
+        node_masks = self.tree._root._mask
+        self.assertEqual(node_masks[0], 3)
+
+        self.tree.remove("bullet")
+        self.assertEqual(node_masks[0], 2)
+
+    def test_owns_max_edge(self):
+        # Nodes on the max borders own everything past them
+        on_edge = BoundingBox([Vec2(40, 40), Vec2(45, 45)])
+        tree = QuadTree(center=Vec2(0, 0), size=80, max_level=1, flat=True)
+        tree.insert(BoundingBox([Vec2(1, 1), Vec2(2, 2)]), "small")
+        first = tree._root._child[0]
+        self.assertTrue(tree._root._owns(first + 1, on_edge))
+        self.assertFalse(tree._root._owns(first + 2, on_edge))
+
+
+class TestOccupancyQuadTree(TestQuadTree):
+    tree_options = {"occupancy": True}
+
+    def test_max_level(self):
+        self.make_tree(max_level=quadtree.MAX_OCCUPANCY_LEVEL)
+        with self.assertRaises(ValueError):
+            self.make_tree(max_level=quadtree.MAX_OCCUPANCY_LEVEL + 1)
+
+    def test_mask(self):
+        grid = self.tree._occupancy
+        # Cells (1, 2) to (2, 3)
+        mask = grid.mask((1, 2, 2, 3))
+        self.assertEqual(
+            mask, sum(1 << code for code in (9, 12, 11, 14)))
+
+    def test_remove_update(self):
+        obj = object()
+        bbox = BoundingBox([Vec2(-3, -3), Vec2(-1, -1)])
+        self.tree.insert(bbox, obj)
+        occupied = self.tree._occupancy._occupied
+
+        new_bbox = BoundingBox([Vec2(-4, -4), Vec2(-2, -2)])
+        self.tree.update(new_bbox, obj)
+        self.assertEqual(self.tree._occupancy._occupied, occupied)
+        self.assertEqual(self.tree.query(new_bbox), [obj])
+
+        new_bbox = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.update(new_bbox, obj)
+        self.assertNotEqual(self.tree._occupancy._occupied, occupied)
+        self.assertEqual(self.tree.query(bbox), [])
+        self.assertEqual(self.tree.query(new_bbox), [obj])
+
+        self.tree.remove(obj)
+        self.assertEqual(self.tree._occupancy._occupied, 0)
+        self.assertEqual(self.tree.query(new_bbox), [])
+
+
+class TestLooseQuadTree(TestQuadTree):
+    tree_options = {"looseness": 2}
+
+    def _holder(self, obj):
+        node, = self.tree._handles[obj]
+        return node
+
+    def test_insert(self):
+        # 10x10 cells with 20x20 loose bounds at max level
+        small = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        # Crosses the center of the tree, but fits loose bounds of a
+        # level 2 node
+        middle = BoundingBox([Vec2(-6, -6), Vec2(6, 8)])
+        big = BoundingBox([Vec2(-30, -30), Vec2(30, 30)])
+        for shape in (small, middle, big):
+            self.tree.insert(shape, shape)
+
+        self.assertEqual(self._holder(small)._level, 3)
+        self.assertEqual(self._holder(middle)._level, 2)
+        self.assertIs(self._holder(big), self.tree._root)
+        self.assertEqual(
+            sum(1 for _ in self.tree._root.get_all_objects()), 3)
+
+    def test_update_remove(self):
+        obj = object()
+        bbox = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.insert(bbox, obj)
+        node = self._holder(obj)
+
+        # Same cell, same size - stays in place
+        self.tree.update(BoundingBox([Vec2(5, 5), Vec2(9, 9)]), obj)
+        self.assertIs(self._holder(obj), node)
+
+        # Center moved into another cell
+        new_bbox = BoundingBox([Vec2(-9, -9), Vec2(-6, -6)])
+        self.tree.update(new_bbox, obj)
+        self.assertIsNot(self._holder(obj), node)
+        self.assertEqual(self.tree.query(bbox), [])
+        self.assertEqual(self.tree.query(new_bbox), [obj])
+
+        self.tree.remove(obj)
+        self.assertEqual(self.tree._root.nodes, ())
+
+    def test_update_outside(self):
+        obj = object()
+        # Outside of the loose bounds of the root, not held by any node
+        self.tree.insert(BoundingBox([Vec2(90, 90), Vec2(95, 95)]), obj)
+        self.assertEqual(self.tree._handles[obj], [])
+
+        bbox = BoundingBox([Vec2(1, 1), Vec2(4, 4)])
+        self.tree.update(bbox, obj)
+        self.assertEqual(self._holder(obj)._level, 3)
+        self.assertEqual(self.tree.query(bbox), [obj])
+
+    def test_count_max_edge(self):
+        # Loose root holds objects, that lie on the max border of the tree
+        self.tree.insert(BoundingBox([Vec2(40, 0), Vec2(45, 5)]), "x")
+        self.tree.insert(BoundingBox([Vec2(0, 40), Vec2(5, 45)]), "y")
+        everything = BoundingBox([Vec2(-50, -50), Vec2(50, 50)])
+        self.assertEqual(self.tree.count(everything), 2)
+        self.assertEqual(self.tree.density_grid(2), [[0, 0], [0, 2]])
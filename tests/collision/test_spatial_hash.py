@@ -0,0 +1,76 @@
+from unittest import TestCase
+from gengine.collision import SpatialHashGrid, Circle, BoundingBox
+from planar import Vec2
+
+
+class TestSpatialHashGrid(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.grid = SpatialHashGrid(cell_size=10)
+
+    def test_query(self):
+        x = Circle(Vec2(30, 30), 10)
+        y = Circle(Vec2(-10, -10), 10)
+        z = Circle(Vec2(0, 0), 10)
+        self.grid.insert(x, x)
+        self.grid.insert(y, y)
+        self.grid.insert(z, z)
+
+        # Helper to ignore results order
+        def o(shapes):
+            return list(sorted(shapes, key=lambda x: x.center.x))
+
+        results = self.grid.query(
+            BoundingBox.from_center(Vec2(30, 30), 22, 22))
+        self.assertEqual(results, [x])
+        results = self.grid.query(
+            BoundingBox.from_center(Vec2(-10, 0), 2, 2))
+        self.assertEqual(o(results), o([y, z]))
+        results = self.grid.query(
+            BoundingBox.from_center(Vec2(-10, -10), 2, 2))
+        self.assertEqual(results, [y])
+        # No bounds for grid
+        results = self.grid.query(
+            BoundingBox.from_center(Vec2(0, 0), 1000, 1000))
+        self.assertEqual(o(results), o([x, y, z]))
+        # Only occupied cells are looked at for huge queries
+        results = self.grid.query(
+            BoundingBox.from_center(Vec2(0, 0), 1e9, 1e9))
+        self.assertEqual(o(results), o([x, y, z]))
+        results = self.grid.query(
+            BoundingBox([Vec2(15, 15), Vec2(1e9, 1e9)]))
+        self.assertEqual(results, [x])
+
+    def test_insert(self):
+        bbox = BoundingBox([Vec2(1, 1), Vec2(14, 4)])
+        self.grid.insert(bbox, bbox)
+        self.assertEqual(self.grid._cells, {
+            (0, 0): {bbox},
+            (1, 0): {bbox},
+        })
+
+    def test_remove(self):
+        bbox = BoundingBox([Vec2(1, 1), Vec2(14, 4)])
+        self.grid.insert(bbox, bbox)
+        self.grid.remove(bbox)
+        self.assertEqual(self.grid._cells, {})
+        self.assertEqual(self.grid.query(bbox), [])
+
+    def test_update(self):
+        obj = object()
+        bbox = BoundingBox([Vec2(1, 1), Vec2(14, 4)])
+        self.grid.insert(bbox, obj)
+        cell = self.grid._cells[1, 0]
+
+        new_bbox = BoundingBox([Vec2(11, 1), Vec2(24, 4)])
+        self.grid.update(new_bbox, obj)
+        self.assertEqual(self.grid._cells, {
+            (1, 0): {obj},
+            (2, 0): {obj},
+        })
+        # Shared cell was not touched
+        self.assertIs(self.grid._cells[1, 0], cell)
+        self.assertEqual(self.grid.query(bbox), [obj])
+        self.assertEqual(
+            self.grid.query(BoundingBox([Vec2(1, 1), Vec2(9, 4)])), [])
@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+from planar import Vec2
+from gengine.collision import Circle, MovingCircle, BoundingBox, Polygon, \
+    CompactCircle, CompactBox, time_of_impact
+
+
+class TestTimeOfImpact(TestCase):
+
+    def moving(self, center, velocity, radius=1, timestamp=0, dt=10):
+        return MovingCircle.from_velocity(
+            Circle(Vec2(*center), radius), Vec2(*velocity), timestamp, dt)
+
+    def test_circle(self):
+        mcircle = self.moving((0, 0), (1, 0))
+        circle = Circle(Vec2(5, 0), 1)
+        self.assertAlmostEqual(time_of_impact(mcircle, circle, 0, 10), 3)
+        self.assertAlmostEqual(time_of_impact(circle, mcircle, 0, 10), 3)
+        self.assertAlmostEqual(time_of_impact(mcircle, circle, 4, 10), 4)
+        self.assertIsNone(time_of_impact(mcircle, circle, 0, 2))
+        self.assertAlmostEqual(
+            time_of_impact(mcircle, CompactCircle((5, 0), 1), 0, 10), 3)
+        # Moving away
+        self.assertIsNone(time_of_impact(
+            self.moving((0, 0), (-1, 0)), circle, 0, 10))
+        # Only touches on the way
+        mcircle = self.moving((0, 2), (1, 0))
+        self.assertIsNone(time_of_impact(mcircle, circle, 0, 10))
+        self.assertAlmostEqual(
+            time_of_impact(mcircle, circle, 0, 10, border=True), 5)
+        # Movement is limited by it's own time window
+        mcircle = self.moving((0, 0), (1, 0), timestamp=1, dt=2)
+        self.assertIsNone(time_of_impact(mcircle, circle, 0, 10))
+
+    def test_moving_circle(self):
+        a = self.moving((0, 0), (1, 0))
+        b = self.moving((10, 0), (-1, 0))
+        self.assertAlmostEqual(time_of_impact(a, b, 0, 10), 4)
+        # Same velocity, never meet
+        b = self.moving((10, 0), (1, 0))
+        self.assertIsNone(time_of_impact(a, b, 0, 10))
+        # Already overlap
+        b = self.moving((1, 0), (1, 0))
+        self.assertEqual(time_of_impact(a, b, 2, 10), 2)
+        # Other circle only starts moving later
+        b = self.moving((10, 0), (-1, 0), timestamp=5)
+        self.assertAlmostEqual(time_of_impact(a, b, 0, 20), 6.5)
+
+    def test_bbox(self):
+        bbox = BoundingBox([Vec2(4, -1), Vec2(6, 1)])
+        mcircle = self.moving((0, 0), (1, 0))
+        self.assertAlmostEqual(time_of_impact(mcircle, bbox, 0, 10), 3)
+        self.assertAlmostEqual(time_of_impact(bbox, mcircle, 0, 10), 3)
+        self.assertAlmostEqual(
+            time_of_impact(mcircle, CompactBox(4, -1, 6, 1), 0, 10), 3)
+        # Hits the corner
+        mcircle = self.moving((0, 1.5), (1, 0))
+        t = time_of_impact(mcircle, bbox, 0, 10)
+        self.assertAlmostEqual(t, 4 - 0.75 ** 0.5)
+        # Slides along the top side
+        mcircle = self.moving((0, 2), (1, 0))
+        self.assertIsNone(time_of_impact(mcircle, bbox, 0, 10))
+        self.assertAlmostEqual(
+            time_of_impact(mcircle, bbox, 0, 10, border=True), 4)
+        # Misses it
+        mcircle = self.moving((0, 3), (1, 0))
+        self.assertIsNone(time_of_impact(mcircle, bbox, 0, 10, border=True))
+
+    def test_polygon(self):
+        triangle = Polygon([Vec2(4, -2), Vec2(4, 2), Vec2(8, 0)])
+        mcircle = self.moving((0, 0), (1, 0))
+        self.assertAlmostEqual(time_of_impact(mcircle, triangle, 0, 10), 3)
+        self.assertAlmostEqual(time_of_impact(triangle, mcircle, 0, 10), 3)
+        # From behind hits the slanted edge
+        mcircle = self.moving((12, 1), (-1, 0))
+        t = time_of_impact(mcircle, triangle, 0, 10)
+        self.assertAlmostEqual(t, 6 - 5 ** 0.5)
+        # Center starts inside
+        mcircle = self.moving((5, 0), (0, 1))
+        self.assertEqual(time_of_impact(mcircle, triangle, 1, 10), 1)
+        # Passes above the top vertex
+        mcircle = self.moving((0, 3), (1, 0))
+        self.assertIsNone(time_of_impact(mcircle, triangle, 0, 10))
+        self.assertAlmostEqual(
+            time_of_impact(mcircle, triangle, 0, 10, border=True), 4)
+
+    def test_not_implemented(self):
+        with self.assertRaises(NotImplementedError):
+            time_of_impact(Circle(Vec2(0, 0), 1), Circle(Vec2(5, 0), 1),
+                           0, 10)
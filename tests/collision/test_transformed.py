@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+from planar import Vec2, Affine
+from gengine.collision import Circle, BoundingBox, Polygon, \
+    TransformedPolygon, QuadTree, intersects, contains
+from gengine.collision.kinetic import translate
+
+
+class TestTransformedPolygon(TestCase):
+
+    def setUp(self):
+        self.square = Polygon([
+            Vec2(-1, -1), Vec2(-1, 1), Vec2(1, 1), Vec2(1, -1)])
+        self.transform = Affine.translation(Vec2(10, 0)) * \
+            Affine.rotation(45)
+
+    def assertVecEqual(self, vec, expected):
+        self.assertAlmostEqual(vec.x, expected[0])
+        self.assertAlmostEqual(vec.y, expected[1])
+
+    def test_world_space(self):
+        shape = TransformedPolygon(self.square, self.transform)
+        polygon = shape.polygon
+        self.assertIs(shape.polygon, polygon)
+        self.assertEqual(len(polygon), 4)
+        bbox = shape.bounding_box
+        half = 2 ** 0.5
+        self.assertVecEqual(bbox.min_point, (10 - half, -half))
+        self.assertVecEqual(bbox.max_point, (10 + half, half))
+        self.assertTrue(shape.contains_point(Vec2(11.2, 0)))
+        self.assertFalse(shape.contains_point(Vec2(11, 1)))
+
+        # Vertices are recomputed only after transform changes
+        shape.transform = Affine.translation(Vec2(0, 5))
+        self.assertIsNot(shape.polygon, polygon)
+        self.assertVecEqual(shape.bounding_box.min_point, (-1, 4))
+        self.assertVecEqual(shape.bounding_box.max_point, (1, 6))
+
+    def test_transformed(self):
+        shape = TransformedPolygon(self.square, Affine.rotation(45))
+        moved = shape.transformed(Affine.translation(Vec2(10, 0)))
+        self.assertIs(moved.local, self.square)
+        self.assertNotIn("polygon", moved.__dict__)
+        self.assertVecEqual(moved.bounding_box.center, (10, 0))
+        moved = translate(moved, Vec2(0, 3))
+        self.assertVecEqual(moved.bounding_box.center, (10, 3))
+
+    def test_intersects(self):
+        shape = TransformedPolygon(self.square, self.transform)
+        # Rotated square reaches further along axes, than the original one
+        self.assertTrue(intersects(shape, Circle(Vec2(12.3, 0), 1)))
+        self.assertFalse(intersects(Circle(Vec2(11.8, 1.8), 1), shape))
+        self.assertTrue(intersects(
+            shape, BoundingBox([Vec2(11.3, -1), Vec2(13, 1)])))
+        self.assertFalse(intersects(
+            BoundingBox([Vec2(11, 1), Vec2(13, 3)]), shape))
+        self.assertTrue(intersects(
+            shape, Polygon([Vec2(8, 0), Vec2(8.7, 1), Vec2(8.7, -1)])))
+        other = TransformedPolygon(
+            self.square, Affine.translation(Vec2(12.3, 0)))
+        self.assertTrue(intersects(shape, other))
+        other.transform = Affine.translation(Vec2(12.3, 1.5))
+        self.assertFalse(intersects(other, shape))
+        self.assertTrue(contains(
+            BoundingBox([Vec2(8, -2), Vec2(12, 2)]), shape))
+
+    def test_quadtree(self):
+        tree = QuadTree(center=Vec2(0, 0), size=80, max_level=3)
+        x = TransformedPolygon(self.square, self.transform)
+        y = TransformedPolygon(
+            self.square, Affine.translation(Vec2(-10, -10)))
+        tree.insert(x, "x")
+        tree.insert(y, "y")
+        self.assertEqual(tree.query(Circle(Vec2(12.3, 0), 1)), ["x"])
+        self.assertEqual(tree.query(Circle(Vec2(11.8, 1.8), 1)), [])
+        self.assertEqual(
+            tree.query(BoundingBox([Vec2(-12, -12), Vec2(-9, -9)])), ["y"])
+        tree.update(x.transformed(Affine.translation(Vec2(0, 20))), "x")
+        self.assertEqual(tree.query(Circle(Vec2(12.3, 0), 1)), [])
+        self.assertEqual(tree.query(Circle(Vec2(12.3, 20), 1)), ["x"])
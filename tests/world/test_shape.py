@@ -0,0 +1,85 @@
+import importlib.util
+import os
+from unittest import TestCase
+from planar import Vec2
+
+import gengine
+from gengine import collision
+
+# `gengine.world` package imports the world module, that uses
+# `asyncio.async`, so the shape module is loaded by it's path
+_spec = importlib.util.spec_from_file_location(
+    "gengine_world_shape",
+    os.path.join(os.path.dirname(gengine.__file__), "world", "shape.py"))
+shape = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(shape)
+
+
+class _Character:
+
+    def __init__(self, character_id, position, velocity=None, timestamp=0):
+        self.character_id = character_id
+        self.position = position
+        self.velocity = velocity
+        self.timestamp = timestamp
+
+
+class TestSimpleObjectIndex(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.index = shape.SimpleObjectIndex()
+
+    def test_nearest_objects(self):
+        near = _Character(1, Vec2(30, 0))
+        middle = _Character(2, Vec2(0, 60))
+        # Moves away from the centre by 10 per second
+        mover = _Character(3, Vec2(-20, 0), Vec2(-10, 0))
+        for character in (near, middle, mover):
+            self.index.update_character(character)
+
+        centre = Vec2(0, 0)
+        self.assertEqual(
+            self.index.get_nearest_objects(centre, 100),
+            [mover, near, middle])
+        # Only capsule centres in `max_radius` are returned
+        self.assertEqual(
+            self.index.get_nearest_objects(centre, 30), [mover, near])
+        self.assertEqual(
+            self.index.get_nearest_objects(centre, 29.9), [mover])
+        self.assertEqual(
+            self.index.get_nearest_objects(centre, 50, timestamp=2),
+            [near, mover])
+        self.assertEqual(
+            self.index.get_nearest_objects(centre, 100, query_mask=0), [])
+
+    def test_nearest_outside_of_index(self):
+        # World has no bounds, unlike the index
+        far = _Character(1, Vec2(40000, 0))
+        near = _Character(2, Vec2(10, 0))
+        self.index.update_character(far)
+        self.index.update_character(near)
+
+        self.assertEqual(
+            self.index.get_nearest_objects(Vec2(0, 0), 50000), [near, far])
+        self.assertEqual(
+            self.index.get_nearest_objects(Vec2(39990, 0), 100), [far])
+
+    def test_all_layers(self):
+        characters = [_Character(i, Vec2(i * 10, 0)) for i in range(5)]
+        for character in characters:
+            self.index.update_character(character)
+
+        # World mask of all layers is all layers of the index
+        self.assertEqual(self.index._index._tree._masks, {})
+        self.assertEqual(
+            self.index._index._tree.get_mask(characters[0]),
+            collision.MASK_ALL)
+        self.assertEqual(
+            self.index.get_nearest_objects(Vec2(0, 0), 100), characters)
+        self.assertEqual(
+            self.index.get_nearest_objects(
+                Vec2(0, 0), 100, query_mask=shape.MASK_ALL), characters)
+        self.assertEqual(
+            self.index.get_nearest_objects(Vec2(0, 0), 15, query_mask=1),
+            characters[:2])